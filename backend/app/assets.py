@@ -0,0 +1,162 @@
+"""Serving /static (stylesheets, favicon and local uploads) with caching headers.
+
+- `static_url("css/style.css")` (a template global) appends a content fingerprint
+  (`?v=<hash>`). A request carrying the current fingerprint is cached for a year as
+  immutable. Uploads are content-addressed (see uploads.py), so they always are.
+  Anything else is sent with `no-cache` and revalidated by ETag.
+- ETags are strong. An upload's name never gets reused for other bytes, so its
+  ETag is the name itself. Other files are hashed once per version. A matching
+  If-None-Match gets a 304.
+- Text assets are sent gzip- or brotli-compressed (brotli when the optional `brotli`
+  package is installed). Each encoding is computed once per file version and kept
+  in memory.
+- Single `Range: bytes=...` requests get a 206 with just that slice, so large
+  images can be resumed or fetched partially.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+import anyio
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+COMPRESSIBLE = {".css", ".js", ".svg", ".html", ".txt", ".json"}
+CHUNK_SIZE = 64 * 1024
+
+_UPLOAD_NAME = re.compile(r"^uploads/(?:[0-9a-f]{2}/[0-9a-f]{2}/)?[0-9a-f]{32,64}(?:_\w+)?\.\w+$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+_digests: dict[str, tuple[int, int, str]] = {}
+_encoded: dict[tuple[str, str], tuple[int, int, bytes]] = {}
+
+
+def _digest(full_path: str, stat_result: os.stat_result) -> str:
+    cached = _digests.get(full_path)
+    if cached and cached[:2] == (stat_result.st_mtime_ns, stat_result.st_size):
+        return cached[2]
+    with open(full_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    _digests[full_path] = (stat_result.st_mtime_ns, stat_result.st_size, digest)
+    return digest
+
+
+def static_url(path: str) -> str:
+    full_path = os.path.join(STATIC_DIR, path)
+    try:
+        digest = _digest(full_path, os.stat(full_path))
+    except FileNotFoundError:
+        return f"/static/{path}"
+    return f"/static/{path}?v={digest[:12]}"
+
+
+def _encode(full_path: str, stat_result: os.stat_result, encoding: str) -> bytes:
+    cached = _encoded.get((full_path, encoding))
+    if cached and cached[:2] == (stat_result.st_mtime_ns, stat_result.st_size):
+        return cached[2]
+    with open(full_path, "rb") as f:
+        raw = f.read()
+    body = brotli.compress(raw, quality=11) if encoding == "br" else gzip.compress(raw, compresslevel=9, mtime=0)
+    _encoded[(full_path, encoding)] = (stat_result.st_mtime_ns, stat_result.st_size, body)
+    return body
+
+
+def _pick_encoding(accept_encoding: str) -> str | None:
+    offered = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+    if brotli is not None and "br" in offered:
+        return "br"
+    if "gzip" in offered:
+        return "gzip"
+    return None
+
+
+def _byte_range(value: str, size: int) -> tuple[int, int] | None:
+    """(first, last) for a single satisfiable range; None if it isn't one. Raises ValueError if unsatisfiable."""
+    m = _RANGE.match(value.strip())
+    if not m or m.group(1) == m.group(2) == "":
+        return None
+    if m.group(1) == "":
+        first, last = max(size - int(m.group(2)), 0), size - 1
+    else:
+        first, last = int(m.group(1)), min(int(m.group(2) or size - 1), size - 1)
+    if first > last or first >= size:
+        raise ValueError("unsatisfiable range")
+    return first, last
+
+
+def _media_type(path: str) -> str:
+    return mimetypes.guess_type(path)[0] or "text/plain"
+
+
+class FileRangeResponse(Response):
+    def __init__(self, path: str, first: int, last: int, size: int, headers: dict):
+        headers = {**headers, "content-range": f"bytes {first}-{last}/{size}", "content-length": str(last - first + 1)}
+        super().__init__(status_code=206, headers=headers, media_type=_media_type(path))
+        self.path, self.first, self.last = path, first, last
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        remaining = self.last - self.first + 1
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(self.first)
+            while remaining:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0 and bool(chunk)})
+                if not chunk:
+                    break
+
+
+class AssetFiles(StaticFiles):
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        rel_path = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+        if _UPLOAD_NAME.match(rel_path):
+            etag_base = os.path.splitext(os.path.basename(rel_path))[0]
+            cache_control = IMMUTABLE
+        else:
+            etag_base = _digest(full_path, stat_result)
+            version = QueryParams(scope.get("query_string", b"")).get("v")
+            cache_control = IMMUTABLE if version and etag_base.startswith(version) else REVALIDATE
+        headers = {"cache-control": cache_control, "accept-ranges": "bytes"}
+
+        encoding = None
+        if os.path.splitext(full_path)[1] in COMPRESSIBLE:
+            headers["vary"] = "Accept-Encoding"
+            encoding = _pick_encoding(request_headers.get("accept-encoding", ""))
+        headers["etag"] = f'"{etag_base}-{encoding}"' if encoding else f'"{etag_base}"'
+
+        if self.is_not_modified(headers, request_headers):
+            return NotModifiedResponse(headers)
+
+        if encoding:
+            headers["content-encoding"] = encoding
+            body = _encode(full_path, stat_result, encoding)
+            return Response(body, status_code=status_code, headers=headers, media_type=_media_type(full_path))
+
+        range_header = request_headers.get("range")
+        if range_header and request_headers.get("if-range", headers["etag"]) == headers["etag"]:
+            try:
+                byte_range = _byte_range(range_header, stat_result.st_size)
+            except ValueError:
+                return Response(status_code=416, headers={**headers, "content-range": f"bytes */{stat_result.st_size}"})
+            if byte_range:
+                return FileRangeResponse(str(full_path), *byte_range, stat_result.st_size, headers)
+
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        response.headers.update(headers)
+        return response
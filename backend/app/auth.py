@@ -8,7 +8,14 @@ from .config import settings
 
 # Argon2id is a modern password hashing algorithm.
 # It avoids bcrypt's 72-byte limit and common Windows bcrypt backend issues.
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# Hashes made with other cost settings still verify, and are flagged by needs_update.
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__rounds=settings.argon2_time_cost,
+    argon2__memory_cost=settings.argon2_memory_cost,
+    argon2__parallelism=settings.argon2_parallelism,
+)
 
 ALGORITHM = "HS256"
 
@@ -18,6 +25,10 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     return pwd_context.verify(password, hashed)
 
+def verify_and_update(password: str, hashed: str) -> tuple[bool, str | None]:
+    """(valid, new hash if the stored one uses outdated parameters)."""
+    return pwd_context.verify_and_update(password, hashed)
+
 def create_access_token(subject: str, expires_minutes: int | None = None) -> str:
     exp_minutes = expires_minutes or settings.access_token_expire_minutes
     expire = datetime.now(timezone.utc) + timedelta(minutes=exp_minutes)
@@ -36,3 +47,8 @@ def decode_access_token(token: str) -> str:
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token",
         )
+
+def token_expiry(token: str) -> float | None:
+    """`exp` of an already verified token, as unix time."""
+    exp = jwt.get_unverified_claims(token).get("exp")
+    return float(exp) if exp is not None else None
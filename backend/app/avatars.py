@@ -0,0 +1,46 @@
+"""Identicon avatars, generated locally.
+
+Each username hashes to a colour and a 5x5 left-right mirrored pattern, drawn as a small
+SVG. The output only depends on the username, so it is served as immutable and the most
+recent ones are kept in memory. Rendering one takes microseconds, so nothing is written
+to disk: the endpoint needs no login, and every name asked for would otherwise leave a file.
+"""
+import hashlib
+from functools import lru_cache
+from urllib.parse import quote
+
+GRID = 5
+# longer names are refused, so the cache below stays small
+MAX_NAME = 255
+
+
+def url(username: str) -> str:
+    return f"/avatars/{quote(username, safe='')}.svg"
+
+
+def render(username: str) -> bytes:
+    digest = hashlib.sha256(username.encode()).digest()
+    hue = int.from_bytes(digest[:2], "big") % 360
+    fg = f"hsl({hue},{55 + digest[2] % 20}%,{45 + digest[3] % 15}%)"
+    bg = f"hsl({hue},30%,92%)"
+    bits = int.from_bytes(digest[4:], "big")
+    cells = []
+    half = (GRID + 1) // 2
+    for row in range(GRID):
+        for col in range(half):
+            if bits >> (row * half + col) & 1:
+                cells.append((col, row))
+                if col != GRID - 1 - col:
+                    cells.append((GRID - 1 - col, row))
+    rects = "".join(f'<rect x="{x + 1}" y="{y + 1}" width="1" height="1"/>' for x, y in sorted(cells))
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {GRID + 2} {GRID + 2}" shape-rendering="crispEdges">'
+        f'<rect width="{GRID + 2}" height="{GRID + 2}" fill="{bg}"/><g fill="{fg}">{rects}</g></svg>'
+    ).encode()
+
+
+@lru_cache(maxsize=4096)
+def get(username: str) -> tuple[bytes, str]:
+    """(svg, etag) for a username."""
+    body = render(username)
+    return body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
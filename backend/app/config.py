@@ -4,9 +4,97 @@ class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
     app_name: str = "InstaLite"
+    # adds Server-Timing headers (app/db time, query count) to every response
+    debug: bool = False
     secret_key: str = "CHANGE_ME"
     access_token_expire_minutes: int = 120
     database_url: str = "sqlite:///./app.db"
     frontend_origin: str = "http://localhost:5173"
 
+    # where uploads are stored: "local" (app/static/uploads) or "s3" (needs boto3)
+    upload_backend: str = "local"
+    s3_bucket: str = ""
+    s3_prefix: str = "uploads/"
+    s3_endpoint_url: str | None = None  # for S3-compatible servers (MinIO, ...)
+    s3_region: str | None = None
+    s3_public_url: str = ""  # base URL objects are served from; default endpoint/bucket
+    # largest accepted post image
+    max_upload_bytes: int = 10 * 1024 * 1024
+    # processes re-encoding uploads into resized WebP variants (needs Pillow; 0 = off)
+    image_workers: int = 1
+
+    # connection pool (per engine: primary and each replica)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_recycle: int = 1800  # seconds; -1 disables
+    db_pool_pre_ping: bool = True
+    # GET/HEAD requests read from these (round-robin); empty = everything on database_url
+    read_replica_urls: list[str] = []
+    # after a client writes, its reads stay on the primary this long (read-your-writes)
+    db_sticky_seconds: float = 5.0
+
+    # route handlers use an AsyncSession (aiosqlite / asyncpg) instead of sync sessions on the threadpool
+    db_async: bool = False
+
+    # SQLite tuning, applied to every new connection (ignored for other databases)
+    sqlite_tuned: bool = True
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_cache_size: int = -65536  # negative = KiB, i.e. 64 MiB page cache
+    sqlite_mmap_size: int = 268435456
+    sqlite_busy_timeout_ms: int = 5000
+    # serialize likes/follows through one writer thread that group-commits them
+    sqlite_write_queue: bool = False
+    sqlite_write_batch: int = 128
+    sqlite_write_window_ms: float = 2.0
+
+    # Argon2 cost; changing these rehashes each password on its next successful login
+    argon2_time_cost: int = 3
+    argon2_memory_cost: int = 65536  # KiB
+    argon2_parallelism: int = 4
+    # hashing runs in this many worker processes (0 = on the threadpool, in-process);
+    # past hash_max_pending queued/running hashes, login and register answer 429
+    hash_workers: int = 2
+    hash_max_pending: int = 32
+
+    # access token -> (id, username, is_admin) snapshots kept per process; ttl 0 disables
+    user_cache_size: int = 10_000
+    user_cache_ttl_seconds: float = 60.0
+
+    # rendered HTML fragments (post cards, anonymous landing page); url = redis://... to share
+    fragment_cache_size: int = 2048
+    fragment_cache_url: str = ""
+    landing_cache_seconds: float = 10.0
+
+    # micro-cache for public read APIs (seconds, 0 = off); responses also carry ETags
+    users_cache_seconds: float = 5.0
+    comments_cache_seconds: float = 2.0
+
+    # live feed (/ws/feed): events a slow connection may fall behind before it is told to
+    # resync; url = redis://... to fan events out across workers (required with several
+    # workers, which otherwise miss each other's follows in graph.py)
+    feed_max_pending: int = 100
+    event_bus_url: str = ""
+
+    # ranked feed / explore: how often changed posts are rescored (0 = only via
+    # `python -m app.ranking`), how many recent timeline posts a ranked page picks from,
+    # and how far back rescoring looks
+    ranking_refresh_seconds: float = 15.0
+    ranking_candidates: int = 300
+    ranking_window_days: int = 7
+
+    # per-route latency / SQL metrics on /metrics (Prometheus text format); statements
+    # slower than slow_query_ms are logged (0 = never)
+    metrics_enabled: bool = True
+    slow_query_ms: float = 200.0
+    # /metrics is only served to localhost (without proxy headers) unless this is set;
+    # then it needs "Authorization: Bearer <metrics_token>" instead. Set it behind a
+    # reverse proxy on the same host.
+    metrics_token: str = ""
+
+    # home timeline: authors with more followers than this are merged in at read time
+    timeline_fanout_max_followers: int = 10_000
+    # how many of an author's recent posts are copied into a timeline on follow
+    timeline_backfill: int = 200
+
 settings = Settings()
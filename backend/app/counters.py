@@ -0,0 +1,42 @@
+"""Recompute the denormalized counters from the source tables.
+
+Usage (from backend/):
+    python -m app.counters
+"""
+from sqlalchemy import delete, func, insert, select, union_all, update
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal
+from .models import Post, User, Like, Comment, Follow, Blob, Affinity
+
+
+def recount(db: Session) -> None:
+    db.execute(
+        update(Post).values(
+            likes_count=select(func.count()).where(Like.post_id == Post.id).scalar_subquery(),
+            comments_count=select(func.count()).where(Comment.post_id == Post.id).scalar_subquery(),
+        )
+    )
+    db.execute(
+        update(User).values(
+            followers_count=select(func.count()).where(Follow.following_id == User.id).scalar_subquery(),
+            following_count=select(func.count()).where(Follow.follower_id == User.id).scalar_subquery(),
+        )
+    )
+    db.execute(update(Blob).values(refcount=select(func.count()).where(Post.image_path == Blob.key).scalar_subquery()))
+    given = union_all(
+        select(Like.user_id.label("user_id"), Post.author_id.label("author_id")).join(Post, Post.id == Like.post_id),
+        select(Comment.author_id, Post.author_id).join(Post, Post.id == Comment.post_id),
+    ).subquery()
+    db.execute(delete(Affinity))
+    db.execute(insert(Affinity).from_select(
+        ["user_id", "author_id", "score"],
+        select(given.c.user_id, given.c.author_id, func.count()).group_by(given.c.user_id, given.c.author_id),
+    ))
+    db.commit()
+
+
+if __name__ == "__main__":
+    with SessionLocal() as db:
+        recount(db)
+    print("counters recomputed")
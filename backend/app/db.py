@@ -1,13 +1,70 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+import asyncio
+import itertools
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import sessionmaker, DeclarativeBase, Session
 from .config import settings
+from . import metrics
+
+is_sqlite = settings.database_url.startswith("sqlite")
+
+def _connect_args(url: str) -> dict:
+    return {"check_same_thread": False} if url.startswith("sqlite") else {}
+
+connect_args = _connect_args(settings.database_url)
+
+def _pool_args(url: str) -> dict:
+    args = {"pool_pre_ping": settings.db_pool_pre_ping, "pool_recycle": settings.db_pool_recycle}
+    if url.rstrip("/").endswith((":memory:", "sqlite:")):
+        return args  # in-memory SQLite uses a per-thread singleton pool
+    args.update(pool_size=settings.db_pool_size, max_overflow=settings.db_max_overflow)
+    return args
+
+def _sqlite_pragmas(dbapi_conn, _record) -> None:
+    cur = dbapi_conn.cursor()
+    cur.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+    cur.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+    cur.execute(f"PRAGMA cache_size={int(settings.sqlite_cache_size)}")
+    cur.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+    cur.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+    cur.close()
+
+def tune(sync_engine) -> None:
+    if sync_engine.dialect.name == "sqlite" and settings.sqlite_tuned:
+        event.listen(sync_engine, "connect", _sqlite_pragmas)
 
-connect_args = {}
-if settings.database_url.startswith("sqlite"):
-    connect_args = {"check_same_thread": False}
+# the start time lives on the statement's execution context, so a statement that fails
+# (no after_cursor_execute) leaves nothing behind
+def _before_execute(_conn, _cursor, _statement, _params, context, _executemany) -> None:
+    context._metrics_started = time.perf_counter()
 
-engine = create_engine(settings.database_url, connect_args=connect_args, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def _after_execute(_conn, _cursor, statement, _params, context, _executemany) -> None:
+    metrics.registry.record_sql(time.perf_counter() - context._metrics_started, statement)
+
+def instrument(sync_engine) -> None:
+    """Count and time every statement for the request running it (see metrics.py)."""
+    if settings.metrics_enabled:
+        event.listen(sync_engine, "before_cursor_execute", _before_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_execute)
+
+def _make_engine(url: str):
+    eng = create_engine(url, connect_args=_connect_args(url), **_pool_args(url))
+    tune(eng)
+    instrument(eng)
+    return eng
+
+engine = _make_engine(settings.database_url)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
+ReplicaSessions = [
+    sessionmaker(autoflush=False, bind=_make_engine(url), expire_on_commit=False)
+    for url in settings.read_replica_urls
+]
 
 class Base(DeclarativeBase):
     pass
@@ -18,3 +75,165 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg"}
+
+def async_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    return f"{_ASYNC_DRIVERS.get(scheme.split('+', 1)[0], scheme)}://{rest}"
+
+async_engine = None
+AsyncSessionLocal = None
+AsyncReplicaSessions = []
+if settings.db_async:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    def _make_async_sessions(url: str):
+        pool_args = _pool_args(url)
+        if url.startswith("sqlite") and "pool_size" in pool_args:
+            pool_args["poolclass"] = AsyncAdaptedQueuePool  # aiosqlite would default to NullPool
+        eng = create_async_engine(async_url(url), **pool_args)
+        tune(eng.sync_engine)
+        instrument(eng.sync_engine)
+        return async_sessionmaker(eng, autoflush=False, expire_on_commit=False)
+
+    AsyncSessionLocal = _make_async_sessions(settings.database_url)
+    async_engine = AsyncSessionLocal.kw["bind"]
+    AsyncReplicaSessions = [_make_async_sessions(url) for url in settings.read_replica_urls]
+
+
+async def shutdown() -> None:
+    """Close pooled async connections; aiosqlite keeps a (non-daemon) thread per connection."""
+    for factory in filter(None, [AsyncSessionLocal, *AsyncReplicaSessions]):
+        await factory.kw["bind"].dispose()
+
+
+# A request's sync session keeps its pooled connection while the request waits in the
+# event loop for a threadpool thread. If threads were allowed to block in pool checkout,
+# enough concurrent requests would leave every thread waiting for a connection held by a
+# request that is waiting for a thread, and nothing would move until pool_timeout. So a
+# session first takes one of the pool's slots, waiting in the event loop. It does so on
+# first use, not on open, because a request may open a second short-lived session (the
+# user lookup in deps.py) before it touches its own.
+_pool_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+
+def _slots_for(factory) -> asyncio.Semaphore | None:
+    if not isinstance(factory.kw["bind"].pool, QueuePool) or settings.db_max_overflow < 0:
+        return None  # in-memory SQLite, or no limit on connections
+    by_factory = _pool_slots.setdefault(asyncio.get_running_loop(), {})
+    if factory not in by_factory:
+        by_factory[factory] = asyncio.Semaphore(settings.db_pool_size + settings.db_max_overflow)
+    return by_factory[factory]
+
+
+class ThreadpoolSession:
+    """Sync `Session` behind the awaitable subset of the `AsyncSession` API the routers use.
+
+    Lets handlers be written once as `async def` while `settings.db_async` is off:
+    each call runs on the threadpool, as the old sync handlers did.
+    """
+
+    def __init__(self, session: Session, slots: asyncio.Semaphore | None = None):
+        self.sync_session = session
+        self._slots = slots
+        self._holding_slot = False
+
+    async def _call(self, fn, *args, **kwargs):
+        if self._slots is not None and not self._holding_slot:
+            await self._slots.acquire()
+            self._holding_slot = True
+        return await run_in_threadpool(fn, *args, **kwargs)
+
+    def add(self, instance) -> None:
+        self.sync_session.add(instance)
+
+    async def get(self, *args, **kwargs):
+        return await self._call(self.sync_session.get, *args, **kwargs)
+
+    async def execute(self, *args, **kwargs):
+        return await self._call(self.sync_session.execute, *args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        return await self._call(self.sync_session.scalar, *args, **kwargs)
+
+    async def scalars(self, *args, **kwargs):
+        return await self._call(self.sync_session.scalars, *args, **kwargs)
+
+    async def delete(self, instance) -> None:
+        await self._call(self.sync_session.delete, instance)
+
+    async def flush(self) -> None:
+        await self._call(self.sync_session.flush)
+
+    def _release_slot(self) -> None:
+        if self._holding_slot:
+            self._holding_slot = False
+            self._slots.release()
+
+    # ending the transaction hands the connection back to the pool, so the slot goes too
+    async def commit(self) -> None:
+        await self._call(self.sync_session.commit)
+        self._release_slot()
+
+    async def rollback(self) -> None:
+        await self._call(self.sync_session.rollback)
+        self._release_slot()
+
+    async def refresh(self, instance, *args, **kwargs) -> None:
+        await self._call(self.sync_session.refresh, instance, *args, **kwargs)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await self._call(fn, self.sync_session, *args, **kwargs)
+
+    async def close(self) -> None:
+        try:
+            await run_in_threadpool(self.sync_session.close)
+        finally:
+            self._release_slot()
+
+
+STICKY_COOKIE = "db_primary_until"
+_SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+_replica_turn = itertools.count()
+
+def _use_replica(request: Request) -> bool:
+    # websocket handshakes have no method in their scope, but they are GETs
+    if not settings.read_replica_urls or request.scope.get("method", "GET") not in _SAFE_METHODS:
+        return False
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) < time.time()
+    except ValueError:
+        return True
+
+@asynccontextmanager
+async def open_session(request: Request):
+    """Session for the current request: a read replica for safe methods, the primary otherwise."""
+    replica = _use_replica(request)
+    if AsyncSessionLocal is not None:
+        factory = AsyncReplicaSessions[next(_replica_turn) % len(AsyncReplicaSessions)] if replica else AsyncSessionLocal
+        async with factory() as db:
+            yield db
+        return
+    factory = ReplicaSessions[next(_replica_turn) % len(ReplicaSessions)] if replica else SessionLocal
+    db = ThreadpoolSession(factory(), _slots_for(factory))
+    try:
+        yield db
+    finally:
+        await db.close()
+
+async def get_async_db(request: Request):
+    async with open_session(request) as db:
+        yield db
+
+async def stick_to_primary(request: Request, call_next):
+    """HTTP middleware: after a write, pin this client's reads to the primary for a few seconds."""
+    response = await call_next(request)
+    if request.method not in _SAFE_METHODS:
+        until = time.time() + settings.db_sticky_seconds
+        response.set_cookie(
+            STICKY_COOKIE, f"{until:.3f}", max_age=int(settings.db_sticky_seconds) + 1, httponly=True, samesite="lax"
+        )
+    return response
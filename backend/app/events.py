@@ -0,0 +1,196 @@
+"""Live feed updates: an in-process pub/sub bus behind the /ws/feed socket.
+
+`interactions.apply` publishes these after each committed write (batch writes send one
+per post or user changed):
+    {"type": "post", "post_id", "author_id"}                     new post
+    {"type": "post_deleted", "post_id", "author_id"}
+    {"type": "counts", "post_id", "author_id", "likes_count", "comments_count"}
+    {"type": "follow", "follower_id", "following_id", "following": bool}
+Post events go to the author and everyone following them. Follow events go to both
+users.
+
+Each connection is a `Subscription` with a bounded set of pending events. Count
+updates for the same post coalesce, so a burst of likes costs a slow client one
+message. If a client falls `settings.feed_max_pending` events behind, its backlog is
+dropped and it gets a single {"type": "resync"} telling it to reload.
+
+Each worker keeps its own subscribers. With several workers, set
+`settings.event_bus_url` (needs the `redis` package): events are published to Redis,
+and every worker dispatches what it receives to its local connections and in-process
+listeners. Workers listen from startup, whether or not any socket is connected.
+"""
+import asyncio
+import itertools
+import json
+import logging
+from collections import OrderedDict, defaultdict
+
+from .config import settings
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "instalite:feed"
+
+_seq = itertools.count()
+
+
+def _coalesce_key(event: dict):
+    if event["type"] == "counts":
+        return ("counts", event["post_id"])
+    return next(_seq)
+
+
+class Subscription:
+    def __init__(self, user_id: int, following, max_pending: int):
+        self.user_id = user_id
+        self.following = set(following)
+        self.max_pending = max_pending
+        self.overflowed = False
+        self._pending: OrderedDict = OrderedDict()
+        self._ready = asyncio.Event()
+
+    def push(self, event: dict) -> None:
+        key = _coalesce_key(event)
+        if key in self._pending:
+            self._pending[key] = event
+        elif len(self._pending) >= self.max_pending:
+            self._pending.clear()
+            self.overflowed = True
+        else:
+            self._pending[key] = event
+        self._ready.set()
+
+    async def next(self) -> list[dict]:
+        """Wait for and take everything pending, oldest first."""
+        await self._ready.wait()
+        self._ready.clear()
+        if self.overflowed:
+            self.overflowed = False
+            self._pending.clear()
+            return [{"type": "resync"}]
+        events = list(self._pending.values())
+        self._pending.clear()
+        return events
+
+
+class LocalBus:
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self._by_user: dict[int, set[Subscription]] = defaultdict(set)
+        self._by_author: dict[int, set[Subscription]] = defaultdict(set)
+        self.published = 0
+        self.delivered = 0
+        # in-process consumers of every event (e.g. graph.FollowGraph.on_event)
+        self.listeners: list = []
+
+    def subscribe(self, user_id: int, following) -> Subscription:
+        sub = Subscription(user_id, following, self.max_pending)
+        self._by_user[user_id].add(sub)
+        for author_id in sub.following:
+            self._by_author[author_id].add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        self._discard(self._by_user, sub.user_id, sub)
+        for author_id in sub.following:
+            self._discard(self._by_author, author_id, sub)
+
+    @staticmethod
+    def _discard(index: dict, key: int, sub: Subscription) -> None:
+        subs = index.get(key)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del index[key]
+
+    def publish(self, event: dict) -> None:
+        self.published += 1
+        self.dispatch(event)
+
+    def dispatch(self, event: dict) -> None:
+        for listener in self.listeners:
+            listener(event)
+        if event["type"] == "follow":
+            follower, author = event["follower_id"], event["following_id"]
+            for sub in self._by_user.get(follower, ()):
+                if event["following"]:
+                    sub.following.add(author)
+                    self._by_author[author].add(sub)
+                else:
+                    sub.following.discard(author)
+                    self._discard(self._by_author, author, sub)
+            targets = self._by_user.get(follower, set()) | self._by_user.get(author, set())
+        else:
+            author = event["author_id"]
+            targets = self._by_user.get(author, set()) | self._by_author.get(author, set())
+        for sub in targets:
+            sub.push(event)
+        self.delivered += len(targets)
+
+    def stats(self) -> dict:
+        return {
+            "connections": sum(len(subs) for subs in self._by_user.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+        }
+
+
+class RedisBus(LocalBus):
+    """Fans events out through Redis pub/sub so every worker sees every write."""
+
+    def __init__(self, url: str, max_pending: int):
+        import redis.asyncio as redis  # optional dependency, only needed with several workers
+
+        super().__init__(max_pending)
+        self.client = redis.Redis.from_url(url)
+        self._listener: asyncio.Task | None = None
+
+    def _ensure_listening(self) -> None:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                pubsub = self.client.pubsub()
+                await pubsub.subscribe(CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.dispatch(json.loads(message["data"]))
+            except Exception:
+                log.exception("feed event listener failed, reconnecting")
+            await asyncio.sleep(1)
+
+    def subscribe(self, user_id: int, following) -> Subscription:
+        self._ensure_listening()
+        return super().subscribe(user_id, following)
+
+    def publish(self, event: dict) -> None:
+        self.published += 1
+        task = asyncio.get_running_loop().create_task(self.client.publish(CHANNEL, json.dumps(event)))
+        task.add_done_callback(_log_failure)
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+        await self.client.aclose()
+
+
+def _log_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        log.error("could not publish feed event", exc_info=task.exception())
+
+
+bus = RedisBus(settings.event_bus_url, settings.feed_max_pending) if settings.event_bus_url else LocalBus(
+    settings.feed_max_pending
+)
+
+
+async def start() -> None:
+    if isinstance(bus, RedisBus):
+        bus._ensure_listening()
+
+
+async def shutdown() -> None:
+    if isinstance(bus, RedisBus):
+        await bus.close()
@@ -0,0 +1,115 @@
+"""Cache for rendered HTML fragments.
+
+Pages cache pieces of HTML that are the same for every viewer: a post card, keyed by
+post id and `Post.version` (bumped by every write that changes the card, so stale
+cards are never looked up again), and the whole landing page for anonymous visitors,
+kept for `settings.landing_cache_seconds` and dropped when a post is published or
+deleted.
+
+Fragments live in a per-process LRU of `settings.fragment_cache_size` entries, or in
+Redis when `settings.fragment_cache_url` is set (needs the `redis` package). Redis
+lets several workers share one cache.
+"""
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from .config import settings
+
+LANDING = "landing"
+
+
+class MemoryStore:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[str, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: str, ttl: float | None = None) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl if ttl else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisStore:
+    def __init__(self, url: str, prefix: str = "frag:"):
+        import redis  # optional dependency, only needed for a shared cache
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key: str) -> str | None:
+        value = self.client.get(self.prefix + key)
+        return value.decode() if value is not None else None
+
+    def set(self, key: str, value: str, ttl: float | None = None) -> None:
+        self.client.set(self.prefix + key, value, px=int(ttl * 1000) if ttl else None)
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+    def size(self) -> int | None:
+        return None
+
+
+class FragmentCache:
+    def __init__(self, store):
+        self.store = store
+        self._stats = defaultdict(lambda: {"hits": 0, "misses": 0, "render_seconds": 0.0})
+
+    def get(self, kind: str, key: str) -> str | None:
+        html = self.store.get(f"{kind}:{key}")
+        self._stats[kind]["hits" if html is not None else "misses"] += 1
+        return html
+
+    def put(self, kind: str, key: str, html: str, ttl: float | None = None, render_seconds: float = 0.0) -> None:
+        self._stats[kind]["render_seconds"] += render_seconds
+        self.store.set(f"{kind}:{key}", html, ttl)
+
+    def get_or_render(self, kind: str, key: str, render, ttl: float | None = None) -> str:
+        html = self.get(kind, key)
+        if html is None:
+            started = time.perf_counter()
+            html = render()
+            self.put(kind, key, html, ttl, time.perf_counter() - started)
+        return html
+
+    def invalidate(self, kind: str, key: str = "") -> None:
+        self.store.delete(f"{kind}:{key}")
+
+    def stats(self) -> dict:
+        out = {"size": self.store.size()}
+        for kind, s in self._stats.items():
+            lookups = s["hits"] + s["misses"]
+            out[kind] = {
+                **s,
+                "render_seconds": round(s["render_seconds"], 4),
+                "hit_ratio": round(s["hits"] / lookups, 4) if lookups else 0.0,
+                "avg_render_ms": round(s["render_seconds"] * 1000 / s["misses"], 3) if s["misses"] else 0.0,
+            }
+        return out
+
+
+cache = FragmentCache(
+    RedisStore(settings.fragment_cache_url) if settings.fragment_cache_url else MemoryStore(settings.fragment_cache_size)
+)
@@ -0,0 +1,161 @@
+"""In-memory follow graph for suggestions and "followed by people you follow".
+
+Each user's followees and followers are kept as sorted `array('i')` id lists (4 bytes
+per id, so about 8 bytes per follow edge plus a small per-user overhead). The graph is
+loaded from the follows table on first use. After that, follow/unfollow events from
+the bus (see events.py) apply each change incrementally, in every worker. Events that
+arrive while the initial load is running are replayed once it finishes.
+
+So with several workers `settings.event_bus_url` is required: on the in-process bus a
+worker only hears about follows made through itself, and its graph drifts from the
+table for as long as it runs.
+
+- `suggestions(u)`: friends of friends, ranked by how many of u's followees follow them.
+- `mutuals(viewer, target)`: the people viewer follows who also follow target.
+"""
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from sqlalchemy import select
+
+from .db import SessionLocal
+from .models import Follow
+
+_EMPTY = array("i")
+
+
+def _insert(ids: array, value: int) -> bool:
+    i = bisect_left(ids, value)
+    if i < len(ids) and ids[i] == value:
+        return False
+    ids.insert(i, value)
+    return True
+
+
+def _remove(ids: array, value: int) -> bool:
+    i = bisect_left(ids, value)
+    if i < len(ids) and ids[i] == value:
+        del ids[i]
+        return True
+    return False
+
+
+class FollowGraph:
+    def __init__(self):
+        self._following: dict[int, array] = {}
+        self._followers: dict[int, array] = {}
+        self._lock = threading.Lock()
+        self._state = "empty"  # "empty" -> "loading" -> "ready"
+        self._replay: list[dict] = []
+        self._loaded = threading.Event()
+        self.load_seconds = 0.0
+
+    def load(self, rows) -> None:
+        """Build from (follower_id, following_id) rows sorted by follower_id, following_id."""
+        following: dict[int, array] = {}
+        followers: dict[int, array] = defaultdict(lambda: array("i"))
+        for follower_id, following_id in rows:
+            ids = following.get(follower_id)
+            if ids is None:
+                ids = following[follower_id] = array("i")
+            ids.append(following_id)
+            followers[following_id].append(follower_id)  # ascending, since rows are sorted by follower
+        with self._lock:
+            self._following, self._followers = following, dict(followers)
+            replay, self._replay = self._replay, []
+            for event in replay:
+                self._apply(event)
+            self._state = "ready"
+
+    def ensure_loaded(self) -> None:
+        while True:
+            with self._lock:
+                state = self._state
+                if state == "empty":
+                    self._state = "loading"
+                    self._loaded.clear()
+            if state == "ready":
+                return
+            if state == "empty":
+                break
+            # if that load fails, the graph is empty again and the next pass retries it here
+            self._loaded.wait()
+        started = time.perf_counter()
+        try:
+            with SessionLocal() as db:
+                rows = db.execute(
+                    select(Follow.follower_id, Follow.following_id)
+                    .order_by(Follow.follower_id, Follow.following_id)
+                    .execution_options(yield_per=50_000)
+                )
+                self.load(rows)
+        except BaseException:
+            with self._lock:
+                self._state = "empty"
+                self._replay = []
+                self._loaded.set()
+            raise
+        self._loaded.set()
+        self.load_seconds = time.perf_counter() - started
+
+    def on_event(self, event: dict) -> None:
+        """Bus listener: apply follow/unfollow events (ignored until the graph is used)."""
+        if event["type"] != "follow":
+            return
+        with self._lock:
+            if self._state == "loading":
+                self._replay.append(event)
+            elif self._state == "ready":
+                self._apply(event)
+
+    def _apply(self, event: dict) -> None:
+        follower_id, following_id = event["follower_id"], event["following_id"]
+        if event["following"]:
+            _insert(self._following.setdefault(follower_id, array("i")), following_id)
+            _insert(self._followers.setdefault(following_id, array("i")), follower_id)
+        else:
+            _remove(self._following.get(follower_id, array("i")), following_id)
+            _remove(self._followers.get(following_id, array("i")), follower_id)
+
+    def suggestions(self, user_id: int, limit: int) -> list[tuple[int, int]]:
+        """[(user_id, how many of user's followees follow them)], best first."""
+        self.ensure_loaded()
+        with self._lock:
+            following = self._following.get(user_id, _EMPTY)
+            overlap: dict[int, int] = defaultdict(int)
+            for followee in following:
+                for candidate in self._following.get(followee, _EMPTY):
+                    overlap[candidate] += 1
+            for followee in following:
+                overlap.pop(followee, None)
+        overlap.pop(user_id, None)
+        return heapq.nsmallest(limit, overlap.items(), key=lambda item: (-item[1], item[0]))
+
+    def mutuals(self, viewer_id: int, target_id: int) -> list[int]:
+        """Ids the viewer follows who also follow the target, ascending."""
+        self.ensure_loaded()
+        with self._lock:
+            followees = self._following.get(viewer_id, _EMPTY)
+            followers = self._followers.get(target_id, _EMPTY)
+            small, large = sorted((followees, followers), key=len)
+            return sorted(set(small).intersection(large))
+
+    def stats(self) -> dict:
+        with self._lock:
+            edges = sum(len(ids) for ids in self._following.values())
+            id_bytes = sum(ids.buffer_info()[1] * ids.itemsize for ids in self._following.values())
+            id_bytes += sum(ids.buffer_info()[1] * ids.itemsize for ids in self._followers.values())
+            return {
+                "state": self._state,
+                "users": len(self._following.keys() | self._followers.keys()),
+                "edges": edges,
+                "id_bytes": id_bytes,
+                "load_seconds": round(self.load_seconds, 3),
+            }
+
+
+graph = FollowGraph()
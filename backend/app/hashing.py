@@ -0,0 +1,71 @@
+"""Password hashing off the request path.
+
+Argon2 is deliberately slow and CPU-bound. Run on the shared threadpool, a burst of
+logins holds every worker thread (and the GIL) and unrelated requests queue behind
+it. Hashes run on a small process pool instead (`settings.hash_workers`), and at most
+`settings.hash_max_pending` may be queued or running at once. Past that, callers get
+`PoolBusy` and the routes answer 429 instead of letting the queue grow without bound.
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+
+from . import auth
+from .config import settings
+
+
+class PoolBusy(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many logins in progress, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
+
+_pool: ProcessPoolExecutor | None = None
+_pending = 0
+
+
+def _lower_priority() -> None:
+    # when cores are scarce, the event loop should win over a queue of hashes
+    if hasattr(os, "nice"):
+        os.nice(10)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.hash_workers, initializer=_lower_priority)
+    return _pool
+
+
+async def _run(fn, *args):
+    global _pending
+    if _pending >= settings.hash_max_pending:
+        raise PoolBusy()
+    _pending += 1
+    try:
+        if settings.hash_workers <= 0:
+            return await run_in_threadpool(fn, *args)
+        return await asyncio.get_running_loop().run_in_executor(_get_pool(), fn, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run(auth.hash_password, password)
+
+
+async def verify_and_update(password: str, hashed: str) -> tuple[bool, str | None]:
+    return await _run(auth.verify_and_update, password, hashed)
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
@@ -0,0 +1,106 @@
+"""Conditional GETs and a short-lived response cache for read endpoints.
+
+`conditional_json` takes an ETag computed from cheap inputs (a row's `version`, ids,
+the query) and only builds the JSON body when the client's `If-None-Match` doesn't
+match. A match gets an empty 304.
+
+`micro_cache(seconds)` wraps an endpoint returning such a response. It keeps each 200
+per URL for a few seconds, so a burst of polls for the same resource is answered
+(or 304'd) without running the handler. Only use it for data every allowed caller
+sees the same way. Writes that change a cached resource call `invalidate(prefix)`.
+The cache is per process.
+"""
+import functools
+import hashlib
+import inspect
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Request, Response
+
+MAX_ENTRIES = 4096
+
+
+def make_etag(*parts) -> str:
+    return '"' + hashlib.sha1(repr(parts).encode()).hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in header.split(",")]
+
+
+async def conditional_json(request: Request, etag: str, render, cache_control: str = "private, no-cache") -> Response:
+    """304 if the client has `etag`, else a JSON response from `render()` (JSON str/bytes, may be async)."""
+    headers = {"etag": etag, "cache-control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    body = render()
+    if inspect.isawaitable(body):
+        body = await body
+    return Response(body, media_type="application/json", headers=headers)
+
+
+class _Entries:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, tuple[float, bytes, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self._data.pop(key, None)
+                return None
+            return entry
+
+    def set(self, key: str, ttl: float, body: bytes, headers: dict) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, body, headers)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, prefix: str) -> None:
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+
+_entries = _Entries(MAX_ENTRIES)
+
+
+def invalidate(path_prefix: str) -> None:
+    _entries.invalidate(path_prefix)
+
+
+def micro_cache(seconds: float):
+    """Decorator for endpoints that take `request: Request` and return `conditional_json(...)`."""
+
+    def decorator(endpoint):
+        if seconds <= 0:
+            return endpoint
+
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            request: Request = kwargs["request"]
+            key = f"{request.url.path}?{request.url.query}"
+            hit = _entries.get(key)
+            if hit is not None:
+                _, body, headers = hit
+                if etag_matches(request, headers["etag"]):
+                    return Response(status_code=304, headers=headers)
+                return Response(body, media_type="application/json", headers=headers)
+            response = await endpoint(*args, **kwargs)
+            if response.status_code == 200 and "etag" in response.headers:
+                headers = {"etag": response.headers["etag"], "cache-control": response.headers.get("cache-control", "no-cache")}
+                _entries.set(key, seconds, response.body, headers)
+            return response
+
+        return wrapper
+
+    return decorator
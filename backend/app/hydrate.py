@@ -0,0 +1,63 @@
+from sqlalchemy.orm import Session
+
+from .models import Post, User, Like
+from .schemas import PostPublic
+from . import images, uploads
+
+
+def image_url(post: Post, variant: str = "full") -> str | None:
+    # posts made from the /app form may carry an external image URL instead of a storage key
+    if not uploads.is_stored(post.image_path):
+        return post.image_path or None
+    if variant in images.parse_variants(post.image_variants):
+        return uploads.url(images.variant_name(post.image_path, variant))
+    return uploads.url(post.image_path)
+
+
+def image_srcset(post: Post) -> str | None:
+    if not uploads.is_stored(post.image_path):
+        return None
+    by_width = {}
+    for name, width in images.parse_variants(post.image_variants).items():
+        by_width.setdefault(width, name)
+    return ", ".join(f"{uploads.url(images.variant_name(post.image_path, name))} {width}w" for width, name in by_width.items()) or None
+
+
+def image_pending(post: Post) -> bool:
+    return uploads.is_stored(post.image_path) and post.image_variants is None and images.enabled()
+
+
+def liked_ids(db: Session, post_ids: list[int], me_id: int | None) -> set[int]:
+    if not post_ids or not me_id:
+        return set()
+    return {
+        pid for (pid,) in db.query(Like.post_id).filter(Like.user_id == me_id, Like.post_id.in_(post_ids)).all()
+    }
+
+
+def load_authors(db: Session, posts: list[Post]) -> dict[int, User]:
+    author_ids = {p.author_id for p in posts}
+    if not author_ids:
+        return {}
+    return {u.id: u for u in db.query(User).filter(User.id.in_(author_ids)).all()}
+
+
+def posts_to_public(db: Session, posts: list[Post], me_id: int | None) -> list[PostPublic]:
+    authors = load_authors(db, posts)
+    liked_set = liked_ids(db, [p.id for p in posts], me_id)
+    return [
+        PostPublic(
+            id=p.id,
+            caption=p.caption,
+            image_url=image_url(p),
+            image_srcset=image_srcset(p),
+            image_width=p.image_width,
+            image_height=p.image_height,
+            created_at=p.created_at,
+            author=authors[p.author_id],
+            likes_count=p.likes_count,
+            comments_count=p.comments_count,
+            liked_by_me=p.id in liked_set,
+        )
+        for p in posts
+    ]
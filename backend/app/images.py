@@ -0,0 +1,189 @@
+"""Resized WebP variants of uploaded post images.
+
+After a post with an upload is created, `schedule` re-encodes the original on a worker
+process into the widths in VARIANTS. The encodes carry no EXIF/ICC metadata, and the
+original is never upscaled. The result is recorded on the post:
+`image_variants` ("thumb:160,feed:640,full:1440"), `image_width` and `image_height`.
+Until then `image_variants` is NULL and pages show a placeholder. An empty string
+means the file could not be processed, and the original is served instead.
+
+Needs Pillow (`pip install pillow`); without it, or with `IMAGE_WORKERS=0`, originals
+are served as before. Process posts left pending (e.g. after a restart), from backend/:
+    python -m app.images
+"""
+import asyncio
+import logging
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import suppress
+
+from sqlalchemy import delete, select, update
+
+from .config import settings
+from .db import SessionLocal
+from .models import Blob, Post
+from .storage import storage
+from .uploads import is_stored
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional dependency
+    Image = ImageOps = None
+
+log = logging.getLogger(__name__)
+
+# name -> max width in pixels
+VARIANTS = {"thumb": 160, "feed": 640, "full": 1440}
+WEBP_QUALITY = 80
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def enabled() -> bool:
+    return Image is not None and settings.image_workers > 0
+
+
+def variant_name(image_path: str, variant: str) -> str:
+    return f"{os.path.splitext(image_path)[0]}_{variant}.webp"
+
+
+def parse_variants(value: str | None) -> dict[str, int]:
+    if not value:
+        return {}
+    return {name: int(width) for name, width in (item.split(":") for item in value.split(","))}
+
+
+def _save_webp(img, key: str) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=storage.temp_dir(), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            img.save(out, "WEBP", quality=WEBP_QUALITY, method=4)
+        storage.save(key, tmp_path)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+
+def render(image_path: str) -> tuple[int, int, str]:
+    """Write the variants of one upload; returns (width, height, image_variants). Runs in a worker."""
+    with storage.open(image_path) as f, Image.open(f) as src:
+        img = ImageOps.exif_transpose(src)
+        img = img.convert("RGBA" if img.mode in ("RGBA", "LA", "P") else "RGB")
+    width, height = img.size
+    done = []
+    for name, max_width in VARIANTS.items():
+        w = min(width, max_width)
+        resized = img if w == width else img.resize((w, max(1, round(height * w / width))), Image.LANCZOS)
+        _save_webp(resized, variant_name(image_path, name))
+        done.append(f"{name}:{w}")
+    return width, height, ",".join(done)
+
+
+def _rendered(image_path: str) -> dict | None:
+    # the same upload may already be processed for another post (storage dedupes by content)
+    with SessionLocal() as db:
+        row = db.execute(
+            select(Post.image_width, Post.image_height, Post.image_variants)
+            .where(Post.image_path == image_path, Post.image_variants != "")
+            .limit(1)
+        ).first()
+    return {"image_width": row[0], "image_height": row[1], "image_variants": row[2]} if row else None
+
+
+def _post_exists(post_id: int) -> bool:
+    with SessionLocal() as db:
+        return db.get(Post, post_id) is not None
+
+
+def _discard_if_unused(image_path: str) -> bool:
+    """Remove variants just written for an upload whose posts were deleted meanwhile; True if removed.
+
+    Takes the blob row's lock like interactions.purge_blob, so a new post with the same
+    image either commits first and keeps them, or renders its own after this.
+    """
+    with SessionLocal() as db:
+        db.execute(delete(Blob).where(Blob.key == image_path, Blob.refcount <= 0))
+        if db.scalar(select(Post.id).where(Post.image_path == image_path).limit(1)) is not None:
+            return False
+        remove_variants(image_path)
+        db.commit()
+        return True
+
+
+def _record(post_id: int, values: dict) -> None:
+    with SessionLocal() as db:
+        db.execute(update(Post).where(Post.id == post_id).values(**values, version=Post.version + 1))
+        db.commit()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.image_workers)
+    return _pool
+
+
+async def process(post_id: int, image_path: str) -> None:
+    """Render and record one post's variants; meant to run as a background task."""
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(None, _post_exists, post_id):
+        return
+    values = await loop.run_in_executor(None, _rendered, image_path)
+    if values is not None:
+        await loop.run_in_executor(None, _record, post_id, values)
+        return
+    try:
+        width, height, variants = await loop.run_in_executor(_get_pool(), render, image_path)
+        values = {"image_width": width, "image_height": height, "image_variants": variants}
+    except Exception:
+        log.exception("could not process image %s of post %s", image_path, post_id)
+        values = {"image_variants": ""}
+    # the post may have been deleted while rendering, after its files were removed
+    if await loop.run_in_executor(None, _discard_if_unused, image_path):
+        return
+    await loop.run_in_executor(None, _record, post_id, values)
+
+
+def schedule(background_tasks, post: Post) -> None:
+    if is_stored(post.image_path) and enabled():
+        background_tasks.add_task(process, post.id, post.image_path)
+
+
+def remove_variants(image_path: str) -> None:
+    for name in VARIANTS:
+        storage.delete(variant_name(image_path, name))
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def process_pending() -> int:
+    with SessionLocal() as db:
+        pending = db.execute(
+            select(Post.id, Post.image_path).where(Post.image_path.is_not(None), Post.image_variants.is_(None))
+        ).all()
+    for post_id, image_path in pending:
+        if not is_stored(image_path):  # external URL, nothing to render
+            _record(post_id, {"image_variants": ""})
+            continue
+        try:
+            width, height, variants = render(image_path)
+            values = {"image_width": width, "image_height": height, "image_variants": variants}
+        except Exception:
+            log.exception("could not process image %s of post %s", image_path, post_id)
+            values = {"image_variants": ""}
+        if not _discard_if_unused(image_path):
+            _record(post_id, values)
+    return len(pending)
+
+
+if __name__ == "__main__":
+    if Image is None:
+        raise SystemExit("Pillow is not installed")
+    print(f"processed {process_pending()} images")
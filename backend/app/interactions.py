@@ -0,0 +1,286 @@
+"""Write paths shared by the /api routers and the /actions page routes.
+
+Each function changes the source row together with its derived data (denormalized
+counters, materialized timelines, upload reference counts, feed affinities), so they never drift apart. The functions do not
+commit; handlers go through `apply`, which commits them as one transaction and then
+publishes the change to live feed connections (see events.py).
+"""
+from sqlalchemy import delete, func, insert, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .models import Post, User, Like, Comment, Follow, Blob, Affinity
+from . import events, fragments, httpcache, images, ranking, timeline, uploads, writer
+
+
+def _bump(db: Session, model, row_id: int, **deltas: int) -> None:
+    values = {name: getattr(model, name) + delta for name, delta in deltas.items()}
+    db.execute(update(model).where(model.id == row_id).values(**values))
+
+
+def _bump_all(db: Session, model, row_ids: list[int], **deltas: int) -> None:
+    values = {name: getattr(model, name) + delta for name, delta in deltas.items()}
+    db.execute(update(model).where(model.id.in_(row_ids)).values(**values))
+
+
+def _upsert_dialect(db: Session):
+    """sqlite/postgresql insert constructs (with ON CONFLICT), or None for other databases."""
+    return {"sqlite": sqlite, "postgresql": postgresql}.get(db.get_bind().dialect.name)
+
+
+def _insert_missing(db: Session, model, columns: list[str], rows, existing) -> list[int]:
+    """INSERT ... SELECT `rows`, skipping rows that already exist; returns the first column of those inserted.
+
+    `existing` selects the first-column values already present, for databases without ON CONFLICT.
+    """
+    dialect = _upsert_dialect(db)
+    if dialect is not None:
+        stmt = dialect.insert(model).from_select(columns, rows).on_conflict_do_nothing()
+        return list(db.scalars(stmt.returning(getattr(model, columns[0]))))
+    new_rows = db.execute(rows.where(rows.selected_columns[0].not_in(existing))).all()
+    if new_rows:
+        db.execute(insert(model), [dict(zip(columns, row)) for row in new_rows])
+    return [row[0] for row in new_rows]
+
+
+def _credit_authors(db: Session, user_id: int, post_ids: list[int], delta: int) -> None:
+    """Add `delta` per post to the user's affinity with each post's author (see ranking.affinity)."""
+    per_author = db.execute(
+        select(Post.author_id, func.count()).where(Post.id.in_(post_ids)).group_by(Post.author_id)
+    ).all()
+    rows = [{"user_id": user_id, "author_id": author_id, "score": n * delta} for author_id, n in per_author]
+    if not rows:
+        return
+    dialect = _upsert_dialect(db)
+    if dialect is None:
+        for row in rows:
+            stmt = update(Affinity).where(Affinity.user_id == user_id, Affinity.author_id == row["author_id"])
+            if not db.execute(stmt.values(score=Affinity.score + row["score"])).rowcount:
+                db.add(Affinity(**row))
+        return
+    stmt = dialect.insert(Affinity).values(rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[Affinity.user_id, Affinity.author_id], set_={"score": Affinity.score + stmt.excluded.score}
+    ))
+
+
+def _retain_blob(db: Session, key: str) -> None:
+    dialect = _upsert_dialect(db)
+    if dialect is None:
+        if not db.execute(update(Blob).where(Blob.key == key).values(refcount=Blob.refcount + 1)).rowcount:
+            db.add(Blob(key=key, refcount=1))
+        return
+    stmt = dialect.insert(Blob).values(key=key, refcount=1)
+    db.execute(stmt.on_conflict_do_update(index_elements=[Blob.key], set_={"refcount": Blob.refcount + 1}))
+
+
+def _release_blob(db: Session, key: str) -> bool:
+    """Drop one reference; True if nothing uses the file any more (see purge_blob)."""
+    db.execute(update(Blob).where(Blob.key == key).values(refcount=Blob.refcount - 1))
+    refcount = db.query(Blob.refcount).filter(Blob.key == key).scalar()
+    # None: stored before reference counting, owned by this post alone
+    return refcount is None or refcount <= 0
+
+
+def publish(db: Session, post: Post) -> Post:
+    db.add(post)
+    db.flush()
+    if uploads.is_stored(post.image_path):
+        _retain_blob(db, post.image_path)
+    timeline.fan_out(db, post)
+    db.refresh(post)
+    # scored up front, so a new post shows up in explore without waiting for a refresh
+    post.hot_score = ranking.hot_score(post.likes_count, post.comments_count, post.created_at)
+    post.scored_version = post.version
+    db.flush()
+    return post
+
+
+def delete_post(db: Session, post: Post) -> str | None:
+    """Returns the post's upload key once no post uses it; pass it to purge_blob after committing."""
+    orphan = post.image_path if uploads.is_stored(post.image_path) and _release_blob(db, post.image_path) else None
+    timeline.remove_post(db, post.id)
+    db.delete(post)
+    return orphan
+
+
+def purge_blob(db: Session, key: str) -> bool:
+    """Remove an unused upload and its variants, unless it was posted again since; True if removed.
+
+    Deleting the zero-count row locks it, so a publish of the same image waits until this
+    commits, and the files go before that. The publish then finds the file gone and
+    restores it (uploads.keep_image), or this finds the row in use and keeps the file.
+    """
+    db.execute(delete(Blob).where(Blob.key == key, Blob.refcount <= 0))
+    if db.scalar(select(Blob.refcount).where(Blob.key == key)):
+        return False
+    uploads.remove_image(key)
+    images.remove_variants(key)
+    return True
+
+
+def like_many(db: Session, post_ids: list[int], user_id: int) -> list[int]:
+    """Like every existing post in `post_ids` not liked yet; returns the newly liked ids."""
+    liked = _insert_missing(
+        db, Like, ["post_id", "user_id"],
+        select(Post.id, literal(user_id)).where(Post.id.in_(post_ids)),
+        select(Like.post_id).where(Like.user_id == user_id),
+    )
+    if liked:
+        _bump_all(db, Post, liked, likes_count=1, version=1)
+        _credit_authors(db, user_id, liked, 1)
+    return liked
+
+
+def unlike_many(db: Session, post_ids: list[int], user_id: int) -> list[int]:
+    """Returns the ids that were liked before."""
+    stmt = delete(Like).where(Like.user_id == user_id, Like.post_id.in_(post_ids))
+    if db.get_bind().dialect.delete_returning:
+        unliked = list(db.scalars(stmt.returning(Like.post_id)))
+    else:
+        unliked = list(db.scalars(select(Like.post_id).where(Like.user_id == user_id, Like.post_id.in_(post_ids))))
+        db.execute(stmt)
+    if unliked:
+        _bump_all(db, Post, unliked, likes_count=-1, version=1)
+        _credit_authors(db, user_id, unliked, -1)
+    return unliked
+
+
+# Single likes/follows use the same statements as the batch versions: the insert only
+# happens if the post/user exists and the row doesn't, so repeats and concurrent
+# double-clicks are no-ops instead of IntegrityErrors. False = nothing changed
+# (already liked/followed, or no such post/user).
+def like(db: Session, post_id: int, user_id: int) -> bool:
+    return bool(like_many(db, [post_id], user_id))
+
+
+def unlike(db: Session, post_id: int, user_id: int) -> bool:
+    return bool(unlike_many(db, [post_id], user_id))
+
+
+def add_comment(db: Session, post_id: int, user_id: int, text: str) -> Comment:
+    c = Comment(post_id=post_id, author_id=user_id, text=text)
+    db.add(c)
+    db.flush()
+    _bump(db, Post, post_id, comments_count=1, version=1)
+    _credit_authors(db, user_id, [post_id], 1)
+    return c
+
+
+def delete_comment(db: Session, c: Comment) -> None:
+    post_id, author_id = c.post_id, c.author_id
+    db.delete(c)
+    db.flush()
+    _bump(db, Post, post_id, comments_count=-1, version=1)
+    _credit_authors(db, author_id, [post_id], -1)
+
+
+def follow(db: Session, follower_id: int, following_id: int) -> bool:
+    return bool(follow_many(db, follower_id, [following_id]))
+
+
+def unfollow(db: Session, follower_id: int, following_id: int) -> bool:
+    deleted = (
+        db.query(Follow)
+        .filter(Follow.follower_id == follower_id, Follow.following_id == following_id)
+        .delete()
+    )
+    if deleted:
+        _bump(db, User, follower_id, following_count=-deleted)
+        _bump(db, User, following_id, followers_count=-deleted)
+        timeline.prune(db, follower_id, following_id)
+        timeline.fan_out_skipped(db, following_id)
+    return bool(deleted)
+
+
+def follow_many(db: Session, follower_id: int, following_ids: list[int]) -> list[int]:
+    """Follow every existing user in `following_ids` (but not oneself); returns the newly followed ids."""
+    followed = _insert_missing(
+        db, Follow, ["following_id", "follower_id"],
+        select(User.id, literal(follower_id)).where(User.id.in_(following_ids), User.id != follower_id),
+        select(Follow.following_id).where(Follow.follower_id == follower_id),
+    )
+    if followed:
+        _bump(db, User, follower_id, following_count=len(followed))
+        _bump_all(db, User, followed, followers_count=1)
+        for following_id in followed:
+            timeline.backfill(db, follower_id, following_id)
+    return followed
+
+
+# small, hot writes that may be group-committed by the SQLite writer thread
+GROUP_COMMIT = {like, unlike, follow, unfollow, like_many, unlike_many, follow_many}
+# writes that change the latest-posts list on the cached anonymous landing page
+LANDING_CHANGES = {publish, delete_post}
+
+
+def comments_cache_prefix(post_id: int) -> str:
+    """Micro-cache keys (see httpcache.py) of every page of the post's comment list."""
+    return f"/api/comments/post/{post_id}?"
+
+
+def _counts_events(db: Session, post_ids: list[int]) -> list[dict]:
+    rows = db.execute(
+        select(Post.id, Post.author_id, Post.likes_count, Post.comments_count).where(Post.id.in_(post_ids))
+    )
+    return [
+        {"type": "counts", "post_id": row[0], "author_id": row[1], "likes_count": row[2], "comments_count": row[3]}
+        for row in rows
+    ]
+
+
+def _follow_event(follower_id: int, following_id: int, following: bool) -> dict:
+    return {"type": "follow", "follower_id": follower_id, "following_id": following_id, "following": following}
+
+
+def describe(db: Session, fn, args: tuple, result) -> list[dict]:
+    """The feed events for a write, read in its transaction; empty if nothing visible changed."""
+    if fn is publish:
+        return [{"type": "post", "post_id": result.id, "author_id": result.author_id}]
+    if fn is delete_post:
+        return [{"type": "post_deleted", "post_id": args[0].id, "author_id": args[0].author_id}]
+    if fn in (like, unlike):
+        return _counts_events(db, [args[0]]) if result else []
+    if fn in (like_many, unlike_many):
+        return _counts_events(db, result) if result else []
+    if fn is add_comment:
+        return _counts_events(db, [args[0]])
+    if fn is delete_comment:
+        return _counts_events(db, [args[0].post_id])
+    if fn in (follow, unfollow) and result:
+        return [_follow_event(args[0], args[1], fn is follow)]
+    if fn is follow_many:
+        return [_follow_event(args[0], following_id, True) for following_id in result]
+    return []
+
+
+def _run(db: Session, fn, *args):
+    result = fn(db, *args)
+    return result, describe(db, fn, args, result)
+
+
+def _run_and_commit(db: Session, fn, *args):
+    # commit in the same threadpool hop: a SQLite write lock is never held while the
+    # request waits for a free thread to commit, which could stall every writer
+    out = _run(db, fn, *args)
+    db.commit()
+    return out
+
+
+async def apply(db, fn, *args):
+    """Run one of the write functions above on the request's session, commit it, and publish it."""
+    if fn in GROUP_COMMIT and writer.enabled():
+        # end the request's read transaction so its connection isn't held while queued
+        await db.commit()
+        result, changes = await writer.submit(_run, fn, *args)
+    else:
+        result, changes = await db.run_sync(_run_and_commit, fn, *args)
+    if fn in LANDING_CHANGES:
+        fragments.cache.invalidate(fragments.LANDING)
+    if fn is add_comment:
+        httpcache.invalidate(comments_cache_prefix(args[0]))
+    elif fn is delete_comment:
+        httpcache.invalidate(comments_cache_prefix(args[0].post_id))
+    for event in changes:
+        events.bus.publish(event)
+    return result
@@ -1,10 +1,11 @@
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from .assets import AssetFiles
 from .config import settings
-from .db import engine
+from .db import engine, stick_to_primary
 from .models import Base
-from .routers import auth, users, posts, comments, likes, admin, pages
+from .routers import auth, users, posts, comments, likes, admin, avatars, live, pages, search as search_routes
+from . import db, events, graph, hashing, images, metrics, ranking, search, uploads, writer
 
 def create_app() -> FastAPI:
     app = FastAPI(title=settings.app_name)
@@ -17,9 +18,29 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
+    app.add_middleware(uploads.BodyLimitMiddleware)
+
+    if settings.read_replica_urls:
+        app.middleware("http")(stick_to_primary)
+
+    if settings.metrics_enabled:
+        # added last, so it is outermost and times the other middleware too
+        app.add_middleware(metrics.MetricsMiddleware)
+        app.add_api_route("/metrics", metrics.endpoint, include_in_schema=False)
+
     Base.metadata.create_all(bind=engine)
+    search.setup(engine)
+    events.bus.listeners.append(graph.graph.on_event)
+    app.add_event_handler("startup", events.start)
+    app.add_event_handler("startup", ranking.start)
+    app.add_event_handler("shutdown", ranking.stop)
+    app.add_event_handler("shutdown", writer.shutdown)
+    app.add_event_handler("shutdown", hashing.shutdown)
+    app.add_event_handler("shutdown", images.shutdown)
+    app.add_event_handler("shutdown", events.shutdown)
+    app.add_event_handler("shutdown", db.shutdown)
 
-    app.mount("/static", StaticFiles(directory="app/static"), name="static")
+    app.mount("/static", AssetFiles(directory="app/static"), name="static")
 
     app.include_router(auth.router)
     app.include_router(users.router)
@@ -27,6 +48,9 @@ def create_app() -> FastAPI:
     app.include_router(comments.router)
     app.include_router(likes.router)
     app.include_router(admin.router)
+    app.include_router(avatars.router)
+    app.include_router(live.router)
+    app.include_router(search_routes.router)
     app.include_router(pages.router)
 
     return app
@@ -0,0 +1,244 @@
+"""Per-request performance metrics, exported in Prometheus text format on /metrics.
+
+`MetricsMiddleware` times every HTTP request, labelled by route template (e.g.
+`/api/posts/{post_id}`) rather than raw path. The SQL hooks in db.py attribute each
+statement to the request whose context ran it, threadpool hops included, so every
+route gets:
+- a latency histogram,
+- a histogram of statements per request (an N+1 shows up as a jump here),
+- total SQL time.
+
+Statements outside any request are counted as background. That covers the SQLite
+writer thread, the ranking job and CLIs.
+
+Statements slower than `settings.slow_query_ms` are logged with their SQL. A request
+that starts while every threadpool thread is busy counts toward
+`threadpool_saturated_total`, next to gauges for the pool itself. With
+`settings.debug` on, responses also carry a `Server-Timing` header (app and db time
+and the query count), which browser dev tools show per request.
+
+Metrics are per process. With several workers, scrape each one. /metrics answers
+only requests from the same host that carry no proxy headers, or, once
+`settings.metrics_token` is set, requests bearing that token (and 404 otherwise). A
+reverse proxy on the same host that doesn't add X-Forwarded-For/Forwarded makes every
+request look local, so set the token there.
+"""
+import logging
+import secrets
+import threading
+import time
+from contextvars import ContextVar
+
+import anyio.to_thread
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .config import settings
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class RequestStats:
+    __slots__ = ("sql_count", "sql_seconds")
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+
+
+_current: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class _RouteMetrics:
+    __slots__ = ("latency", "queries", "sql_seconds", "statuses")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.sql_seconds = 0.0
+        self.statuses: dict[str, int] = {}
+
+
+class Registry:
+    def __init__(self):
+        # written only from the event loop (the middleware)
+        self.routes: dict[tuple[str, str], _RouteMetrics] = {}
+        self.saturated = 0
+        # written from any thread (the SQL hooks)
+        self._lock = threading.Lock()
+        self.background_count = 0
+        self.background_seconds = 0.0
+        self.slow_queries = 0
+
+    def record_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats) -> None:
+        m = self.routes.get((method, route))
+        if m is None:
+            m = self.routes[(method, route)] = _RouteMetrics()
+        m.latency.observe(seconds)
+        m.queries.observe(stats.sql_count)
+        m.sql_seconds += stats.sql_seconds
+        code = f"{status // 100}xx"
+        m.statuses[code] = m.statuses.get(code, 0) + 1
+
+    def record_sql(self, seconds: float, statement: str) -> None:
+        stats = _current.get()
+        if stats is not None:
+            stats.sql_count += 1
+            stats.sql_seconds += seconds
+        slow = settings.slow_query_ms > 0 and seconds * 1000 >= settings.slow_query_ms
+        if slow:
+            log.warning("slow query (%.1f ms): %s", seconds * 1000, " ".join(statement.split())[:2000])
+        if stats is None or slow:
+            with self._lock:
+                if stats is None:
+                    self.background_count += 1
+                    self.background_seconds += seconds
+                if slow:
+                    self.slow_queries += 1
+
+    def render(self) -> str:
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        out: list[str] = []
+
+        def header(name: str, kind: str, text: str) -> None:
+            out.append(f"# HELP instalite_{name} {text}")
+            out.append(f"# TYPE instalite_{name} {kind}")
+
+        def histogram(name: str, labels: str, h: Histogram) -> None:
+            cumulative = 0
+            for bound, n in zip(h.bounds, h.counts):
+                cumulative += n
+                out.append(f'instalite_{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            out.append(f'instalite_{name}_bucket{{{labels},le="+Inf"}} {h.count}')
+            out.append(f"instalite_{name}_sum{{{labels}}} {h.sum}")
+            out.append(f"instalite_{name}_count{{{labels}}} {h.count}")
+
+        routes = sorted(self.routes.items())
+        labelled = [(f'method="{method}",route="{_escape(route)}"', m) for (method, route), m in routes]
+
+        header("http_requests_total", "counter", "HTTP requests by route and status class.")
+        for labels, m in labelled:
+            for code, n in sorted(m.statuses.items()):
+                out.append(f'instalite_http_requests_total{{{labels},status="{code}"}} {n}')
+        header("http_request_duration_seconds", "histogram", "HTTP request latency, until the last body byte.")
+        for labels, m in labelled:
+            histogram("http_request_duration_seconds", labels, m.latency)
+        header("http_request_sql_statements", "histogram", "SQL statements run per HTTP request.")
+        for labels, m in labelled:
+            histogram("http_request_sql_statements", labels, m.queries)
+        header("http_request_sql_seconds_total", "counter", "Time spent in SQL by HTTP requests.")
+        for labels, m in labelled:
+            out.append(f"instalite_http_request_sql_seconds_total{{{labels}}} {m.sql_seconds}")
+
+        with self._lock:
+            background = (self.background_count, self.background_seconds, self.slow_queries)
+        header("sql_background_statements_total", "counter", "SQL statements run outside HTTP requests.")
+        out.append(f"instalite_sql_background_statements_total {background[0]}")
+        header("sql_background_seconds_total", "counter", "Time spent in SQL outside HTTP requests.")
+        out.append(f"instalite_sql_background_seconds_total {background[1]}")
+        header("sql_slow_queries_total", "counter", "Statements slower than SLOW_QUERY_MS.")
+        out.append(f"instalite_sql_slow_queries_total {background[2]}")
+
+        header("threadpool_threads", "gauge", "Threads the handler threadpool may use.")
+        out.append(f"instalite_threadpool_threads {limiter.total_tokens}")
+        header("threadpool_busy", "gauge", "Threadpool threads currently running a task.")
+        out.append(f"instalite_threadpool_busy {limiter.borrowed_tokens}")
+        header("threadpool_waiting", "gauge", "Tasks queued for a threadpool thread.")
+        out.append(f"instalite_threadpool_waiting {limiter.statistics().tasks_waiting}")
+        header("threadpool_saturated_total", "counter", "HTTP requests that started while every thread was busy.")
+        out.append(f"instalite_threadpool_saturated_total {self.saturated}")
+        return "\n".join(out) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if "endpoint" in scope:  # a Mount, e.g. /static
+        return scope.get("root_path", "") + "/{path}"
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware feeding `registry`; WebSocket and lifespan traffic passes through."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        if limiter.borrowed_tokens >= limiter.total_tokens:
+            registry.saturated += 1
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if settings.debug:
+                    app_ms = (time.perf_counter() - started) * 1000
+                    timing = (
+                        f'app;dur={app_ms:.1f}, db;dur={stats.sql_seconds * 1000:.1f};desc="{stats.sql_count} queries"'
+                    )
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            registry.record_request(
+                scope["method"], _route_label(scope), status, time.perf_counter() - started, stats
+            )
+
+
+_LOOPBACK = {"127.0.0.1", "::1"}
+_PROXY_HEADERS = ("forwarded", "x-forwarded-for", "x-real-ip")
+
+
+def _may_scrape(request: Request) -> bool:
+    if settings.metrics_token:
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        return scheme.lower() == "bearer" and secrets.compare_digest(token, settings.metrics_token)
+    if any(name in request.headers for name in _PROXY_HEADERS):
+        return False  # relayed by a proxy, so the peer address says nothing about the client
+    return request.client is not None and request.client.host in _LOOPBACK
+
+
+async def endpoint(request: Request) -> Response:
+    if not _may_scrape(request):
+        return Response(status_code=404)
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,7 +1,15 @@
-from sqlalchemy import String, Boolean, ForeignKey, DateTime, Text, UniqueConstraint, func
+from sqlalchemy import String, Boolean, Integer, Float, ForeignKey, DateTime, Text, UniqueConstraint, Index, func
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from .db import Base
 
+# SQLite keeps timestamps as text. Store bound values in the same shape as CURRENT_TIMESTAMP
+# so keyset comparisons on (created_at, id) see equal values as equal.
+Timestamp = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite",
+)
+
 class User(Base):
     __tablename__ = "users"
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -9,39 +17,66 @@ class User(Base):
     email: Mapped[str] = mapped_column(String(255), unique=True, index=True)
     hashed_password: Mapped[str] = mapped_column(String(255))
     is_admin: Mapped[bool] = mapped_column(Boolean, default=False)
-    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    followers_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    following_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    created_at: Mapped[str] = mapped_column(Timestamp, server_default=func.now())
 
     posts: Mapped[list["Post"]] = relationship(back_populates="author", cascade="all,delete-orphan")
     comments: Mapped[list["Comment"]] = relationship(back_populates="author", cascade="all,delete-orphan")
 
+    __table_args__ = (
+        Index("ix_users_created_id", "created_at", "id"),
+    )
+
 class Post(Base):
     __tablename__ = "posts"
     id: Mapped[int] = mapped_column(primary_key=True)
     author_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
     caption: Mapped[str] = mapped_column(Text, default="")
-    image_path: Mapped[str | None] = mapped_column(String(255), nullable=True)
-    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    image_path: Mapped[str | None] = mapped_column(String(255), nullable=True, index=True)
+    # filled in by images.py once the upload's resized variants exist
+    image_width: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    image_height: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    image_variants: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    likes_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    comments_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    # bumped on every change to what a rendered post card shows (see fragments.py)
+    version: Mapped[int] = mapped_column(Integer, default=1, server_default="1")
+    # engagement ranking (see ranking.py), as of `scored_version`
+    hot_score: Mapped[float] = mapped_column(Float, default=0.0, server_default="0")
+    scored_version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    created_at: Mapped[str] = mapped_column(Timestamp, server_default=func.now())
 
     author: Mapped["User"] = relationship(back_populates="posts")
     comments: Mapped[list["Comment"]] = relationship(back_populates="post", cascade="all,delete-orphan")
     likes: Mapped[list["Like"]] = relationship(back_populates="post", cascade="all,delete-orphan")
 
+    __table_args__ = (
+        Index("ix_posts_author_created_id", "author_id", "created_at", "id"),
+        Index("ix_posts_created_id", "created_at", "id"),
+        Index("ix_posts_hot_id", "hot_score", "id"),
+    )
+
 class Comment(Base):
     __tablename__ = "comments"
     id: Mapped[int] = mapped_column(primary_key=True)
     post_id: Mapped[int] = mapped_column(ForeignKey("posts.id", ondelete="CASCADE"), index=True)
     author_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
     text: Mapped[str] = mapped_column(Text)
-    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    created_at: Mapped[str] = mapped_column(Timestamp, server_default=func.now())
 
     post: Mapped["Post"] = relationship(back_populates="comments")
     author: Mapped["User"] = relationship(back_populates="comments")
 
+    __table_args__ = (
+        Index("ix_comments_post_created_id", "post_id", "created_at", "id"),
+    )
+
 class Like(Base):
     __tablename__ = "likes"
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
-    post_id: Mapped[int] = mapped_column(ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True)
-    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    post_id: Mapped[int] = mapped_column(ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True, index=True)
+    created_at: Mapped[str] = mapped_column(Timestamp, server_default=func.now())
 
     post: Mapped["Post"] = relationship(back_populates="likes")
 
@@ -53,8 +88,39 @@ class Follow(Base):
     __tablename__ = "follows"
     follower_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
     following_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
-    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    created_at: Mapped[str] = mapped_column(Timestamp, server_default=func.now())
 
     __table_args__ = (
         UniqueConstraint("follower_id", "following_id", name="uq_follow"),
+        # the primary key only serves "who does X follow"; this serves "who follows X"
+        # (timeline fan-out, follower counts)
+        Index("ix_follows_following_follower", "following_id", "follower_id"),
+    )
+
+class TimelineEntry(Base):
+    """One post in one user's materialized home timeline (fan-out on write)."""
+    __tablename__ = "timeline_entries"
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    post_id: Mapped[int] = mapped_column(ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True)
+    author_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    created_at: Mapped[str] = mapped_column(Timestamp)
+
+    __table_args__ = (
+        Index("ix_timeline_user_created_post", "user_id", "created_at", "post_id"),
+        Index("ix_timeline_user_author", "user_id", "author_id"),
+        Index("ix_timeline_post", "post_id"),
     )
+
+class Affinity(Base):
+    """How many of user_id's likes and comments went to author_id's posts (see ranking.py)."""
+    __tablename__ = "affinities"
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    author_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    score: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+
+class Blob(Base):
+    """An uploaded file in storage (see uploads.py) and how many posts use it."""
+    __tablename__ = "blobs"
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    refcount: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    created_at: Mapped[str] = mapped_column(Timestamp, server_default=func.now())
@@ -0,0 +1,63 @@
+import base64
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import Select, and_, desc, or_
+
+DEFAULT_LIMIT = 30
+MAX_LIMIT = 100
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset(stmt: Select, model, cursor: str | None, limit: int, keys=None) -> Select:
+    """Newest-first keyset page over (model.created_at, model.id), fetching one extra row.
+
+    `keys` overrides the (created_at, id) columns, e.g. to seek on a joined table's index;
+    returned rows must still expose `created_at` and `id`.
+    """
+    created_col, id_col = keys or (model.created_at, model.id)
+    if cursor:
+        ts, row_id = decode_cursor(cursor)
+        stmt = stmt.where(or_(created_col < ts, and_(created_col == ts, id_col < row_id)))
+    return stmt.order_by(desc(created_col), desc(id_col)).limit(limit + 1)
+
+
+def split_page(rows: list, limit: int):
+    """Returns (rows, next_cursor); next_cursor is None on the last page."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+
+async def paginate(db, stmt: Select, model, cursor: str | None, limit: int, keys=None):
+    rows = (await db.scalars(keyset(stmt, model, cursor, limit, keys))).all()
+    return split_page(list(rows), limit)
+
+
+# Ranked lists (search, ranked feed, explore) aren't in a seekable order, so their
+# cursor is just the offset of the next page.
+def decode_offset(cursor: str | None) -> int:
+    if not cursor:
+        return 0
+    if not cursor.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return int(cursor)
+
+
+def split_offset_page(rows: list, offset: int, limit: int):
+    """Like `split_page`, for `limit + 1` rows fetched from `offset`."""
+    return rows[:limit], str(offset + limit) if len(rows) > limit else None
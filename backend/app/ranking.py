@@ -0,0 +1,147 @@
+"""Engagement ranking for the ranked home feed (`?mode=ranked`) and explore/trending.
+
+`Post.hot_score` = log10(max(1, likes + 2 * comments)) + created_at / DECAY_SECONDS.
+Ten times the engagement is worth as much as being DECAY_SECONDS newer, so a post rises
+with its like/comment velocity and sinks as it ages. The score only changes when a count
+does, not with the clock, so it is stored and indexed. Explore is then just
+`ORDER BY hot_score DESC`.
+
+Scores are not computed per request. New posts get theirs at publish time. Every
+`settings.ranking_refresh_seconds` a background job rescores the posts whose `version`
+moved past `scored_version` (any like, comment or edit), looking back
+`settings.ranking_window_days`. To run it by hand, from backend/:
+    python -m app.ranking
+
+A ranked feed page takes the viewer's latest `settings.ranking_candidates` timeline
+posts. It adds each author's affinity, log10(1 + the viewer's likes and comments on
+that author's posts) * AFFINITY_WEIGHT, and sorts them in one pass. The cursor is an
+offset into that ordering. Affinities are counted in the `affinities` table as the
+likes and comments are written (interactions.py), so a page reads them with one
+primary-key range lookup. Interactions on deleted posts stay counted until
+`python -m app.counters` recounts them, which also fills the table for a database
+from before it existed.
+"""
+import asyncio
+import logging
+import math
+from datetime import datetime, timedelta, timezone
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import bindparam, desc, select, update
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .db import SessionLocal
+from .models import Post, Affinity
+from . import timeline
+
+log = logging.getLogger(__name__)
+
+DECAY_SECONDS = 45_000  # 12.5 hours
+COMMENT_WEIGHT = 2
+AFFINITY_WEIGHT = 1.0
+REFRESH_BATCH = 1000
+
+_posts = Post.__table__
+# one executemany per batch; skips posts changed since they were read (the next run rescores them)
+_RESCORE = (
+    update(_posts)
+    .where(_posts.c.id == bindparam("post_id"), _posts.c.version == bindparam("seen_version"))
+    .values(hot_score=bindparam("score"), scored_version=bindparam("seen_version"))
+)
+
+_task: asyncio.Task | None = None
+
+
+def _epoch(created_at) -> float:
+    if created_at is None:
+        return datetime.now(timezone.utc).timestamp()
+    if created_at.tzinfo is None:  # SQLite CURRENT_TIMESTAMP is UTC
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.timestamp()
+
+
+def hot_score(likes: int, comments: int, created_at) -> float:
+    engagement = max(1, likes + COMMENT_WEIGHT * comments)
+    return math.log10(engagement) + _epoch(created_at) / DECAY_SECONDS
+
+
+def refresh(db: Session) -> int:
+    """Rescore up to REFRESH_BATCH changed recent posts; returns how many were rescored."""
+    since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=settings.ranking_window_days)
+    rows = db.execute(
+        select(Post.id, Post.likes_count, Post.comments_count, Post.created_at, Post.version)
+        .where(Post.created_at >= since, Post.scored_version < Post.version)
+        .limit(REFRESH_BATCH)
+    ).all()
+    if rows:
+        db.connection().execute(_RESCORE, [
+            {"post_id": post_id, "seen_version": version, "score": hot_score(likes, comments, created_at)}
+            for post_id, likes, comments, created_at, version in rows
+        ])
+    db.commit()
+    return len(rows)
+
+
+def refresh_all() -> int:
+    total = 0
+    with SessionLocal() as db:
+        while n := refresh(db):
+            total += n
+            if n < REFRESH_BATCH:
+                break
+    return total
+
+
+async def _run() -> None:
+    while True:
+        await asyncio.sleep(settings.ranking_refresh_seconds)
+        try:
+            await run_in_threadpool(refresh_all)
+        except Exception:
+            log.exception("rescoring posts failed")
+
+
+def start() -> None:
+    global _task
+    if settings.ranking_refresh_seconds > 0 and _task is None:
+        _task = asyncio.get_running_loop().create_task(_run())
+
+
+def stop() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
+
+
+def affinity(db: Session, viewer_id: int, author_ids: set[int]) -> dict[int, int]:
+    """How many of the viewer's likes and comments went to each author's posts."""
+    if not author_ids:
+        return {}
+    return dict(db.execute(
+        select(Affinity.author_id, Affinity.score)
+        .where(Affinity.user_id == viewer_id, Affinity.author_id.in_(author_ids))
+    ).all())
+
+
+def ranked_page(db: Session, viewer_id: int, offset: int, limit: int, options=()) -> list[Post]:
+    """Up to `limit + 1` posts from `offset` of the viewer's ranked timeline."""
+    candidates, _ = timeline.page(db, viewer_id, None, settings.ranking_candidates, options)
+    boost = {
+        author_id: AFFINITY_WEIGHT * math.log10(1 + max(0, n))
+        for author_id, n in affinity(db, viewer_id, {p.author_id for p in candidates}).items()
+    }
+    scores = [p.hot_score + boost.get(p.author_id, 0.0) for p in candidates]
+    order = sorted(range(len(candidates)), key=scores.__getitem__, reverse=True)
+    return [candidates[i] for i in order[offset:offset + limit + 1]]
+
+
+def trending(db: Session, offset: int, limit: int, options=()) -> list[Post]:
+    """Up to `limit + 1` posts from `offset`, site-wide by hot score."""
+    stmt = select(Post).options(*options).order_by(desc(Post.hot_score), desc(Post.id))
+    return list(db.scalars(stmt.offset(offset).limit(limit + 1)))
+
+
+if __name__ == "__main__":
+    print(f"rescored {refresh_all()} posts")
@@ -1,18 +1,42 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from ..db import get_db
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..db import get_async_db
 from ..deps import require_admin
 from ..models import User, Post
+from ..usercache import CurrentUser, cache as user_cache
+from .. import events, fragments
+from ..graph import graph
+from ..pagination import paginate, DEFAULT_LIMIT, MAX_LIMIT
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
 @router.get("/users")
-def list_users(db: Session = Depends(get_db), admin: User = Depends(require_admin)):
-    users = db.query(User).order_by(desc(User.created_at)).all()
-    return [{"id": u.id, "username": u.username, "email": u.email, "is_admin": u.is_admin, "created_at": u.created_at} for u in users]
+async def list_users(
+    db: AsyncSession = Depends(get_async_db),
+    admin: CurrentUser = Depends(require_admin),
+    cursor: str | None = None,
+    limit: int = Query(default=DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+):
+    users, next_cursor = await paginate(db, select(User), User, cursor, limit)
+    return {
+        "items": [{"id": u.id, "username": u.username, "email": u.email, "is_admin": u.is_admin, "created_at": u.created_at} for u in users],
+        "next_cursor": next_cursor,
+    }
 
 @router.get("/posts")
-def list_posts(db: Session = Depends(get_db), admin: User = Depends(require_admin)):
-    posts = db.query(Post).order_by(desc(Post.created_at)).all()
-    return [{"id": p.id, "author_id": p.author_id, "caption": p.caption, "image_path": p.image_path, "created_at": p.created_at} for p in posts]
+async def list_posts(
+    db: AsyncSession = Depends(get_async_db),
+    admin: CurrentUser = Depends(require_admin),
+    cursor: str | None = None,
+    limit: int = Query(default=DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+):
+    posts, next_cursor = await paginate(db, select(Post), Post, cursor, limit)
+    return {
+        "items": [{"id": p.id, "author_id": p.author_id, "caption": p.caption, "image_path": p.image_path, "created_at": p.created_at} for p in posts],
+        "next_cursor": next_cursor,
+    }
+
+@router.get("/cache-stats")
+async def cache_stats(admin: CurrentUser = Depends(require_admin)):
+    return {"user_cache": user_cache.stats(), "fragments": fragments.cache.stats(), "live_feed": events.bus.stats(), "follow_graph": graph.stats()}
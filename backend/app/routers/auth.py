@@ -1,38 +1,47 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Response
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from ..db import get_db
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..db import get_async_db
 from ..models import User
+from ..usercache import CurrentUser
 from ..schemas import UserCreate, UserPublic, Token
-from ..auth import hash_password, verify_password, create_access_token
+from ..auth import create_access_token
 from ..deps import get_current_user
+from .. import hashing
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
 @router.post("/register", response_model=UserPublic, status_code=201)
-def register(payload: UserCreate, db: Session = Depends(get_db)):
-    if db.query(User).filter((User.username == payload.username) | (User.email == payload.email)).first():
+async def register(payload: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    if await db.scalar(select(User).where((User.username == payload.username) | (User.email == payload.email))):
         raise HTTPException(status_code=400, detail="Username or email already taken")
+    await db.rollback()  # don't hold a pooled connection while hashing
     user = User(
         username=payload.username,
         email=payload.email,
-        hashed_password=hash_password(payload.password),
+        hashed_password=await hashing.hash_password(payload.password),
         is_admin=False,
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 @router.post("/token", response_model=Token)
-def token(
+async def token(
     response: Response,
     form: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    user = db.query(User).filter(User.username == form.username).first()
-    if not user or not verify_password(form.password, user.hashed_password):
+    user = (await db.execute(select(User.id, User.hashed_password).where(User.username == form.username))).first()
+    await db.rollback()  # don't hold a pooled connection while hashing
+    valid, new_hash = await hashing.verify_and_update(form.password, user.hashed_password) if user else (False, None)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password")
+    if new_hash:
+        await db.execute(update(User).where(User.id == user.id).values(hashed_password=new_hash))
+        await db.commit()
     jwt_token = create_access_token(str(user.id))
     # convenience cookie for server-rendered pages
     response.set_cookie(
@@ -46,10 +55,13 @@ def token(
     return Token(access_token=jwt_token)
 
 @router.post("/logout", status_code=204)
-def logout(response: Response):
+async def logout(response: Response):
     response.delete_cookie("access_token")
     return
 
 @router.get("/me", response_model=UserPublic)
-def me(user: User = Depends(get_current_user)):
+async def me(db: AsyncSession = Depends(get_async_db), me: CurrentUser = Depends(get_current_user)):
+    user = await db.get(User, me.id)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
     return user
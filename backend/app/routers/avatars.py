@@ -0,0 +1,18 @@
+from fastapi import APIRouter, HTTPException, Request, Response
+from .. import avatars
+from ..assets import IMMUTABLE
+from ..httpcache import etag_matches
+
+router = APIRouter(prefix="/avatars", tags=["avatars"])
+
+@router.get("/{username:path}.svg")
+async def avatar(username: str, request: Request):
+    # any name renders: the SVG only carries a hash of it, and nothing is stored. Accounts
+    # from before USERNAME_PATTERN may contain other characters, even "/"
+    if not username or len(username) > avatars.MAX_NAME:
+        raise HTTPException(status_code=404, detail="Not found")
+    body, etag = avatars.get(username)
+    headers = {"etag": etag, "cache-control": IMMUTABLE}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="image/svg+xml", headers=headers)
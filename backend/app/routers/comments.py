@@ -1,40 +1,56 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from ..db import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from ..config import settings
+from ..db import get_async_db
 from ..models import Post, Comment, User
-from ..schemas import CommentCreate, CommentPublic
+from ..usercache import CurrentUser
+from ..schemas import CommentCreate, CommentPublic, CommentPage
+from ..pagination import paginate, DEFAULT_LIMIT, MAX_LIMIT
 from ..deps import get_current_user
+from ..httpcache import conditional_json, make_etag, micro_cache
+from .. import interactions
 
 router = APIRouter(prefix="/api/comments", tags=["comments"])
 
-@router.get("/post/{post_id}", response_model=list[CommentPublic])
-def list_comments(post_id: int, db: Session = Depends(get_db), me: User = Depends(get_current_user)):
-    if not db.query(Post).filter(Post.id == post_id).first():
+@router.get("/post/{post_id}", response_model=CommentPage)
+@micro_cache(settings.comments_cache_seconds)
+async def list_comments(
+    post_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
+    cursor: str | None = None,
+    limit: int = Query(default=DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+):
+    post = await db.get(Post, post_id)
+    if not post:
         raise HTTPException(status_code=404, detail="Post not found")
-    comments = db.query(Comment).filter(Comment.post_id == post_id).order_by(desc(Comment.created_at)).all()
-    for c in comments:
-        _ = c.author
-    return comments
+
+    async def render():
+        stmt = select(Comment).options(joinedload(Comment.author)).where(Comment.post_id == post_id)
+        comments, next_cursor = await paginate(db, stmt, Comment, cursor, limit)
+        return CommentPage.model_validate({"items": comments, "next_cursor": next_cursor}, from_attributes=True).model_dump_json()
+
+    # adding or deleting a comment bumps the post's version
+    return await conditional_json(request, make_etag("comments", post.id, post.version, cursor, limit), render)
 
 @router.post("/post/{post_id}", response_model=CommentPublic, status_code=201)
-def add_comment(post_id: int, payload: CommentCreate, db: Session = Depends(get_db), me: User = Depends(get_current_user)):
-    if not db.query(Post).filter(Post.id == post_id).first():
+async def add_comment(post_id: int, payload: CommentCreate, db: AsyncSession = Depends(get_async_db), me: CurrentUser = Depends(get_current_user)):
+    if not await db.get(Post, post_id):
         raise HTTPException(status_code=404, detail="Post not found")
-    c = Comment(post_id=post_id, author_id=me.id, text=payload.text)
-    db.add(c)
-    db.commit()
-    db.refresh(c)
-    c.author = me
+    c = await interactions.apply(db, interactions.add_comment, post_id, me.id, payload.text)
+    await db.refresh(c)
+    c.author = await db.get(User, me.id)
     return c
 
 @router.delete("/{comment_id}", status_code=204)
-def delete_comment(comment_id: int, db: Session = Depends(get_db), me: User = Depends(get_current_user)):
-    c = db.query(Comment).filter(Comment.id == comment_id).first()
+async def delete_comment(comment_id: int, db: AsyncSession = Depends(get_async_db), me: CurrentUser = Depends(get_current_user)):
+    c = await db.get(Comment, comment_id)
     if not c:
         return
     if c.author_id != me.id and not me.is_admin:
         raise HTTPException(status_code=403, detail="Not allowed")
-    db.delete(c)
-    db.commit()
+    await interactions.apply(db, interactions.delete_comment, c)
     return
@@ -1,23 +1,30 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from ..db import get_db
-from ..models import Post, Like, User
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..db import get_async_db
+from ..models import Post
+from ..schemas import PostIds, BatchResult
+from ..usercache import CurrentUser
 from ..deps import get_current_user
+from .. import interactions
 
 router = APIRouter(prefix="/api/likes", tags=["likes"])
 
 @router.post("/post/{post_id}", status_code=204)
-def like(post_id: int, db: Session = Depends(get_db), me: User = Depends(get_current_user)):
-    if not db.query(Post).filter(Post.id == post_id).first():
+async def like(post_id: int, db: AsyncSession = Depends(get_async_db), me: CurrentUser = Depends(get_current_user)):
+    # one guarded insert; only look the post up when nothing was inserted
+    if not await interactions.apply(db, interactions.like, post_id, me.id) and not await db.get(Post, post_id):
         raise HTTPException(status_code=404, detail="Post not found")
-    exists = db.query(Like).filter(Like.post_id == post_id, Like.user_id == me.id).first()
-    if not exists:
-        db.add(Like(post_id=post_id, user_id=me.id))
-        db.commit()
     return
 
 @router.post("/post/{post_id}/unlike", status_code=204)
-def unlike(post_id: int, db: Session = Depends(get_db), me: User = Depends(get_current_user)):
-    db.query(Like).filter(Like.post_id == post_id, Like.user_id == me.id).delete()
-    db.commit()
+async def unlike(post_id: int, db: AsyncSession = Depends(get_async_db), me: CurrentUser = Depends(get_current_user)):
+    await interactions.apply(db, interactions.unlike, post_id, me.id)
     return
+
+@router.post("/batch", response_model=BatchResult)
+async def like_many(payload: PostIds, db: AsyncSession = Depends(get_async_db), me: CurrentUser = Depends(get_current_user)):
+    return {"changed": await interactions.apply(db, interactions.like_many, payload.post_ids, me.id)}
+
+@router.post("/batch/unlike", response_model=BatchResult)
+async def unlike_many(payload: PostIds, db: AsyncSession = Depends(get_async_db), me: CurrentUser = Depends(get_current_user)):
+    return {"changed": await interactions.apply(db, interactions.unlike_many, payload.post_ids, me.id)}
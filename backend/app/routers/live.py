@@ -0,0 +1,65 @@
+import asyncio
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
+from sqlalchemy import select
+from ..db import open_session
+from ..deps import token_from_cookie, user_for_token
+from ..models import Follow
+from ..usercache import CurrentUser
+from .. import events
+
+router = APIRouter(tags=["live"])
+
+# how long a client without a session cookie has to send its auth message
+AUTH_TIMEOUT = 5.0
+
+async def _send(websocket: WebSocket, sub: events.Subscription):
+    while True:
+        await websocket.send_json(await sub.next())
+
+async def _user(websocket: WebSocket, token: str | None) -> CurrentUser | None:
+    if not token:
+        return None
+    try:
+        return await user_for_token(websocket, token)
+    except (HTTPException, ValueError):
+        return None
+
+async def _token_from_first_message(websocket: WebSocket) -> str | None:
+    try:
+        message = await asyncio.wait_for(websocket.receive_json(), AUTH_TIMEOUT)
+    except (asyncio.TimeoutError, WebSocketDisconnect, KeyError, ValueError):
+        return None
+    if isinstance(message, dict) and message.get("type") == "auth" and isinstance(message.get("token"), str):
+        return message["token"]
+    return None
+
+@router.websocket("/ws/feed")
+async def feed_socket(websocket: WebSocket):
+    """Pushes batches of feed events (see events.py) as JSON arrays.
+
+    Pages are authenticated by their session cookie. Other clients send
+    {"type": "auth", "token": "<jwt>"} as their first message, which keeps tokens out of
+    URLs and access logs. Nothing else clients send is read.
+    """
+    me = await _user(websocket, token_from_cookie(websocket.cookies.get("access_token")))
+    if me is None:
+        await websocket.accept()
+        me = await _user(websocket, await _token_from_first_message(websocket))
+        if me is None:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+    async with open_session(websocket) as db:
+        following = (await db.scalars(select(Follow.following_id).where(Follow.follower_id == me.id))).all()
+
+    if websocket.client_state.name == "CONNECTING":
+        await websocket.accept()
+    sub = events.bus.subscribe(me.id, following)
+    # a slow client only blocks its own sender; meanwhile its events coalesce in `sub`
+    sender = asyncio.create_task(_send(websocket, sub))
+    try:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        sender.cancel()
+        events.bus.unsubscribe(sub)
@@ -1,96 +1,103 @@
 from __future__ import annotations
 
+import re
+import time
+from typing import Literal
+
 from fastapi import APIRouter, Depends, Request, Form, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
-
-from ..db import get_db
-from ..models import Post, Like, Comment, Follow, User
-from ..deps import get_current_user
-from ..auth import hash_password, verify_password, create_access_token, decode_access_token
+from markupsafe import Markup
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from sqlalchemy import desc, func, select, update
+
+from ..config import settings
+from ..db import get_async_db, open_session
+from ..models import Post, Follow, User
+from ..deps import get_current_user, token_from_cookie, user_for_token
+from ..auth import create_access_token
+from ..usercache import CurrentUser
+from ..schemas import USERNAME_PATTERN
+from ..assets import static_url
+from ..hydrate import liked_ids, image_url, image_srcset, image_pending
+from ..pagination import paginate, decode_offset, split_offset_page, DEFAULT_LIMIT
+from .. import avatars, fragments, hashing, interactions, ranking, timeline
 
 templates = Jinja2Templates(directory="app/templates")
+templates.env.globals.update(static_url=static_url, image_url=image_url, image_srcset=image_srcset, image_pending=image_pending)
 router = APIRouter(tags=["pages"])
 
 
 def avatar(username: str) -> str:
-    # External service (Lab 2 requirement): DiceBear avatar generator
-    return f"https://api.dicebear.com/8.x/thumbs/svg?seed={username}"
+    # generated locally (identicon), see avatars.py
+    return avatars.url(username)
 
 
 def _redirect(url: str) -> RedirectResponse:
     return RedirectResponse(url=url, status_code=303)
 
 
-def _token_from_cookie(request: Request) -> str | None:
-    raw = request.cookies.get("access_token")
-    if not raw:
-        return None
-    parts = raw.split(" ", 1)
-    if len(parts) == 2 and parts[0].lower() == "bearer":
-        return parts[1]
-    return raw
-
-
-def get_me_optional(request: Request, db: Session) -> User | None:
-    token = _token_from_cookie(request)
+async def get_me_optional(request: Request) -> CurrentUser | None:
+    # no cookie, no session: anonymous page views don't touch the database for this
+    token = token_from_cookie(request.cookies.get("access_token"))
     if not token:
         return None
     try:
-        user_id = int(decode_access_token(token))
-    except Exception:
+        return await user_for_token(request, token)
+    except (HTTPException, ValueError):
         return None
-    return db.get(User, user_id)
+
+
+async def _render_home(request: Request, me: CurrentUser | None) -> str:
+    async with open_session(request) as db:
+        posts = (
+            await db.scalars(select(Post).options(joinedload(Post.author)).order_by(desc(Post.created_at)).limit(3))
+        ).all()
+        return templates.get_template("index.html").render(request=request, posts=posts, avatar=avatar, me=me)
 
 
 @router.get("/", response_class=HTMLResponse)
-def home(request: Request, db: Session = Depends(get_db)):
-    posts = db.query(Post).order_by(desc(Post.created_at)).limit(20).all()
-    for p in posts:
-        _ = p.author
-    me = get_me_optional(request, db)
-    return templates.TemplateResponse(
-        "index.html",
-        {"request": request, "posts": posts, "avatar": avatar, "me": me},
-    )
+async def home(request: Request, me: CurrentUser | None = Depends(get_me_optional)):
+    if me is not None:
+        return HTMLResponse(await _render_home(request, me))
+    # anonymous visitors all get the same page: serve it from the fragment cache, no session
+    html = fragments.cache.get(fragments.LANDING, "")
+    if html is None:
+        started = time.perf_counter()
+        html = await _render_home(request, None)
+        fragments.cache.put(fragments.LANDING, "", html, settings.landing_cache_seconds, time.perf_counter() - started)
+    return HTMLResponse(html)
+
+
+def _post_cards(posts: list[Post], author: User) -> list[Markup]:
+    card = templates.get_template("_post_card.html")
+    return [
+        Markup(fragments.cache.get_or_render("post", f"{p.id}:{p.version}", lambda p=p: card.render(p=p, author=author, avatar=avatar)))
+        for p in posts
+    ]
 
 
 @router.get("/about", response_class=HTMLResponse)
-def about(request: Request, db: Session = Depends(get_db)):
-    me = get_me_optional(request, db)
+async def about(request: Request, me: CurrentUser | None = Depends(get_me_optional)):
     return templates.TemplateResponse("about.html", {"request": request, "me": me})
 
 
 @router.get("/app", response_class=HTMLResponse)
-def app_feed(
+async def app_feed(
     request: Request,
-    db: Session = Depends(get_db),
-    me: User = Depends(get_current_user),
+    cursor: str | None = None,
+    mode: Literal["latest", "ranked"] = "latest",
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
 ):
-    following_ids = [x[0] for x in db.query(Follow.following_id).filter(Follow.follower_id == me.id).all()]
-    ids = set(following_ids + [me.id])
-
-    posts = (
-        db.query(Post)
-        .filter(Post.author_id.in_(ids))
-        .order_by(desc(Post.created_at))
-        .limit(50)
-        .all()
-    )
-    for p in posts:
-        _ = p.author
-
-    like_map = {
-        pid: c
-        for pid, c in db.query(Like.post_id, func.count(Like.post_id)).group_by(Like.post_id).all()
-    }
-    comment_map = {
-        pid: c
-        for pid, c in db.query(Comment.post_id, func.count(Comment.post_id)).group_by(Comment.post_id).all()
-    }
-    liked_set = set([x[0] for x in db.query(Like.post_id).filter(Like.user_id == me.id).all()])
+    options = (joinedload(Post.author),)
+    if mode == "ranked":
+        offset = decode_offset(cursor)
+        posts, next_cursor = split_offset_page(await db.run_sync(ranking.ranked_page, me.id, offset, 50, options), offset, 50)
+    else:
+        posts, next_cursor = await db.run_sync(timeline.page, me.id, cursor, 50, options)
+    liked_set = await db.run_sync(liked_ids, [p.id for p in posts], me.id)
 
     return templates.TemplateResponse(
         "feed.html",
@@ -98,35 +105,29 @@ def app_feed(
             "request": request,
             "me": me,
             "posts": posts,
+            "next_cursor": next_cursor,
+            "mode": mode,
             "avatar": avatar,
-            "like_map": like_map,
-            "comment_map": comment_map,
             "liked_set": liked_set,
         },
     )
 
 
 @router.get("/profile/{username}", response_class=HTMLResponse)
-def profile(
+async def profile(
     username: str,
     request: Request,
-    db: Session = Depends(get_db),
-    me: User = Depends(get_current_user),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
 ):
-    user = db.query(User).filter(User.username == username).first()
+    user = await db.scalar(select(User).where(User.username == username))
     if not user:
         return _redirect("/")
 
-    posts = db.query(Post).filter(Post.author_id == user.id).order_by(desc(Post.created_at)).all()
-    follows = (
-        db.query(Follow)
-        .filter(Follow.follower_id == me.id, Follow.following_id == user.id)
-        .first()
-        is not None
-    )
-
-    follower_count = db.query(func.count(Follow.follower_id)).filter(Follow.following_id == user.id).scalar() or 0
-    following_count = db.query(func.count(Follow.following_id)).filter(Follow.follower_id == user.id).scalar() or 0
+    posts, next_cursor = await paginate(db, select(Post).where(Post.author_id == user.id), Post, cursor, DEFAULT_LIMIT)
+    posts_count = await db.scalar(select(func.count(Post.id)).where(Post.author_id == user.id)) or 0
+    follows = await db.get(Follow, (me.id, user.id)) is not None
 
     return templates.TemplateResponse(
         "profile.html",
@@ -134,37 +135,48 @@ def profile(
             "request": request,
             "me": me,
             "user": user,
-            "posts": posts,
+            "cards": _post_cards(posts, user),
+            "posts_count": posts_count,
+            "next_cursor": next_cursor,
             "avatar": avatar,
             "follows": follows,
-            "follower_count": int(follower_count),
-            "following_count": int(following_count),
+            "follower_count": user.followers_count,
+            "following_count": user.following_count,
         },
     )
 
 
 @router.get("/login", response_class=HTMLResponse)
-def login_page(request: Request, db: Session = Depends(get_db)):
-    me = get_me_optional(request, db)
+async def login_page(request: Request, me: CurrentUser | None = Depends(get_me_optional)):
     if me:
         return _redirect("/app")
     return templates.TemplateResponse("login.html", {"request": request, "error": None})
 
 
 @router.post("/login", response_class=HTMLResponse)
-def login_submit(
+async def login_submit(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     username = (username or "").strip()
-    user = db.query(User).filter(User.username == username).first()
+    user = (await db.execute(select(User.id, User.hashed_password).where(User.username == username))).first()
+    await db.rollback()  # don't hold a pooled connection while hashing
 
-    if not user or not verify_password(password, user.hashed_password):
+    try:
+        valid, new_hash = await hashing.verify_and_update(password, user.hashed_password) if user else (False, None)
+    except hashing.PoolBusy as exc:
+        return templates.TemplateResponse(
+            "login.html", {"request": request, "error": "Server is busy, please try again."}, status_code=429, headers=exc.headers
+        )
+    if not valid:
         return templates.TemplateResponse(
             "login.html", {"request": request, "error": "Invalid username or password."}, status_code=400
         )
+    if new_hash:
+        await db.execute(update(User).where(User.id == user.id).values(hashed_password=new_hash))
+        await db.commit()
 
     token = create_access_token(subject=str(user.id))
     resp = _redirect("/app")
@@ -181,20 +193,19 @@ def login_submit(
 
 
 @router.get("/register", response_class=HTMLResponse)
-def register_page(request: Request, db: Session = Depends(get_db)):
-    me = get_me_optional(request, db)
+async def register_page(request: Request, me: CurrentUser | None = Depends(get_me_optional)):
     if me:
         return _redirect("/app")
     return templates.TemplateResponse("register.html", {"request": request, "error": None})
 
 
 @router.post("/register", response_class=HTMLResponse)
-def register_submit(
+async def register_submit(
     request: Request,
     username: str = Form(...),
     email: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     username = (username or "").strip()
     email = (email or "").strip().lower()
@@ -202,29 +213,41 @@ def register_submit(
     if len(username) < 3:
         return templates.TemplateResponse("register.html", {"request": request, "error": "Username too short."}, status_code=400)
 
+    if not re.fullmatch(USERNAME_PATTERN, username):
+        return templates.TemplateResponse(
+            "register.html", {"request": request, "error": "Usernames are up to 32 letters, digits or underscores."}, status_code=400
+        )
+
     if "@" not in email or "." not in email:
         return templates.TemplateResponse("register.html", {"request": request, "error": "Invalid email."}, status_code=400)
 
     if len(password) < 6:
         return templates.TemplateResponse("register.html", {"request": request, "error": "Password too short."}, status_code=400)
 
-    if db.query(User).filter(User.username == username).first():
+    if await db.scalar(select(User).where(User.username == username)):
         return templates.TemplateResponse("register.html", {"request": request, "error": "Username already exists."}, status_code=400)
 
-    if db.query(User).filter(User.email == email).first():
+    if await db.scalar(select(User).where(User.email == email)):
         return templates.TemplateResponse("register.html", {"request": request, "error": "Email already exists."}, status_code=400)
 
+    await db.rollback()  # don't hold a pooled connection while hashing
+    try:
+        hashed_password = await hashing.hash_password(password)
+    except hashing.PoolBusy as exc:
+        return templates.TemplateResponse(
+            "register.html", {"request": request, "error": "Server is busy, please try again."}, status_code=429, headers=exc.headers
+        )
     user = User(
         username=username,
         email=email,
-        hashed_password=hash_password(password),
+        hashed_password=hashed_password,
         is_admin=False,
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
 
-    token = create_access_token(sub=str(user.id))
+    token = create_access_token(str(user.id))
     resp = RedirectResponse(url="/app", status_code=303)
     resp.set_cookie("access_token", token, httponly=True, samesite="lax", secure=False, max_age=60 * 60 * 24, path="/")
     return resp
@@ -232,110 +255,94 @@ def register_submit(
 
 
 @router.post("/logout")
-def logout():
+async def logout():
     resp = _redirect("/")
     resp.delete_cookie("access_token", path="/")
     return resp
 
 
 @router.post("/actions/post")
-def create_post(
+async def create_post(
     caption: str = Form(default=""),
     image_url: str = Form(default=""),
-    db: Session = Depends(get_db),
-    me: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
 ):
     caption = (caption or "").strip()
     image_url = (image_url or "").strip()
 
     if len(caption) > 2000:
         raise HTTPException(status_code=400, detail="Caption too long")
+    # only links to images elsewhere; uploads go through /api/posts
+    if image_url and (not image_url.lower().startswith(("http://", "https://")) or len(image_url) > 255):
+        raise HTTPException(status_code=400, detail="Image URL must be an http(s) link")
 
     p = Post(author_id=me.id, caption=caption, image_path=image_url or None)
-    db.add(p)
-    db.commit()
+    await interactions.apply(db, interactions.publish, p)
     return _redirect("/app")
 
 
 @router.post("/actions/like/{post_id}")
-def like_post(
+async def like_post(
     post_id: int,
-    db: Session = Depends(get_db),
-    me: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
 ):
-    post = db.get(Post, post_id)
-    if not post:
-        return _redirect("/app")
-
-    existing = db.query(Like).filter(Like.user_id == me.id, Like.post_id == post_id).first()
-    if not existing:
-        db.add(Like(user_id=me.id, post_id=post_id))
-        db.commit()
+    # a missing post or a repeated like simply changes nothing
+    await interactions.apply(db, interactions.like, post_id, me.id)
     return _redirect("/app")
 
 
 @router.post("/actions/unlike/{post_id}")
-def unlike_post(
+async def unlike_post(
     post_id: int,
-    db: Session = Depends(get_db),
-    me: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
 ):
-    db.query(Like).filter(Like.user_id == me.id, Like.post_id == post_id).delete()
-    db.commit()
+    await interactions.apply(db, interactions.unlike, post_id, me.id)
     return _redirect("/app")
 
 
 @router.post("/actions/comment/{post_id}")
-def add_comment(
+async def add_comment(
     post_id: int,
     text: str = Form(default=""),
-    db: Session = Depends(get_db),
-    me: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
 ):
     text = (text or "").strip()
     if not text:
         return _redirect("/app")
     if len(text) > 500:
         raise HTTPException(status_code=400, detail="Comment too long")
-    post = db.get(Post, post_id)
+    post = await db.get(Post, post_id)
     if not post:
         return _redirect("/app")
-    db.add(Comment(author_id=me.id, post_id=post_id, text=text))
-    db.commit()
+    await interactions.apply(db, interactions.add_comment, post_id, me.id, text)
     return _redirect("/app")
 
 
 @router.post("/actions/follow/{username}")
-def follow_user(
+async def follow_user(
     username: str,
-    db: Session = Depends(get_db),
-    me: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
 ):
-    user = db.query(User).filter(User.username == username).first()
-    if not user or user.id == me.id:
-        return _redirect(f"/profile/{username}")
-
-    existing = (
-        db.query(Follow)
-        .filter(Follow.follower_id == me.id, Follow.following_id == user.id)
-        .first()
-    )
-    if not existing:
-        db.add(Follow(follower_id=me.id, following_id=user.id))
-        db.commit()
+    user_id = await db.scalar(select(User.id).where(User.username == username))
+    if user_id and user_id != me.id:
+        await interactions.apply(db, interactions.follow, me.id, user_id)
     return _redirect(f"/profile/{username}")
 
 
 @router.post("/actions/unfollow/{username}")
-def unfollow_user(
+async def unfollow_user(
     username: str,
-    db: Session = Depends(get_db),
-    me: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
 ):
-    user = db.query(User).filter(User.username == username).first()
+    user = await db.scalar(select(User).where(User.username == username))
     if not user:
         return _redirect("/app")
 
-    db.query(Follow).filter(Follow.follower_id == me.id, Follow.following_id == user.id).delete()
-    db.commit()
+    await interactions.apply(db, interactions.unfollow, me.id, user.id)
     return _redirect(f"/profile/{username}")
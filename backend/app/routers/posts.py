@@ -1,99 +1,121 @@
-import os
-import uuid
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
-from ..db import get_db
-from ..models import Post, User, Like, Comment, Follow
-from ..schemas import PostPublic
-from ..deps import get_current_user
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, UploadFile, File, Form, Query
+from typing import Literal
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..config import settings
-
-UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "..", "static", "uploads")
+from ..db import get_async_db
+from ..models import Post
+from ..usercache import CurrentUser
+from ..schemas import PostPublic, FeedResponse, MAX_BATCH
+from ..deps import get_current_user
+from ..hydrate import posts_to_public
+from ..pagination import paginate, decode_offset, split_offset_page, DEFAULT_LIMIT, MAX_LIMIT
+from ..httpcache import conditional_json, make_etag
+from .. import images, interactions, ranking, timeline, uploads
 
 router = APIRouter(prefix="/api/posts", tags=["posts"])
 
-def _post_to_public(db: Session, post: Post, me_id: int | None) -> PostPublic:
-    image_url = f"/static/uploads/{post.image_path}" if post.image_path else None
-    likes_count = db.query(func.count(Like.post_id)).filter(Like.post_id == post.id).scalar() or 0
-    comments_count = db.query(func.count(Comment.post_id)).filter(Comment.post_id == post.id).scalar() or 0
-    liked_by_me = False
-    if me_id:
-        liked_by_me = db.query(Like).filter(Like.post_id == post.id, Like.user_id == me_id).first() is not None
-    return PostPublic(
-        id=post.id,
-        caption=post.caption,
-        image_url=image_url,
-        created_at=post.created_at,
-        author=post.author,
-        likes_count=likes_count,
-        comments_count=comments_count,
-        liked_by_me=liked_by_me,
-    )
-
 @router.post("", response_model=PostPublic, status_code=201)
-def create_post(
+async def create_post(
+    background_tasks: BackgroundTasks,
     caption: str = Form(default=""),
     image: UploadFile | None = File(default=None),
-    db: Session = Depends(get_db),
-    me: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
 ):
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    filename = None
+    filename = spare = None
     if image:
-        if image.content_type not in {"image/png", "image/jpeg", "image/webp"}:
-            raise HTTPException(status_code=400, detail="Only PNG/JPEG/WEBP images allowed")
-        ext = {"image/png": ".png", "image/jpeg": ".jpg", "image/webp": ".webp"}[image.content_type]
-        filename = f"{uuid.uuid4().hex}{ext}"
-        out_path = os.path.join(UPLOAD_DIR, filename)
-        with open(out_path, "wb") as f:
-            f.write(image.file.read())
+        filename, spare = await run_in_threadpool(uploads.save_image, image.file, settings.max_upload_bytes)
 
     post = Post(author_id=me.id, caption=caption, image_path=filename)
-    db.add(post)
-    db.commit()
-    db.refresh(post)
-    post.author = me
-    return _post_to_public(db, post, me.id)
+    try:
+        await interactions.apply(db, interactions.publish, post)
+    except BaseException:
+        uploads.discard(spare)
+        if filename and spare is None:
+            # this request stored the file and no blob row counts it: remove it, unless a
+            # post with the same image was committed meanwhile (purge_blob checks)
+            await db.rollback()
+            await interactions.apply(db, interactions.purge_blob, filename)
+        raise
+    await run_in_threadpool(uploads.keep_image, filename, spare)
+    images.schedule(background_tasks, post)
+    return (await db.run_sync(posts_to_public, [post], me.id))[0]
+
+@router.get("/batch", response_model=list[PostPublic])
+async def get_posts(
+    ids: list[int] = Query(min_length=1, max_length=MAX_BATCH),
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
+):
+    """Posts by id, in the order asked for; unknown ids are left out."""
+    by_id = {p.id: p for p in await db.scalars(select(Post).where(Post.id.in_(ids)))}
+    posts = [by_id[i] for i in dict.fromkeys(ids) if i in by_id]
+    return await db.run_sync(posts_to_public, posts, me.id)
+
+@router.get("/explore", response_model=FeedResponse)
+async def explore(
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
+    cursor: str | None = None,
+    limit: int = Query(default=DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+):
+    """Site-wide trending posts; the cursor is an offset."""
+    offset = decode_offset(cursor)
+    posts, next_cursor = split_offset_page(await db.run_sync(ranking.trending, offset, limit), offset, limit)
+    return FeedResponse(items=await db.run_sync(posts_to_public, posts, me.id), next_cursor=next_cursor)
 
 @router.get("/{post_id}", response_model=PostPublic)
-def get_post(post_id: int, db: Session = Depends(get_db), me: User = Depends(get_current_user)):
-    post = db.query(Post).filter(Post.id == post_id).first()
+async def get_post(post_id: int, request: Request, db: AsyncSession = Depends(get_async_db), me: CurrentUser = Depends(get_current_user)):
+    post = await db.get(Post, post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
-    return _post_to_public(db, post, me.id)
+
+    async def render():
+        return (await db.run_sync(posts_to_public, [post], me.id))[0].model_dump_json()
+
+    # version changes with every like/comment, which covers liked_by_me for this viewer too
+    return await conditional_json(request, make_etag("post", post.id, post.version, me.id), render)
 
 @router.delete("/{post_id}", status_code=204)
-def delete_post(post_id: int, db: Session = Depends(get_db), me: User = Depends(get_current_user)):
-    post = db.query(Post).filter(Post.id == post_id).first()
+async def delete_post(post_id: int, db: AsyncSession = Depends(get_async_db), me: CurrentUser = Depends(get_current_user)):
+    post = await db.get(Post, post_id)
     if not post:
         return
     if post.author_id != me.id and not me.is_admin:
         raise HTTPException(status_code=403, detail="Not allowed")
-    if post.image_path:
-        try:
-            os.remove(os.path.join(UPLOAD_DIR, post.image_path))
-        except FileNotFoundError:
-            pass
-    db.delete(post)
-    db.commit()
+    orphan = await interactions.apply(db, interactions.delete_post, post)
+    if orphan:
+        await interactions.apply(db, interactions.purge_blob, orphan)
     return
 
-@router.get("", response_model=list[PostPublic])
-def list_my_posts(db: Session = Depends(get_db), me: User = Depends(get_current_user)):
-    posts = db.query(Post).filter(Post.author_id == me.id).order_by(desc(Post.created_at)).all()
-    for p in posts:
-        _ = p.author
-    return [_post_to_public(db, p, me.id) for p in posts]
+@router.get("", response_model=FeedResponse)
+async def list_my_posts(
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
+    cursor: str | None = None,
+    limit: int = Query(default=DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+):
+    posts, next_cursor = await paginate(db, select(Post).where(Post.author_id == me.id), Post, cursor, limit)
+    return FeedResponse(items=await db.run_sync(posts_to_public, posts, me.id), next_cursor=next_cursor)
 
-@router.get("/feed/me", response_model=list[PostPublic])
-def feed(db: Session = Depends(get_db), me: User = Depends(get_current_user), limit: int = 30):
-    following_ids = [x[0] for x in db.query(Follow.following_id).filter(Follow.follower_id == me.id).all()]
-    ids = set(following_ids + [me.id])
-    q = db.query(Post).filter(Post.author_id.in_(ids)).order_by(desc(Post.created_at)).limit(limit)
-    posts = q.all()
-    if not posts:
-        posts = db.query(Post).order_by(desc(Post.created_at)).limit(limit).all()
-    for p in posts:
-        _ = p.author
-    return [_post_to_public(db, p, me.id) for p in posts]
+@router.get("/feed/me", response_model=FeedResponse)
+async def feed(
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
+    cursor: str | None = None,
+    limit: int = Query(default=DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    mode: Literal["latest", "ranked"] = "latest",
+):
+    """Home feed, newest first or (`mode=ranked`) by engagement; ranked cursors are offsets."""
+    if await db.run_sync(timeline.is_empty, me.id):
+        # nothing from followed accounts (or the viewer) at all: fall back to site-wide trending posts
+        offset = decode_offset(cursor)
+        posts, next_cursor = split_offset_page(await db.run_sync(ranking.trending, offset, limit), offset, limit)
+    elif mode == "ranked":
+        offset = decode_offset(cursor)
+        posts, next_cursor = split_offset_page(await db.run_sync(ranking.ranked_page, me.id, offset, limit), offset, limit)
+    else:
+        posts, next_cursor = await db.run_sync(timeline.page, me.id, cursor, limit)
+    return FeedResponse(items=await db.run_sync(posts_to_public, posts, me.id), next_cursor=next_cursor)
@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..db import get_async_db
+from ..usercache import CurrentUser
+from ..schemas import CommentSearchPage, FeedResponse, SearchResults, UserBrief
+from ..deps import get_current_user
+from ..hydrate import posts_to_public
+from ..pagination import decode_offset, split_offset_page, DEFAULT_LIMIT, MAX_LIMIT
+from .. import search
+
+router = APIRouter(prefix="/api/search", tags=["search"])
+
+Q = Query(min_length=1, max_length=200)
+PREVIEW = 5
+
+@router.get("", response_model=SearchResults)
+async def search_all(q: str = Q, db: AsyncSession = Depends(get_async_db), me: CurrentUser = Depends(get_current_user)):
+    """The top few posts, comments and users; page through one kind with the endpoints below."""
+    posts = await db.run_sync(search.posts, q, 0, PREVIEW)
+    return {
+        "posts": await db.run_sync(posts_to_public, posts, me.id),
+        "comments": await db.run_sync(search.comments, q, 0, PREVIEW),
+        "users": await db.run_sync(search.users, q, PREVIEW),
+    }
+
+@router.get("/posts", response_model=FeedResponse)
+async def search_posts(
+    q: str = Q,
+    cursor: str | None = None,
+    limit: int = Query(default=DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
+):
+    offset = decode_offset(cursor)
+    posts, next_cursor = split_offset_page(await db.run_sync(search.posts, q, offset, limit + 1), offset, limit)
+    return FeedResponse(items=await db.run_sync(posts_to_public, posts, me.id), next_cursor=next_cursor)
+
+@router.get("/comments", response_model=CommentSearchPage)
+async def search_comments(
+    q: str = Q,
+    cursor: str | None = None,
+    limit: int = Query(default=DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
+):
+    offset = decode_offset(cursor)
+    comments, next_cursor = split_offset_page(await db.run_sync(search.comments, q, offset, limit + 1), offset, limit)
+    return {"items": comments, "next_cursor": next_cursor}
+
+@router.get("/users", response_model=list[UserBrief])
+async def search_users(
+    q: str = Q,
+    limit: int = Query(default=10, ge=1, le=MAX_LIMIT),
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
+):
+    """Username autocomplete (prefix match)."""
+    return await db.run_sync(search.users, q, limit)
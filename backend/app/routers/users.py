@@ -1,38 +1,98 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from ..db import get_db
-from ..models import User, Post, Follow
-from ..schemas import UserPublic
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from ..db import get_async_db
+from ..models import User
+from ..usercache import CurrentUser
+from ..schemas import UserBrief, Usernames, BatchResult, Suggestion, Mutuals, MAX_BATCH
 from ..deps import get_current_user
+from ..httpcache import conditional_json, make_etag, micro_cache
+from ..graph import graph
+from ..pagination import MAX_LIMIT
+from .. import interactions
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
-@router.get("/{username}", response_model=UserPublic)
-def get_user(username: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == username).first()
+@router.get("", response_model=list[UserBrief])
+async def get_users(
+    ids: list[int] = Query(min_length=1, max_length=MAX_BATCH),
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
+):
+    """Users by id, in the order asked for; unknown ids are left out."""
+    by_id = {u.id: u for u in await db.scalars(select(User).where(User.id.in_(ids)))}
+    return [by_id[i] for i in dict.fromkeys(ids) if i in by_id]
+
+# publicly cacheable, so no email (the signed-in user's own is on /api/auth/me)
+@router.get("/{username}", response_model=UserBrief)
+@micro_cache(settings.users_cache_seconds)
+async def get_user(username: str, request: Request, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.username == username))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    etag = make_etag("user", user.id, user.username, user.is_admin)
+    return await conditional_json(
+        request, etag, lambda: UserBrief.model_validate(user).model_dump_json(),
+        cache_control=f"public, max-age={int(settings.users_cache_seconds)}",
+    )
 
 @router.post("/{username}/follow", status_code=204)
-def follow(username: str, db: Session = Depends(get_db), me: User = Depends(get_current_user)):
-    target = db.query(User).filter(User.username == username).first()
-    if not target:
+async def follow(username: str, db: AsyncSession = Depends(get_async_db), me: CurrentUser = Depends(get_current_user)):
+    target_id = await db.scalar(select(User.id).where(User.username == username))
+    if not target_id:
         raise HTTPException(status_code=404, detail="User not found")
-    if target.id == me.id:
+    if target_id == me.id:
         raise HTTPException(status_code=400, detail="Cannot follow yourself")
-    exists = db.query(Follow).filter(Follow.follower_id == me.id, Follow.following_id == target.id).first()
-    if not exists:
-        db.add(Follow(follower_id=me.id, following_id=target.id))
-        db.commit()
+    await interactions.apply(db, interactions.follow, me.id, target_id)
     return
 
+@router.post("/follow", response_model=BatchResult)
+async def follow_many(payload: Usernames, db: AsyncSession = Depends(get_async_db), me: CurrentUser = Depends(get_current_user)):
+    """Follow several users at once (e.g. from suggestions); unknown names and yourself are skipped."""
+    ids = list(await db.scalars(select(User.id).where(User.username.in_(payload.usernames))))
+    if not ids:
+        return {"changed": []}
+    return {"changed": await interactions.apply(db, interactions.follow_many, me.id, ids)}
+
 @router.post("/{username}/unfollow", status_code=204)
-def unfollow(username: str, db: Session = Depends(get_db), me: User = Depends(get_current_user)):
-    target = db.query(User).filter(User.username == username).first()
+async def unfollow(username: str, db: AsyncSession = Depends(get_async_db), me: CurrentUser = Depends(get_current_user)):
+    target = await db.scalar(select(User).where(User.username == username))
     if not target:
         raise HTTPException(status_code=404, detail="User not found")
-    db.query(Follow).filter(Follow.follower_id == me.id, Follow.following_id == target.id).delete()
-    db.commit()
+    await interactions.apply(db, interactions.unfollow, me.id, target.id)
     return
+
+async def _user_id(db: AsyncSession, username: str) -> int:
+    user_id = await db.scalar(select(User.id).where(User.username == username))
+    if not user_id:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user_id
+
+async def _users_by_id(db: AsyncSession, ids: list[int]) -> list[User]:
+    by_id = {u.id: u for u in await db.scalars(select(User).where(User.id.in_(ids)))} if ids else {}
+    return [by_id[i] for i in ids if i in by_id]
+
+@router.get("/{username}/suggestions", response_model=list[Suggestion])
+async def suggestions(
+    username: str,
+    limit: int = Query(default=10, ge=1, le=MAX_LIMIT),
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
+):
+    """Who to follow: accounts followed by the people this user follows."""
+    ranked = await run_in_threadpool(graph.suggestions, await _user_id(db, username), limit)
+    users = {u.id: u for u in await _users_by_id(db, [user_id for user_id, _ in ranked])}
+    return [{"user": users[user_id], "followed_by": n} for user_id, n in ranked if user_id in users]
+
+@router.get("/{username}/mutuals", response_model=Mutuals)
+async def mutuals(
+    username: str,
+    limit: int = Query(default=10, ge=1, le=MAX_LIMIT),
+    db: AsyncSession = Depends(get_async_db),
+    me: CurrentUser = Depends(get_current_user),
+):
+    """People you follow who follow this user; `count` is all of them, `users` the first `limit`."""
+    ids = await run_in_threadpool(graph.mutuals, me.id, await _user_id(db, username))
+    return {"count": len(ids), "users": await _users_by_id(db, ids[:limit])}
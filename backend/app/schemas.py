@@ -1,8 +1,12 @@
 from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
 
+# most ids/usernames accepted by one batch call
+MAX_BATCH = 100
+USERNAME_PATTERN = r"^[a-zA-Z0-9_]{3,32}$"
+
 class UserCreate(BaseModel):
-    username: str = Field(min_length=3, max_length=32, pattern=r"^[a-zA-Z0-9_]+$")
+    username: str = Field(min_length=3, max_length=32, pattern=USERNAME_PATTERN)
     email: EmailStr
     password: str = Field(min_length=8, max_length=128)
 
@@ -16,6 +20,16 @@ class UserPublic(BaseModel):
     class Config:
         from_attributes = True
 
+class UserBrief(BaseModel):
+    # other users' records: no email
+    id: int
+    username: str
+    is_admin: bool
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
 class Token(BaseModel):
     access_token: str
     token_type: str = "bearer"
@@ -27,8 +41,11 @@ class PostPublic(BaseModel):
     id: int
     caption: str
     image_url: str | None
+    image_srcset: str | None = None
+    image_width: int | None = None
+    image_height: int | None = None
     created_at: datetime
-    author: UserPublic
+    author: UserBrief
     likes_count: int
     comments_count: int
     liked_by_me: bool = False
@@ -40,7 +57,43 @@ class CommentPublic(BaseModel):
     id: int
     text: str
     created_at: datetime
-    author: UserPublic
+    author: UserBrief
 
 class FeedResponse(BaseModel):
     items: list[PostPublic]
+    next_cursor: str | None = None
+
+class CommentPage(BaseModel):
+    items: list[CommentPublic]
+    next_cursor: str | None = None
+
+class CommentHit(CommentPublic):
+    post_id: int
+
+class CommentSearchPage(BaseModel):
+    items: list[CommentHit]
+    next_cursor: str | None = None
+
+class SearchResults(BaseModel):
+    posts: list[PostPublic]
+    comments: list[CommentHit]
+    users: list[UserBrief]
+
+class PostIds(BaseModel):
+    post_ids: list[int] = Field(min_length=1, max_length=MAX_BATCH)
+
+class Usernames(BaseModel):
+    usernames: list[str] = Field(min_length=1, max_length=MAX_BATCH)
+
+class BatchResult(BaseModel):
+    # ids whose state actually changed (e.g. not already liked)
+    changed: list[int]
+
+class Suggestion(BaseModel):
+    user: UserBrief
+    # how many of the user's followees follow this account
+    followed_by: int
+
+class Mutuals(BaseModel):
+    count: int
+    users: list[UserBrief]
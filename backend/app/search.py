@@ -0,0 +1,123 @@
+"""Full-text search over post captions, comment texts and usernames.
+
+SQLite: one FTS5 table per source (`posts_fts`, `comments_fts`, `users_fts`), each an
+external-content index over the real table, so only the index is stored. Triggers
+created by `setup()` keep them in sync on every insert, delete and text edit, whichever
+code path does the write (the API, the pages, cascades). The first `setup()` on an
+existing database builds them from current rows.
+
+Postgres: GIN indexes on `to_tsvector('simple', ...)` of the same columns. They need
+no upkeep.
+
+Without either (or a SQLite build lacking FTS5), queries fall back to LIKE scans.
+
+Queries are split into words. Every word must match, and the last one also matches
+as a prefix, so results update while typing. Posts and comments are ordered by
+relevance (bm25 / ts_rank), users by follower count.
+"""
+import logging
+import re
+
+from sqlalchemy import and_, column, desc, func, literal_column, select, table, text
+from sqlalchemy.orm import Session, joinedload
+
+from .models import Post, Comment, User
+
+log = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+MAX_WORDS = 8
+
+# table -> (indexed column, extra FTS5 options)
+_SOURCES = {
+    "posts": ("caption", ""),
+    "comments": ("text", ""),
+    "users": ("username", ", prefix='1 2 3'"),  # short prefixes indexed for autocomplete
+}
+
+_mode = "like"  # "fts5", "postgres" or "like"; set by setup()
+
+
+def _sqlite_ddl(source: str, col: str, options: str) -> list[str]:
+    fts = f"{source}_fts"
+    add = f"INSERT INTO {fts}(rowid, {col}) VALUES (new.id, new.{col});"
+    remove = f"INSERT INTO {fts}({fts}, rowid, {col}) VALUES ('delete', old.id, old.{col});"
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({col}, content='{source}', content_rowid='id'{options})",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {source} BEGIN {add} END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {source} BEGIN {remove} END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {col} ON {source} BEGIN {remove} {add} END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def setup(engine) -> None:
+    """Create missing search indexes (and their triggers); called once at startup."""
+    global _mode
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            for source, (col, _options) in _SOURCES.items():
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{source}_{col}_search "
+                    f"ON {source} USING gin (to_tsvector('simple', {col}))"
+                ))
+            _mode = "postgres"
+        elif engine.dialect.name == "sqlite":
+            if not conn.execute(text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar():
+                log.warning("SQLite was built without FTS5; search falls back to LIKE scans")
+                return
+            existing = set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'")).scalars())
+            for source, (col, options) in _SOURCES.items():
+                if f"{source}_fts" not in existing:
+                    for statement in _sqlite_ddl(source, col, options):
+                        conn.execute(text(statement))
+            _mode = "fts5"
+
+
+def words(q: str) -> list[str]:
+    return _WORD.findall(q.lower())[:MAX_WORDS]
+
+
+def _matching(model, col, terms: list[str]):
+    """Select of `model` rows matching every term, most relevant first."""
+    if _mode == "fts5":
+        name = f"{model.__tablename__}_fts"
+        fts = table(name, column("rowid"), column("rank"))
+        # each term quoted so input can't inject FTS syntax; the last one is a prefix
+        query = " ".join(f'"{t}"' for t in terms) + "*"
+        return (
+            select(model)
+            .join(fts, fts.c.rowid == model.id)
+            .where(literal_column(name).match(query))
+            .order_by(fts.c.rank)
+        )
+    if _mode == "postgres":
+        simple = literal_column("'simple'")
+        vector = func.to_tsvector(simple, col)
+        query = func.to_tsquery(simple, " & ".join(terms[:-1] + [terms[-1] + ":*"]))
+        return select(model).where(vector.op("@@")(query)).order_by(desc(func.ts_rank(vector, query)), desc(model.id))
+    return select(model).where(and_(*[col.ilike(f"%{t}%") for t in terms])).order_by(desc(model.id))
+
+
+def posts(db: Session, q: str, offset: int, limit: int) -> list[Post]:
+    terms = words(q)
+    if not terms:
+        return []
+    return list(db.scalars(_matching(Post, Post.caption, terms).offset(offset).limit(limit)))
+
+
+def comments(db: Session, q: str, offset: int, limit: int) -> list[Comment]:
+    terms = words(q)
+    if not terms:
+        return []
+    stmt = _matching(Comment, Comment.text, terms).options(joinedload(Comment.author))
+    return list(db.scalars(stmt.offset(offset).limit(limit)))
+
+
+def users(db: Session, q: str, limit: int) -> list[User]:
+    """Username autocomplete: best-known accounts first."""
+    terms = words(q)
+    if not terms:
+        return []
+    stmt = _matching(User, User.username, terms).order_by(None).order_by(desc(User.followers_count), User.username)
+    return list(db.scalars(stmt.limit(limit)))
@@ -0,0 +1,40 @@
+// Live updates for /app: keeps like/comment counts current and offers a reload when
+// new posts arrive. Events come from /ws/feed as JSON arrays (see app/events.py).
+(function () {
+  var banner = document.getElementById("live-banner");
+  var retry = 1000;
+
+  function showBanner(text) {
+    banner.textContent = text;
+    banner.hidden = false;
+  }
+
+  function apply(event) {
+    if (event.type === "counts") {
+      document.querySelectorAll('[data-post="' + event.post_id + '"]').forEach(function (el) {
+        el.querySelector("[data-likes]").textContent = event.likes_count;
+        el.querySelector("[data-comments]").textContent = event.comments_count;
+      });
+    } else if (event.type === "post" || event.type === "resync" || event.type === "follow") {
+      showBanner("New activity — click to refresh");
+    } else if (event.type === "post_deleted") {
+      document.querySelectorAll('[data-post="' + event.post_id + '"]').forEach(function (el) {
+        el.closest("article").remove();
+      });
+    }
+  }
+
+  function connect() {
+    var scheme = location.protocol === "https:" ? "wss://" : "ws://";
+    var socket = new WebSocket(scheme + location.host + "/ws/feed");
+    socket.onopen = function () { retry = 1000; };
+    socket.onmessage = function (msg) { JSON.parse(msg.data).forEach(apply); };
+    socket.onclose = function () {
+      setTimeout(connect, retry);
+      retry = Math.min(retry * 2, 30000);
+    };
+  }
+
+  banner.addEventListener("click", function () { location.reload(); });
+  if ("WebSocket" in window) connect();
+})();
@@ -0,0 +1,125 @@
+"""Where uploaded files live.
+
+Keys are relative paths such as "3f/a2/3fa2...c9.png" (see uploads.blob_key), the
+"<uuid hex>.png" names of uploads from before content addressing, or the WebP variants
+of either ("..._thumb.webp", see images.py). Nothing else is accepted, so a key can
+never point outside the uploads. `settings.upload_backend` selects the backend:
+
+- "local": files under app/static/uploads, served by the /static mount. Files being
+  written go to app/upload_tmp first, which is not served, and are renamed into place.
+- "s3": objects in `settings.s3_bucket` under `settings.s3_prefix`, served from
+  `settings.s3_public_url`. Needs boto3. `settings.s3_endpoint_url` points it at
+  any S3-compatible server (MinIO, a local moto server, ...). Credentials come from
+  the usual AWS_* environment variables.
+"""
+import os
+import re
+import tempfile
+from contextlib import suppress
+
+from .config import settings
+
+LOCAL_ROOT = os.path.join(os.path.dirname(__file__), "static", "uploads")
+# outside static/, so partial files are never served; same filesystem, so save() renames
+LOCAL_TMP = os.path.join(os.path.dirname(__file__), "upload_tmp")
+
+_NAME = r"(?:[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}|[0-9a-f]{32})"
+UPLOAD_KEY = re.compile(_NAME + r"\.(?:png|jpg|webp)")
+_KEY = re.compile(_NAME + r"(?:\.(?:png|jpg|webp)|_[a-z]+\.webp)")
+
+
+def check_key(key: str) -> str:
+    if not isinstance(key, str) or ".." in key or not _KEY.fullmatch(key):
+        raise ValueError(f"not a storage key: {key!r}")
+    return key
+
+
+class LocalStorage:
+    def __init__(self, root: str, base_url: str, tmp_root: str):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+        self.tmp_root = tmp_root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *check_key(key).split("/"))
+
+    def save(self, key: str, src_path: str) -> None:
+        """Move the finished file at `src_path` to `key`, replacing it atomically."""
+        dest = self._path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(src_path, dest)
+
+    def open(self, key: str):
+        return open(self._path(key), "rb")
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def delete(self, key: str) -> None:
+        with suppress(FileNotFoundError):
+            os.remove(self._path(key))
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+    def temp_dir(self) -> str:
+        os.makedirs(self.tmp_root, exist_ok=True)
+        return self.tmp_root
+
+
+class S3Storage:
+    def __init__(self, bucket: str, prefix: str, public_url: str, endpoint_url: str | None, region: str | None):
+        import boto3  # optional dependency, only needed for this backend
+
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.public_url = public_url.rstrip("/")
+
+    def _object(self, key: str) -> str:
+        return self.prefix + check_key(key)
+
+    def save(self, key: str, src_path: str) -> None:
+        self.client.upload_file(src_path, self.bucket, self._object(key), ExtraArgs={"CacheControl": "public, max-age=31536000, immutable"})
+        os.remove(src_path)
+
+    def open(self, key: str):
+        out = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        self.client.download_fileobj(self.bucket, self._object(key), out)
+        out.seek(0)
+        return out
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object(key))
+        except ClientError as exc:
+            if exc.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._object(key))
+
+    def url(self, key: str) -> str:
+        return f"{self.public_url}/{self.prefix}{key}"
+
+    def temp_dir(self) -> str | None:
+        return None
+
+
+def _make_storage():
+    if settings.upload_backend == "s3":
+        return S3Storage(
+            settings.s3_bucket,
+            settings.s3_prefix,
+            settings.s3_public_url or f"{(settings.s3_endpoint_url or 'https://s3.amazonaws.com').rstrip('/')}/{settings.s3_bucket}",
+            settings.s3_endpoint_url,
+            settings.s3_region,
+        )
+    return LocalStorage(LOCAL_ROOT, "/static/uploads", LOCAL_TMP)
+
+
+storage = _make_storage()
@@ -0,0 +1,171 @@
+"""Materialized home timelines.
+
+Posts are copied into `timeline_entries` for every follower when they are created
+(fan-out on write), so reading a feed is one range scan over the viewer's entries.
+Authors above `settings.timeline_fanout_max_followers` are skipped at write time and
+merged in at read time instead (fan-out on read), which keeps a single post from turning
+into millions of inserts. When an author drops back to the threshold, the posts they made
+above it are fanned out then, since reads stop merging them in.
+
+Rebuild every timeline from the follows/posts tables (from backend/):
+    python -m app.timeline
+"""
+from sqlalchemy import delete, desc, insert, literal, select, true
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .db import SessionLocal
+from .models import Post, User, Follow, TimelineEntry
+from .pagination import encode_cursor, keyset, split_page
+
+_COLUMNS = ["user_id", "post_id", "author_id", "created_at"]
+
+
+def _is_high_fanout(followers_count: int) -> bool:
+    return followers_count > settings.timeline_fanout_max_followers
+
+
+def fan_out(db: Session, post: Post) -> None:
+    """Copy a freshly flushed post into its author's and followers' timelines."""
+    db.execute(
+        insert(TimelineEntry).from_select(
+            _COLUMNS,
+            select(Post.author_id, Post.id, Post.author_id, Post.created_at).where(Post.id == post.id),
+        )
+    )
+    followers_count = db.query(User.followers_count).filter(User.id == post.author_id).scalar() or 0
+    if _is_high_fanout(followers_count):
+        return
+    db.execute(
+        insert(TimelineEntry).from_select(
+            _COLUMNS,
+            select(Follow.follower_id, Post.id, Post.author_id, Post.created_at)
+            .join(Post, Post.author_id == Follow.following_id)
+            .where(Post.id == post.id),
+        )
+    )
+
+
+def backfill(db: Session, follower_id: int, following_id: int) -> None:
+    followers_count = db.query(User.followers_count).filter(User.id == following_id).scalar() or 0
+    if _is_high_fanout(followers_count):
+        return
+    db.execute(
+        insert(TimelineEntry).from_select(
+            _COLUMNS,
+            select(literal(follower_id), Post.id, Post.author_id, Post.created_at)
+            .where(Post.author_id == following_id)
+            .order_by(desc(Post.created_at), desc(Post.id))
+            .limit(settings.timeline_backfill),
+        )
+    )
+
+
+def fan_out_skipped(db: Session, author_id: int) -> None:
+    """Copy the author's recent posts that were never fanned out (made while they were above
+    the threshold) into their followers' timelines, once they are back at the threshold."""
+    followers_count = db.query(User.followers_count).filter(User.id == author_id).scalar() or 0
+    if followers_count != settings.timeline_fanout_max_followers:
+        return
+    recent = (
+        select(Post.id, Post.created_at)
+        .where(Post.author_id == author_id)
+        .order_by(desc(Post.created_at), desc(Post.id))
+        .limit(settings.timeline_backfill)
+        .subquery()
+    )
+    fanned_out = select(TimelineEntry.post_id).where(
+        TimelineEntry.post_id == recent.c.id, TimelineEntry.user_id != author_id
+    )
+    db.execute(
+        insert(TimelineEntry).from_select(
+            _COLUMNS,
+            select(Follow.follower_id, recent.c.id, literal(author_id), recent.c.created_at)
+            .join(recent, true())
+            .where(Follow.following_id == author_id, ~fanned_out.exists()),
+        )
+    )
+
+
+def prune(db: Session, follower_id: int, following_id: int) -> None:
+    db.execute(
+        delete(TimelineEntry).where(TimelineEntry.user_id == follower_id, TimelineEntry.author_id == following_id)
+    )
+
+
+def remove_post(db: Session, post_id: int) -> None:
+    db.execute(delete(TimelineEntry).where(TimelineEntry.post_id == post_id))
+
+
+def page(db: Session, user_id: int, cursor: str | None, limit: int, options=()):
+    """Newest-first page of the user's home timeline as Post rows.
+
+    `options` are loader options for the Post query (e.g. joinedload(Post.author)).
+    Returns (posts, next_cursor), like `pagination.split_page`.
+    """
+    stmt = (
+        select(Post)
+        .options(*options)
+        .join(TimelineEntry, TimelineEntry.post_id == Post.id)
+        .where(TimelineEntry.user_id == user_id)
+    )
+    keys = (TimelineEntry.created_at, TimelineEntry.post_id)
+    posts, next_cursor = split_page(list(db.scalars(keyset(stmt, Post, cursor, limit, keys))), limit)
+
+    high_fanout_ids = list(
+        db.scalars(
+            select(Follow.following_id)
+            .join(User, User.id == Follow.following_id)
+            .where(Follow.follower_id == user_id, User.followers_count > settings.timeline_fanout_max_followers)
+        )
+    )
+    if not high_fanout_ids:
+        return posts, next_cursor
+
+    stmt = select(Post).options(*options).where(Post.author_id.in_(high_fanout_ids))
+    pulled, pulled_cursor = split_page(list(db.scalars(keyset(stmt, Post, cursor, limit))), limit)
+    merged = {p.id: p for p in posts + pulled}
+    posts = sorted(merged.values(), key=lambda p: (p.created_at, p.id), reverse=True)
+    if len(posts) > limit or next_cursor or pulled_cursor:
+        posts = posts[:limit]
+        next_cursor = encode_cursor(posts[-1].created_at, posts[-1].id)
+    return posts, next_cursor
+
+
+def is_empty(db: Session, user_id: int) -> bool:
+    """True if the user's timeline has nothing on any page: no entries and no posts from
+    followed high-fan-out authors (merged at read time)."""
+    if db.query(TimelineEntry.post_id).filter(TimelineEntry.user_id == user_id).first() is not None:
+        return False
+    return db.scalar(
+        select(Post.id)
+        .join(Follow, Follow.following_id == Post.author_id)
+        .join(User, User.id == Follow.following_id)
+        .where(Follow.follower_id == user_id, User.followers_count > settings.timeline_fanout_max_followers)
+        .limit(1)
+    ) is None
+
+
+def rebuild(db: Session) -> None:
+    db.execute(delete(TimelineEntry))
+    db.execute(
+        insert(TimelineEntry).from_select(
+            _COLUMNS, select(Post.author_id, Post.id, Post.author_id, Post.created_at)
+        )
+    )
+    db.execute(
+        insert(TimelineEntry).from_select(
+            _COLUMNS,
+            select(Follow.follower_id, Post.id, Post.author_id, Post.created_at)
+            .join(Post, Post.author_id == Follow.following_id)
+            .join(User, User.id == Follow.following_id)
+            .where(User.followers_count <= settings.timeline_fanout_max_followers),
+        )
+    )
+    db.commit()
+
+
+if __name__ == "__main__":
+    with SessionLocal() as db:
+        rebuild(db)
+    print("timelines rebuilt")
@@ -0,0 +1,144 @@
+"""Post images, streamed into content-addressed storage.
+
+The upload is copied in fixed-size chunks to a temporary file while its SHA-256 is
+computed. The size cap is checked along the way. The type comes from the file's
+magic bytes, not the client's Content-Type. The file is stored under its hash,
+sharded two levels deep ("3f/a2/3fa2...c9.png"), so the same image posted twice is
+stored once, and no single directory grows without bound. How many posts use each
+key is counted in the `blobs` table (see interactions.publish/delete_post/purge_blob).
+
+An image that is already stored is not written again. Its temporary copy is kept
+until the new post is committed, though: the last other post using it may have been
+deleted meanwhile and taken the file with it, and `keep_image` then puts it back.
+
+Starlette spools a whole multipart body to disk before the handler runs, so
+`BodyLimitMiddleware` caps request bodies while they arrive: a declared
+Content-Length over the limit is refused before anything is read, and a body that
+grows past it is cut off with a 413 at that point.
+"""
+import hashlib
+import os
+import tempfile
+from contextlib import suppress
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from .config import settings
+from .storage import storage, UPLOAD_KEY
+
+CHUNK_SIZE = 64 * 1024
+# room for the other form fields and the multipart framing around the image
+FORM_OVERHEAD = 64 * 1024
+
+
+def sniff(head: bytes) -> str | None:
+    """File extension for a PNG/JPEG/WEBP header, None for anything else."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def is_stored(image_path: str | None) -> bool:
+    """True for keys of uploaded files, False for external image URLs from the /app form."""
+    return bool(image_path) and UPLOAD_KEY.fullmatch(image_path) is not None
+
+
+def blob_key(digest: str, ext: str) -> str:
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def save_image(src, max_bytes: int) -> tuple[str, str | None]:
+    """Store the file-like `src`; returns its storage key and, if it was stored already,
+    the path of a spare copy to hand to `keep_image` once the post using it is committed."""
+    chunk = src.read(CHUNK_SIZE)
+    ext = sniff(chunk)
+    if ext is None:
+        raise HTTPException(status_code=400, detail="Only PNG/JPEG/WEBP images allowed")
+
+    fd, tmp_path = tempfile.mkstemp(dir=storage.temp_dir(), suffix=".part")
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        with os.fdopen(fd, "wb") as out:
+            while chunk:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"Image larger than {max_bytes // (1024 * 1024)} MB")
+                digest.update(chunk)
+                out.write(chunk)
+                chunk = src.read(CHUNK_SIZE)
+            out.flush()
+            os.fsync(out.fileno())
+        key = blob_key(digest.hexdigest(), ext)
+        if storage.exists(key):
+            return key, tmp_path
+        storage.save(key, tmp_path)
+        return key, None
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+
+def keep_image(key: str, spare: str | None) -> None:
+    """After the post using `key` is committed: restore the file from `spare` if it is gone."""
+    if spare is None:
+        return
+    try:
+        if not storage.exists(key):
+            storage.save(key, spare)
+    finally:
+        discard(spare)
+
+
+def discard(spare: str | None) -> None:
+    if spare is not None:
+        with suppress(FileNotFoundError):
+            os.remove(spare)
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Request body larger than {settings.max_upload_bytes // (1024 * 1024)} MB")
+
+
+class BodyLimitMiddleware:
+    """ASGI middleware: no request body may exceed max_upload_bytes + FORM_OVERHEAD."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        limit = settings.max_upload_bytes + FORM_OVERHEAD
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > limit:
+            exc = _too_large()
+            response = JSONResponse({"detail": exc.detail}, status_code=exc.status_code, headers={"connection": "close"})
+            return await response(scope, receive, send)
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # raised inside the handler's body parsing, so it becomes a 413 response
+                    raise _too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def url(key: str) -> str:
+    return storage.url(key)
+
+
+def remove_image(key: str) -> None:
+    storage.delete(key)
@@ -0,0 +1,94 @@
+"""Per-process cache of who a token belongs to.
+
+`deps.get_current_user` and `pages.get_me_optional` used to load the User row on
+every request. They now keep a small snapshot (id, username, is_admin) per access
+token here, for at most `settings.user_cache_ttl_seconds` and never past the token's
+own expiry. Changing or deleting a User through the ORM drops its entries. Each
+worker process has its own cache, so other processes still see a change only
+when their TTL runs out.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from sqlalchemy import event
+
+from .config import settings
+from .models import User
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    id: int
+    username: str
+    is_admin: bool
+
+
+class UserCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[CurrentUser, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get(self, token: str) -> CurrentUser | None:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token: str, user: User, expires_at: float | None = None) -> CurrentUser:
+        """Store a snapshot of `user` for `token`; `expires_at` is the token's exp (unix time)."""
+        snapshot = CurrentUser(id=user.id, username=user.username, is_admin=user.is_admin)
+        ttl = self.ttl if expires_at is None else min(self.ttl, expires_at - time.time())
+        if ttl <= 0 or self.max_size <= 0:
+            return snapshot
+        with self._lock:
+            self._entries[token] = (snapshot, time.monotonic() + ttl)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return snapshot
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            stale = [token for token, (snap, _) in self._entries.items() if snap.id == user_id]
+            for token in stale:
+                del self._entries[token]
+            self.invalidations += len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+cache = UserCache(settings.user_cache_size, settings.user_cache_ttl_seconds)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _drop_changed_user(_mapper, _connection, target: User) -> None:
+    cache.invalidate_user(target.id)
@@ -0,0 +1,127 @@
+"""Single SQLite writer with group commit.
+
+SQLite allows one writer at a time. Under bursts of likes/follows, every request
+thread competes for the database lock and some give up with `database is locked`.
+With `settings.sqlite_write_queue` on, those writes are queued to one thread instead.
+That thread runs whatever arrives within `sqlite_write_window_ms`, up to
+`sqlite_write_batch` items, in one transaction and commits once for all of them.
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from .config import settings
+from .db import connect_args, instrument, is_sqlite, tune
+
+log = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class WriteQueue:
+    def __init__(self, max_batch: int, window_ms: float):
+        # own connection, so the writer never waits on request sessions for a pool slot
+        engine = create_engine(settings.database_url, connect_args=connect_args, pool_size=1, max_overflow=0)
+        tune(engine)
+        instrument(engine)
+        self._sessions = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                    self._thread.start()
+
+    def submit(self, fn, *args) -> Future:
+        """Queue `fn(session, *args)`; the future resolves once its batch is committed."""
+        self._ensure_started()
+        fut: Future = Future()
+        self._queue.put((fut, fn, args))
+        return fut
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def _collect(self, first) -> list:
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+            try:
+                self._commit_batch(batch)
+            except Exception:
+                log.exception("group commit of %d writes failed, retrying one by one", len(batch))
+                for item in batch:
+                    self._commit_batch([item])
+
+    def _commit_batch(self, batch: list) -> None:
+        results = []
+        with self._sessions() as db:
+            try:
+                for fut, fn, args in batch:
+                    results.append(fn(db, *args))
+                db.commit()
+            except Exception as exc:
+                db.rollback()
+                if len(batch) > 1:
+                    raise
+                batch[0][0].set_exception(exc)
+                return
+        for (fut, _fn, _args), result in zip(batch, results):
+            fut.set_result(result)
+
+
+_writer: WriteQueue | None = None
+
+
+def enabled() -> bool:
+    return is_sqlite and settings.sqlite_write_queue
+
+
+def _get() -> WriteQueue:
+    global _writer
+    if _writer is None:
+        _writer = WriteQueue(settings.sqlite_write_batch, settings.sqlite_write_window_ms)
+    return _writer
+
+
+async def submit(fn, *args):
+    return await asyncio.wrap_future(_get().submit(fn, *args))
+
+
+def shutdown() -> None:
+    if _writer is not None:
+        _writer.stop()
@@ -0,0 +1,15 @@
+"""Benchmarks: synthetic data, micro-benchmarks and an in-process load test.
+
+Run from backend/, against a database of its own (everything goes through app.config,
+so DATABASE_URL and the other settings apply as usual):
+
+    export DATABASE_URL=sqlite:///./bench.db
+    python -m bench.seed --users 10000            # ~1M rows; --users 100000 for ~10M
+    python -m bench.micro                         # hot functions
+    python -m bench.load --users 50               # login, /app, like, comment, profile
+    python -m bench.load --scenario likes --users 1000
+    python -m bench.compare bench/results/a.json bench/results/b.json
+
+Each run writes a JSON file to bench/results/ named after the scenario and the git
+revision. `compare` lines up two such files, so runs can be compared across commits.
+"""
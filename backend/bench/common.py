@@ -0,0 +1,74 @@
+"""Timing statistics and result files shared by the benchmarks."""
+import json
+import math
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from app.config import settings
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def summarize(samples: list[float]) -> dict:
+    """Durations in seconds -> count, mean and nearest-rank percentiles in ms."""
+    if not samples:
+        return {"n": 0}
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        return round(ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] * 1000, 4)
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 4),
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": round(ordered[-1] * 1000, 4),
+    }
+
+
+def git_revision() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True, timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+    return out.stdout.strip() or "unknown"
+
+
+def save(kind: str, params: dict, results: dict, out: str | None = None) -> Path:
+    revision = git_revision()
+    created = datetime.now(timezone.utc)
+    path = Path(out) if out else RESULTS_DIR / f"{kind}-{revision}-{created:%Y%m%dT%H%M%S}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "kind": kind,
+        "revision": revision,
+        "created_at": created.isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": settings.database_url.split(":", 1)[0],
+        "params": params,
+        "results": results,
+    }
+    path.write_text(json.dumps(payload, indent=2) + "\n")
+    print(f"saved {path}")
+    return path
+
+
+def timed(fn, min_seconds: float, min_calls: int = 5) -> dict:
+    """Call `fn()` for about `min_seconds` after one warm-up call; per-call statistics."""
+    fn()
+    samples = []
+    deadline = time.perf_counter() + min_seconds
+    while len(samples) < min_calls or time.perf_counter() < deadline:
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
@@ -0,0 +1,50 @@
+"""Compare two result files from bench.micro or bench.load, e.g. across commits.
+
+    python -m bench.compare bench/results/micro-abc123-....json bench/results/micro-def456-....json
+
+Prints every timing found in both files (p50/p95/p99 by default) with the change.
+"""
+import argparse
+import json
+from pathlib import Path
+
+
+def _timings(results: dict, prefix: str = "") -> dict[str, dict]:
+    """Flatten nested results to {"path.to.benchmark": {"p50_ms": ...}}."""
+    found = {}
+    for key, value in results.items():
+        if not isinstance(value, dict):
+            continue
+        name = f"{prefix}{key}"
+        if "p50_ms" in value:
+            found[name] = value
+        found.update(_timings(value, f"{name}."))
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before", type=Path)
+    parser.add_argument("after", type=Path)
+    parser.add_argument("--stats", default="p50_ms,p95_ms,p99_ms")
+    args = parser.parse_args()
+
+    before, after = (json.loads(path.read_text()) for path in (args.before, args.after))
+    print(f"{before['revision']} -> {after['revision']}")
+    old, new = _timings(before["results"]), _timings(after["results"])
+    stats = args.stats.split(",")
+    for name in sorted(old.keys() & new.keys()):
+        cells = []
+        for stat in stats:
+            a, b = old[name].get(stat), new[name].get(stat)
+            if a is None or b is None:
+                continue
+            change = f"{(b - a) / a * 100:+.0f}%" if a else "n/a"
+            cells.append(f"{stat} {a:.3f} -> {b:.3f} ({change})")
+        print(f"{name:>40}  " + "  ".join(cells))
+    for name in sorted(old.keys() ^ new.keys()):
+        print(f"{name:>40}  only in {'before' if name in old else 'after'}")
+
+
+if __name__ == "__main__":
+    main()
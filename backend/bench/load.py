@@ -0,0 +1,213 @@
+"""In-process load test of the main user journeys, against the seeded database.
+
+Scenarios (--scenario):
+- journeys: --users virtual users start at once. Each logs in through the /login form,
+  then does --rounds rounds of /app, a like, a comment and a profile view.
+- likes: --users users like the same post at the same moment.
+- logins: --users logins (POST /api/auth/token) at the same moment.
+- mixed: --readers users keep reloading their feed (GET /api/posts/feed/me), first alone
+  for --baseline-seconds, then while --users logins happen at the same moment. Reports
+  feed p99 for both phases, to show password hashing doesn't hold up other requests.
+
+Requests go through httpx's ASGI transport into the real app: middleware, handlers,
+SQL and templates, with no sockets or server in between. So this measures one worker
+process's event loop under that much concurrency. Each step reports p50/p95/p99 and
+its status codes. Each route reports SQL statements and SQL time per request, taken
+from app.metrics.
+
+    python -m bench.load --scenario journeys --users 50 --rounds 5
+    python -m bench.load --scenario mixed --users 500 --readers 20
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+import httpx
+from sqlalchemy import func, select
+
+from app import metrics
+from app.auth import create_access_token
+from app.config import settings
+from app.db import SessionLocal
+from app.main import app
+from app.models import Like, Post, User
+
+from .common import save, summarize
+from .seed import PASSWORD
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        self.statuses: dict[str, dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    async def request(self, step: str, client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.samples[step].append(time.perf_counter() - started)
+        self.statuses[step][response.status_code] += 1
+        return response
+
+    def report(self) -> dict:
+        return {
+            step: {**summarize(samples), "statuses": dict(sorted(self.statuses[step].items()))}
+            for step, samples in self.samples.items()
+        }
+
+
+def _client(transport: httpx.ASGITransport, token: str | None = None) -> httpx.AsyncClient:
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    return httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers)
+
+
+async def journey(rec: Recorder, transport, username: str, post_ids: list[int], n_users: int,
+                  rounds: int, rng: random.Random) -> None:
+    async with _client(transport) as client:
+        login = await rec.request("login", client, "POST", "/login", data={"username": username, "password": PASSWORD})
+        if login.status_code != 303:
+            return
+        for _ in range(rounds):
+            post_id = rng.choice(post_ids)
+            await rec.request("app", client, "GET", "/app")
+            await rec.request("like", client, "POST", f"/actions/like/{post_id}")
+            await rec.request("comment", client, "POST", f"/actions/comment/{post_id}", data={"text": "bench comment"})
+            await rec.request("profile", client, "GET", f"/profile/user{rng.randint(1, n_users)}")
+
+
+async def like_storm(rec: Recorder, transport, user_ids: list[int], post_id: int) -> None:
+    async def like(user_id: int) -> None:
+        async with _client(transport, create_access_token(str(user_id))) as client:
+            await rec.request("like", client, "POST", f"/api/likes/post/{post_id}")
+
+    await asyncio.gather(*(like(user_id) for user_id in user_ids))
+
+
+async def login_storm(rec: Recorder, transport, user_ids: list[int]) -> None:
+    async def login(user_id: int) -> None:
+        async with _client(transport) as client:
+            await rec.request("token", client, "POST", "/api/auth/token",
+                              data={"username": f"user{user_id}", "password": PASSWORD})
+
+    await asyncio.gather(*(login(user_id) for user_id in user_ids))
+
+
+async def read_feeds(rec: Recorder, transport, user_ids: list[int], step: str, stop: asyncio.Event) -> None:
+    async def reader(user_id: int) -> None:
+        async with _client(transport, create_access_token(str(user_id))) as client:
+            while not stop.is_set():
+                await rec.request(step, client, "GET", "/api/posts/feed/me")
+
+    await asyncio.gather(*(reader(user_id) for user_id in user_ids))
+
+
+async def feed_during_logins(rec: Recorder, transport, reader_ids: list[int], login_ids: list[int],
+                             baseline_seconds: float) -> None:
+    stop = asyncio.Event()
+    readers = asyncio.create_task(read_feeds(rec, transport, reader_ids, "feed_idle", stop))
+    await asyncio.sleep(baseline_seconds)
+    stop.set()
+    await readers
+
+    stop = asyncio.Event()
+    readers = asyncio.create_task(read_feeds(rec, transport, reader_ids, "feed_logins", stop))
+    await login_storm(rec, transport, login_ids)
+    stop.set()
+    await readers
+
+
+def _queries_per_route(registry: metrics.Registry) -> dict:
+    return {
+        f"{method} {route}": {
+            "requests": m.latency.count,
+            "sql_statements_per_request": round(m.queries.sum / m.queries.count, 2),
+            "sql_ms_per_request": round(m.sql_seconds / m.queries.count * 1000, 3),
+        }
+        for (method, route), m in sorted(registry.routes.items())
+        if m.queries.count
+    }
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    with SessionLocal() as db:
+        n_users = db.scalar(select(func.count()).select_from(User)) or 0
+        post_ids = list(db.scalars(select(Post.id).order_by(Post.id.desc()).limit(1000)))
+    readers = args.readers if args.scenario == "mixed" else 0
+    if n_users < args.users + readers or not post_ids:
+        raise SystemExit(f"need at least {args.users + readers} seeded users and some posts; run python -m bench.seed first")
+    user_ids = rng.sample(range(1, n_users + 1), args.users + readers)
+    user_ids, reader_ids = user_ids[:args.users], user_ids[args.users:]
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+
+    async with app.router.lifespan_context(app):
+        # warm-up (template compilation, pools, caches), not measured
+        await journey(Recorder(), transport, f"user{user_ids[0]}", post_ids, n_users, 1, rng)
+        metrics.registry = metrics.Registry()
+        rec = Recorder()
+        started = time.perf_counter()
+        extra = {}
+        if args.scenario == "journeys":
+            await asyncio.gather(*(
+                journey(rec, transport, f"user{user_id}", post_ids, n_users, args.rounds, random.Random(user_id))
+                for user_id in user_ids
+            ))
+        elif args.scenario == "likes":
+            post_id = post_ids[-1]
+            with SessionLocal() as db:
+                before = db.scalar(select(Post.likes_count).where(Post.id == post_id))
+            await like_storm(rec, transport, user_ids, post_id)
+            with SessionLocal() as db:
+                stored = db.scalar(select(Post.likes_count).where(Post.id == post_id))
+                rows = db.scalar(select(func.count()).select_from(Like).where(Like.post_id == post_id))
+            extra = {"post_id": post_id, "likes_count_before": before, "likes_count_after": stored,
+                     "like_rows_after": rows, "counter_consistent": stored == rows}
+        elif args.scenario == "mixed":
+            await feed_during_logins(rec, transport, reader_ids, user_ids, args.baseline_seconds)
+            extra = {
+                "feed_p99_idle_ms": summarize(rec.samples["feed_idle"]).get("p99_ms"),
+                "feed_p99_during_logins_ms": summarize(rec.samples["feed_logins"]).get("p99_ms"),
+            }
+        else:
+            await login_storm(rec, transport, user_ids)
+        elapsed = time.perf_counter() - started
+
+    requests = sum(len(samples) for samples in rec.samples.values())
+    return {
+        "wall_seconds": round(elapsed, 3),
+        "requests": requests,
+        "requests_per_second": round(requests / elapsed, 1),
+        "steps": rec.report(),
+        "routes": _queries_per_route(metrics.registry) if settings.metrics_enabled else {},
+        **extra,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=["journeys", "likes", "logins", "mixed"], default="journeys")
+    parser.add_argument("--users", type=int, default=50, help="concurrent virtual users")
+    parser.add_argument("--rounds", type=int, default=5, help="journey rounds per user after logging in")
+    parser.add_argument("--readers", type=int, default=20, help="feed readers in the mixed scenario")
+    parser.add_argument("--baseline-seconds", type=float, default=3.0,
+                        help="how long the mixed scenario reads feeds before the logins start")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="result file (default bench/results/load-<scenario>-<revision>-<time>.json)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(f"{results['requests']} requests in {results['wall_seconds']}s ({results['requests_per_second']}/s)")
+    for step, stats in results["steps"].items():
+        print(f"{step:>11}  p50 {stats['p50_ms']:8.1f} ms  p95 {stats['p95_ms']:8.1f} ms  "
+              f"p99 {stats['p99_ms']:8.1f} ms  {stats['statuses']}")
+    for route, stats in results["routes"].items():
+        print(f"{route:>40}  {stats['sql_statements_per_request']:5.1f} queries, {stats['sql_ms_per_request']:7.2f} ms SQL")
+    for key in ("counter_consistent", "like_rows_after", "feed_p99_idle_ms", "feed_p99_during_logins_ms"):
+        if key in results:
+            print(f"{key}: {results[key]}")
+    save(f"load-{args.scenario}", vars(args), results, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Micro-benchmarks of hot functions.
+
+In memory, no database needed:
+- token create/decode,
+- rendering feed.html with 50 posts,
+- hot_score,
+- live-feed fan-out to --connections subscribers,
+- the follow graph with --edges synthetic follows (load time, bytes per edge,
+  suggestions, mutuals).
+
+Against the seeded database (skipped when it has no posts):
+- posts_to_public for a page of 30,
+- timeline pages, latest and ranked,
+- explore,
+- full-text post search.
+
+    python -m bench.micro --seconds 1 --edges 10000000 --only graph
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import desc, func, select
+from sqlalchemy.orm import joinedload
+
+from app import auth, events, ranking, search, timeline
+from app.db import SessionLocal, engine
+from app.graph import FollowGraph
+from app.hydrate import posts_to_public
+from app.models import Base, Post, User, TimelineEntry
+from app.routers import pages
+from app.usercache import CurrentUser
+
+from .common import save, timed
+
+
+def token_benchmarks(seconds: float) -> dict:
+    token = auth.create_access_token("12345")
+    return {
+        "create_access_token": timed(lambda: auth.create_access_token("12345"), seconds),
+        "decode_access_token": timed(lambda: auth.decode_access_token(token), seconds),
+    }
+
+
+def template_benchmarks(seconds: float) -> dict:
+    now = datetime.now(timezone.utc)
+    author = User(id=1, username="bench", email="bench@example.com", hashed_password="", is_admin=False)
+    posts = [
+        Post(id=i, author_id=1, author=author, caption=f"caption {i} " * 5, image_path=None,
+             likes_count=i, comments_count=i // 2, created_at=now)
+        for i in range(50, 0, -1)
+    ]
+    template = pages.templates.get_template("feed.html")
+    me = CurrentUser(id=1, username="bench", is_admin=False)
+    context = {"me": me, "posts": posts, "next_cursor": "abc", "mode": "latest",
+               "avatar": pages.avatar, "liked_set": {p.id for p in posts[::3]}}
+    return {"render_feed_html_50": timed(lambda: template.render(**context), seconds)}
+
+
+def ranking_benchmarks(seconds: float) -> dict:
+    now = datetime.now(timezone.utc)
+    return {"hot_score": timed(lambda: ranking.hot_score(120, 14, now), seconds)}
+
+
+def bus_benchmarks(seconds: float, connections: int) -> dict:
+    rng = random.Random(1)
+    bus = events.LocalBus(max_pending=100)
+    authors = range(1, 1001)
+    for user_id in range(1, connections + 1):
+        bus.subscribe(user_id, rng.sample(authors, 50))
+    event = {"type": "counts", "post_id": 1, "author_id": 1, "likes_count": 1, "comments_count": 0}
+    result = timed(lambda: bus.publish(event), seconds)
+    result["subscribers_per_event"] = len(bus._by_author.get(1, ()))
+    return {f"bus_publish_{connections}_connections": result}
+
+
+def graph_benchmarks(seconds: float, edges: int) -> dict:
+    rng = random.Random(1)
+    users = max(2, edges // 50)
+    per_user = edges // users
+    started = time.perf_counter()
+    rows = []
+    for follower in range(1, users + 1):
+        followees = set(rng.sample(range(1, users + 1), min(per_user + 1, users)))
+        followees.discard(follower)
+        rows.extend((follower, following) for following in sorted(followees)[:per_user])
+    generated = time.perf_counter() - started
+
+    graph = FollowGraph()
+    started = time.perf_counter()
+    graph.load(rows)
+    loaded = time.perf_counter() - started
+    del rows
+    stats = graph.stats()
+    viewer = rng.randint(1, users)
+    return {
+        f"follow_graph_{edges}": {
+            "edges": stats["edges"],
+            "users": stats["users"],
+            "generate_seconds": round(generated, 2),
+            "load_seconds": round(loaded, 2),
+            "id_bytes_per_edge": round(stats["id_bytes"] / max(1, stats["edges"]), 2),
+        },
+        "graph_suggestions": timed(lambda: graph.suggestions(viewer, 20), seconds),
+        "graph_mutuals": timed(lambda: graph.mutuals(viewer, rng.randint(1, users)), seconds),
+    }
+
+
+def database_benchmarks(seconds: float) -> dict:
+    with SessionLocal() as db:
+        # a viewer with a full timeline: the user following the most people
+        viewer = db.scalar(
+            select(TimelineEntry.user_id).group_by(TimelineEntry.user_id).order_by(desc(func.count())).limit(1)
+        )
+        page = list(db.scalars(select(Post).order_by(desc(Post.created_at), desc(Post.id)).limit(30)))
+        options = (joinedload(Post.author),)
+        word = search.words(page[0].caption)[0] if page and page[0].caption else "sunset"
+        search_result = timed(lambda: search.posts(db, word, 0, 30), seconds)
+        search_result["query"] = word
+        return {
+            "posts_to_public_30": timed(lambda: posts_to_public(db, page, viewer), seconds),
+            "timeline_page_30": timed(lambda: timeline.page(db, viewer, None, 30, options), seconds),
+            "ranked_page_30": timed(lambda: ranking.ranked_page(db, viewer, 0, 30, options), seconds),
+            "explore_30": timed(lambda: ranking.trending(db, 0, 30, options), seconds),
+            "search_posts_30": search_result,
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=0.5, help="time spent on each benchmark")
+    parser.add_argument("--edges", type=int, default=1_000_000, help="follow graph size")
+    parser.add_argument("--connections", type=int, default=5_000, help="live feed subscribers")
+    parser.add_argument("--only", default="", help="run only groups whose name contains this")
+    parser.add_argument("--out", help="result file (default bench/results/micro-<revision>-<time>.json)")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    search.setup(engine)
+    with SessionLocal() as db:
+        seeded = bool(db.scalar(select(func.count()).select_from(Post)))
+
+    groups = {
+        "tokens": lambda: token_benchmarks(args.seconds),
+        "templates": lambda: template_benchmarks(args.seconds),
+        "ranking": lambda: ranking_benchmarks(args.seconds),
+        "bus": lambda: bus_benchmarks(args.seconds, args.connections),
+        "graph": lambda: graph_benchmarks(args.seconds, args.edges),
+    }
+    if seeded:
+        groups["database"] = lambda: database_benchmarks(args.seconds)
+    else:
+        print("no posts in the database: skipping the database benchmarks (run python -m bench.seed first)")
+
+    results = {}
+    for name, run in groups.items():
+        if args.only not in name:
+            continue
+        for key, value in run().items():
+            results[key] = value
+            print(f"{key:>40}  {value}")
+    save("micro", vars(args), results, args.out)
+
+
+if __name__ == "__main__":
+    main()
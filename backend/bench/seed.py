@@ -0,0 +1,166 @@
+"""Fill an empty database with synthetic users, follows, posts, likes and comments.
+
+Popularity is skewed the way social data is. A few accounts get most of the follows
+and post most often, and likes and comments vary per post. Row counts scale with
+--users:
+    follows  = users * follows-per-user
+    posts    = users * posts-per-user
+    likes    ~ posts * likes-per-post
+    comments ~ posts * comments-per-post
+The defaults (10k users) come to about 1M rows. --users 100000 gives about 10M.
+
+Every account is `user<N>` with password PASSWORD. Rows are bulk-inserted from
+models.py in chunks. Derived data is built afterwards, the way the maintenance
+CLIs do it: counters, timelines, search indexes, and hot scores for the last
+`settings.ranking_window_days`.
+
+    python -m bench.seed --users 10000 --seed 1
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+from sqlalchemy import func, insert, select, text
+
+from app import auth, counters, ranking, search, timeline
+from app.db import SessionLocal, engine
+from app.models import Base, User, Post, Like, Comment, Follow
+
+PASSWORD = "benchpass123"
+CHUNK = 10_000
+WORDS = (
+    "sunset beach coffee city night dog cat food travel mountain friends music art summer "
+    "snow book run garden street morning river bike lake market rain forest party cake"
+).split()
+
+
+def _insert(db, model, rows) -> int:
+    """Bulk-insert an iterable of dicts in CHUNK-sized executemany batches."""
+    started, total, chunk = time.perf_counter(), 0, []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK:
+            db.execute(insert(model), chunk)
+            total += len(chunk)
+            chunk = []
+    if chunk:
+        db.execute(insert(model), chunk)
+        total += len(chunk)
+    db.commit()
+    elapsed = time.perf_counter() - started
+    print(f"{model.__tablename__:>9}: {total:>10,} rows in {elapsed:6.1f}s ({total / max(elapsed, 1e-9):,.0f}/s)")
+    return total
+
+
+def _popularity(n: int, skew: float) -> list[float]:
+    """Cumulative Zipf-like weights over ids 1..n (low ids are the popular ones)."""
+    return list(accumulate(1 / (rank + 1) ** skew for rank in range(n)))
+
+
+def _caption(rng: random.Random) -> str:
+    return " ".join(rng.choices(WORDS, k=rng.randint(2, 8)))
+
+
+def seed(db, users: int, follows_per_user: int, posts_per_user: int, likes_per_post: int,
+         comments_per_post: int, days: int, rng: random.Random) -> dict:
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    span = days * 86400
+    hashed = auth.hash_password(PASSWORD)  # one hash for everyone: seeding shouldn't take hours
+    ids = range(1, users + 1)
+    popular = _popularity(users, 0.8)
+    counts = {}
+
+    counts["users"] = _insert(db, User, (
+        {"id": i, "username": f"user{i}", "email": f"user{i}@example.com", "hashed_password": hashed,
+         "created_at": now - timedelta(seconds=span + rng.randrange(span))}
+        for i in ids
+    ))
+
+    def follows():
+        k = min(follows_per_user, users - 1)
+        for follower in ids:
+            followees = set()
+            while len(followees) < k:
+                followees.update(rng.choices(ids, cum_weights=popular, k=k - len(followees)))
+                followees.discard(follower)
+            for following in followees:
+                yield {"follower_id": follower, "following_id": following,
+                       "created_at": now - timedelta(seconds=rng.randrange(span))}
+
+    counts["follows"] = _insert(db, Follow, follows())
+
+    n_posts = users * posts_per_user
+    # ids follow time, as they would in production
+    offsets = sorted((rng.randrange(span) for _ in range(n_posts)), reverse=True)
+    # how often someone posts doesn't follow how popular they are
+    posters = list(ids)
+    rng.shuffle(posters)
+    authors = rng.choices(posters, cum_weights=_popularity(users, 0.5), k=n_posts)
+    counts["posts"] = _insert(db, Post, (
+        {"id": i + 1, "author_id": authors[i], "caption": _caption(rng), "created_at": created,
+         "hot_score": ranking.hot_score(0, 0, created)}
+        for i in range(n_posts)
+        for created in (now - timedelta(seconds=offsets[i]),)
+    ))
+
+    def likes():
+        for post_id in range(1, n_posts + 1):
+            for user_id in rng.sample(ids, min(users, rng.randint(0, 2 * likes_per_post))):
+                yield {"post_id": post_id, "user_id": user_id}
+
+    counts["likes"] = _insert(db, Like, likes())
+
+    def comments():
+        for post_id in range(1, n_posts + 1):
+            for _ in range(rng.randint(0, 2 * comments_per_post)):
+                yield {"post_id": post_id, "author_id": rng.choice(ids), "text": _caption(rng),
+                       "created_at": now - timedelta(seconds=rng.randrange(offsets[post_id - 1] + 1))}
+
+    counts["comments"] = _insert(db, Comment, comments())
+    return counts
+
+
+def _fix_sequences(db) -> None:
+    # ids were given explicitly; move Postgres sequences past them
+    for table in ("users", "posts", "comments"):
+        db.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT coalesce(max(id), 1) FROM {table}))"))
+    db.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--follows-per-user", type=int, default=30)
+    parser.add_argument("--posts-per-user", type=int, default=5)
+    parser.add_argument("--likes-per-post", type=int, default=10)
+    parser.add_argument("--comments-per-post", type=int, default=2)
+    parser.add_argument("--days", type=int, default=14, help="posts are spread over this many days")
+    parser.add_argument("--seed", type=int, default=1, help="random seed, for reproducible data")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        if db.scalar(select(func.count()).select_from(User)):
+            raise SystemExit("the database already has users; seed into an empty one (e.g. DATABASE_URL=sqlite:///./bench.db)")
+        started = time.perf_counter()
+        seed(db, args.users, args.follows_per_user, args.posts_per_user, args.likes_per_post,
+             args.comments_per_post, args.days, random.Random(args.seed))
+        if engine.dialect.name == "postgresql":
+            _fix_sequences(db)
+
+        for name, step in (
+            ("counters", counters.recount),
+            ("timelines", timeline.rebuild),
+            ("search indexes", lambda _db: search.setup(engine)),
+            ("hot scores", lambda _db: ranking.refresh_all()),
+        ):
+            step_started = time.perf_counter()
+            step(db)
+            print(f"{name} built in {time.perf_counter() - step_started:.1f}s")
+    print(f"seeded in {time.perf_counter() - started:.1f}s; log in as user1..user{args.users} / {PASSWORD}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Shared test setup. Run from backend/:
+    python -m pytest
+
+Settings are read when app.config is first imported, so the environment is set here,
+before any test imports the app: a throwaway SQLite database, cheap Argon2 parameters,
+and no worker processes.
+"""
+import os
+import sys
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import httpx
+import pytest
+from sqlalchemy import insert, select
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+os.chdir(BACKEND)  # templates and static files are found relative to backend/
+
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{tempfile.mkdtemp(prefix='instalite-tests-')}/test.db",
+    ARGON2_TIME_COST="1",
+    ARGON2_MEMORY_COST="1024",
+    ARGON2_PARALLELISM="1",
+    HASH_WORKERS="0",
+    IMAGE_WORKERS="0",
+    RANKING_REFRESH_SECONDS="0",
+)
+
+from app import interactions  # noqa: E402
+from app.auth import create_access_token  # noqa: E402
+from app.db import SessionLocal  # noqa: E402
+from app.main import app as asgi_app  # noqa: E402
+from app.models import Post, User  # noqa: E402
+
+_next_user = iter(range(1, 10**9))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def make_users(n: int) -> list[int]:
+    """Insert n users directly (no password hashing); returns their ids."""
+    names = [f"test{next(_next_user)}" for _ in range(n)]
+    with SessionLocal() as db:
+        db.execute(insert(User), [
+            {"username": name, "email": f"{name}@example.com", "hashed_password": "!"} for name in names
+        ])
+        db.commit()
+        return list(db.scalars(select(User.id).where(User.username.in_(names)).order_by(User.id)))
+
+
+def make_post(author_id: int, caption: str = "") -> int:
+    with SessionLocal() as db:
+        post = Post(author_id=author_id, caption=caption)
+        db.add(post)
+        db.commit()
+        return post.id
+
+
+def make_follow(follower_id: int, following_id: int) -> None:
+    with SessionLocal() as db:
+        interactions.follow(db, follower_id, following_id)
+        db.commit()
+
+
+def auth(user_id: int) -> dict:
+    return {"Authorization": f"Bearer {create_access_token(str(user_id))}"}
+
+
+@asynccontextmanager
+async def running_app():
+    """An httpx client for the app in this event loop, with startup/shutdown run around it."""
+    async with asgi_app.router.lifespan_context(asgi_app):
+        transport = httpx.ASGITransport(app=asgi_app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            yield client
@@ -0,0 +1,60 @@
+import re
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from conftest import auth, make_follow, make_post, make_users
+
+ASSET = re.compile(r'(?:src|href)="(/(?:static|avatars)/[^"]+)"')
+
+
+class Browser:
+    """Loads a page and its assets the way a browser with an HTTP cache would."""
+
+    def __init__(self, client: TestClient):
+        self.client = client
+        self.cache: dict[str, tuple[str | None, str]] = {}
+
+    def load(self, path: str, headers: dict) -> tuple[int, int, dict[str, str]]:
+        """Returns (page bytes, asset bytes received, how each asset was served)."""
+        page = self.client.get(path, headers={**headers, "accept-encoding": "gzip"})
+        assert page.status_code == 200
+        received = 0
+        served = {}
+        for url in dict.fromkeys(ASSET.findall(page.text)):
+            etag, cache_control = self.cache.get(url, (None, ""))
+            if "immutable" in cache_control:
+                served[url] = "cache"
+                continue
+            conditional = {"if-none-match": etag} if etag else {}
+            r = self.client.get(url, headers={"accept-encoding": "gzip", **conditional})
+            assert r.status_code in (200, 304), url
+            received += r.num_bytes_downloaded
+            served[url] = str(r.status_code)
+            if r.status_code == 200:
+                self.cache[url] = (r.headers.get("etag"), r.headers.get("cache-control", ""))
+        return page.num_bytes_downloaded, received, served
+
+
+def test_repeat_page_load_is_served_from_cache():
+    viewer, author = make_users(2)
+    for i in range(5):
+        make_post(author, f"post {i}")
+    make_follow(viewer, author)
+    headers = auth(viewer)
+
+    with TestClient(app) as client:
+        browser = Browser(client)
+        _, first, first_served = browser.load("/app", headers)
+        _, second, second_served = browser.load("/app", headers)
+        # the same stylesheet without its fingerprint is revalidated instead
+        etag = client.get("/static/css/style.css").headers["etag"]
+        revalidated = client.get("/static/css/style.css", headers={"if-none-match": etag})
+
+    assert any(url.startswith("/static/css/") for url in first_served)
+    assert any(url.startswith("/avatars/") for url in first_served)
+    assert set(first_served.values()) == {"200"}
+    # fingerprinted and immutable assets aren't requested again, the rest revalidate to a 304
+    assert set(second_served.values()) <= {"cache", "304"}
+    assert first > 0 and second == 0
+    assert revalidated.status_code == 304 and revalidated.num_bytes_downloaded == 0
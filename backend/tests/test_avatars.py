@@ -0,0 +1,20 @@
+from fastapi.testclient import TestClient
+
+from app import avatars
+from app.main import app
+
+
+def test_any_username_gets_an_identicon():
+    # names registered before usernames were restricted to letters, digits and "_"
+    names = ["ab", "jo.doe", "émile", "a b", "<script>", "x/y", "a" * 200]
+    with TestClient(app) as client:
+        responses = {name: client.get(avatars.url(name)) for name in names}
+        too_long = client.get(avatars.url("a" * (avatars.MAX_NAME + 1)))
+
+    for name, response in responses.items():
+        assert response.status_code == 200, name
+        assert response.headers["content-type"] == "image/svg+xml"
+        assert response.content == avatars.render(name)
+    assert len({r.content for r in responses.values()}) == len(names)
+    assert b"<script>" not in responses["<script>"].content  # only a hash of the name is drawn
+    assert too_long.status_code == 404
@@ -0,0 +1,27 @@
+import pytest
+
+from conftest import auth, make_post, make_users, running_app
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_cached_comment_list_sees_comments_from_every_route():
+    (user_id,) = make_users(1)
+    post_id = make_post(user_id)
+    headers = auth(user_id)
+    url = f"/api/comments/post/{post_id}"
+
+    async with running_app() as client:
+        async def texts():
+            response = await client.get(url, headers=headers)
+            assert response.status_code == 200
+            return [c["text"] for c in response.json()["items"]]
+
+        assert await texts() == []
+        # the server-rendered pages' form post
+        await client.post(f"/actions/comment/{post_id}", data={"text": "from the page"}, headers=headers)
+        assert await texts() == ["from the page"]
+        created = await client.post(url, json={"text": "from the api"}, headers=headers)
+        assert sorted(await texts()) == ["from the api", "from the page"]
+        await client.delete(f"/api/comments/{created.json()['id']}", headers=headers)
+        assert await texts() == ["from the page"]
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from app import events
+from app.db import SessionLocal
+from app.graph import graph
+from app.models import User
+from conftest import auth, make_follow, make_users, running_app
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeRedis:
+    """Just enough of redis.asyncio.Redis for RedisBus: one channel, in memory."""
+
+    def __init__(self):
+        self.messages: asyncio.Queue = asyncio.Queue()
+
+    async def publish(self, _channel: str, data: str) -> None:
+        await self.messages.put(data)
+
+    def pubsub(self):
+        return self
+
+    async def subscribe(self, _channel: str) -> None:
+        pass
+
+    async def listen(self):
+        while True:
+            yield {"type": "message", "data": await self.messages.get()}
+
+    async def aclose(self) -> None:
+        pass
+
+
+class FakeRedisBus(events.RedisBus):
+    def __init__(self):
+        events.LocalBus.__init__(self, max_pending=100)
+        self.client = FakeRedis()
+        self._listener = None
+
+
+async def _eventually(check, timeout: float = 5) -> None:
+    async def poll():
+        while not check():
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+async def test_follows_reach_the_graph_without_any_socket(monkeypatch):
+    a, b, c = make_users(3)
+    make_follow(b, c)
+    with SessionLocal() as db:
+        b_name = db.scalar(select(User.username).where(User.id == b))
+    bus = FakeRedisBus()
+    bus.listeners = list(events.bus.listeners)  # graph.on_event, registered at import
+    monkeypatch.setattr(events, "bus", bus)
+    graph.ensure_loaded()
+
+    async with running_app() as client:
+        assert bus.stats()["connections"] == 0
+        assert (await client.post(f"/api/users/{b_name}/follow", headers=auth(a))).status_code == 204
+        await _eventually(lambda: graph.suggestions(a, 10) == [(c, 1)])
+        assert (await client.post(f"/api/users/{b_name}/unfollow", headers=auth(a))).status_code == 204
+        await _eventually(lambda: graph.suggestions(a, 10) == [])
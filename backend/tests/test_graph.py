@@ -0,0 +1,46 @@
+import threading
+import time
+
+from app import graph
+from app.db import SessionLocal
+from conftest import make_follow, make_users
+
+
+def test_failed_load_is_retried_by_the_threads_waiting_on_it(monkeypatch):
+    a, b, c = make_users(3)
+    make_follow(a, b)
+    make_follow(b, c)
+    follow_graph = graph.FollowGraph()
+    loading, fail = threading.Event(), threading.Event()
+    sessions = []
+
+    def flaky_session():
+        sessions.append(None)
+        if len(sessions) == 1:
+            loading.set()
+            fail.wait(5)
+            raise RuntimeError("database went away")
+        return SessionLocal()
+
+    monkeypatch.setattr(graph, "SessionLocal", flaky_session)
+    errors, results = [], []
+
+    def first_load():
+        try:
+            follow_graph.ensure_loaded()
+        except RuntimeError as exc:
+            errors.append(exc)
+
+    loader = threading.Thread(target=first_load)
+    loader.start()
+    loading.wait(5)
+    waiter = threading.Thread(target=lambda: results.append(follow_graph.suggestions(a, 10)))
+    waiter.start()
+    time.sleep(0.1)  # let it block on the running load
+    fail.set()
+    loader.join(5)
+    waiter.join(5)
+
+    assert len(errors) == 1
+    assert results == [[(c, 1)]]
+    assert len(sessions) == 2
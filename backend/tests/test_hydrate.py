@@ -0,0 +1,42 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event, insert, select
+
+from app.db import SessionLocal, engine
+from app.hydrate import posts_to_public
+from app.models import Like, Post
+from conftest import make_post, make_users
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def before(_conn, _cursor, statement, *_):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before)
+
+
+def test_posts_to_public_query_count_does_not_grow_with_page_size():
+    viewer, *authors = make_users(51)
+    post_ids = [make_post(author) for author in authors]
+    with SessionLocal() as db:
+        db.execute(insert(Like), [{"user_id": viewer, "post_id": post_id} for post_id in post_ids[::2]])
+        db.commit()
+
+    counts = {}
+    for size in (1, 10, 50):
+        with SessionLocal() as db:
+            posts = list(db.scalars(select(Post).where(Post.id.in_(post_ids[:size]))))
+            with count_statements() as statements:
+                items = posts_to_public(db, posts, viewer)
+        assert len(items) == size
+        assert [p.liked_by_me for p in items] == [p.id in post_ids[::2] for p in posts]
+        counts[size] = len(statements)
+
+    assert counts[1] == counts[10] == counts[50]
@@ -0,0 +1,86 @@
+import io
+
+import pytest
+from PIL import Image
+
+from app import images, interactions, storage
+from app.db import SessionLocal
+from app.models import Post
+from conftest import auth, make_users, running_app
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def upload_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage.storage, "root", str(tmp_path / "uploads"))
+    monkeypatch.setattr(storage.storage, "tmp_root", str(tmp_path / "tmp"))
+    monkeypatch.setattr(images, "_get_pool", lambda: None)  # render on a thread instead
+    return tmp_path
+
+
+def _png() -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (32, 24), "teal").save(out, "PNG")
+    return out.getvalue()
+
+
+async def _create_post(client, user_id: int) -> tuple[int, str]:
+    response = await client.post(
+        "/api/posts", data={"caption": "render"}, files={"image": ("a.png", _png(), "image/png")}, headers=auth(user_id)
+    )
+    assert response.status_code == 201, response.text
+    with SessionLocal() as db:
+        post = db.get(Post, response.json()["id"])
+        return post.id, post.image_path
+
+
+def _delete(post_id: int) -> None:
+    with SessionLocal() as db:
+        orphan = interactions.delete_post(db, db.get(Post, post_id))
+        db.commit()
+        interactions.purge_blob(db, orphan)
+        db.commit()
+
+
+async def test_variants_written_after_the_post_was_deleted_are_removed(upload_root, monkeypatch):
+    (user_id,) = make_users(1)
+
+    def render_racing_delete(image_path):
+        # the delete (and its file cleanup) lands while the worker is still encoding
+        _delete(post_id)
+        for name in images.VARIANTS:
+            images._save_webp(Image.new("RGB", (4, 4)), images.variant_name(image_path, name))
+        return 4, 4, "thumb:4,feed:4,full:4"
+
+    monkeypatch.setattr(images, "render", render_racing_delete)
+    async with running_app() as client:
+        post_id, image_path = await _create_post(client, user_id)
+        assert list(upload_root.rglob("*.png"))
+        await images.process(post_id, image_path)
+
+    assert [p for p in upload_root.rglob("*") if p.is_file()] == []
+
+
+async def test_posts_deleted_before_processing_are_not_rendered(upload_root, monkeypatch):
+    (user_id,) = make_users(1)
+    rendered = []
+    monkeypatch.setattr(images, "render", rendered.append)
+    async with running_app() as client:
+        post_id, image_path = await _create_post(client, user_id)
+        _delete(post_id)
+        await images.process(post_id, image_path)
+
+    assert rendered == []
+    assert [p for p in upload_root.rglob("*") if p.is_file()] == []
+
+
+async def test_variants_are_recorded_for_a_live_post(upload_root):
+    (user_id,) = make_users(1)
+    async with running_app() as client:
+        post_id, image_path = await _create_post(client, user_id)
+        await images.process(post_id, image_path)
+
+    with SessionLocal() as db:
+        assert db.get(Post, post_id).image_variants == "thumb:32,feed:32,full:32"
+    assert len(list(upload_root.rglob("*.webp"))) == len(images.VARIANTS)
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+
+from app.config import settings
+from app.db import SessionLocal
+from app.models import Like, Post
+from conftest import auth, make_post, make_users, running_app
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_parallel_likes_with_double_clicks(monkeypatch):
+    # a thousand writers at once is the burst the SQLite write queue is for; without it
+    # some of them wait out busy_timeout and fail with "database is locked"
+    monkeypatch.setattr(settings, "sqlite_write_queue", True)
+    users = make_users(1000)
+    post_id = make_post(users[0])
+    # every fourth user double-clicks: two requests at the same moment
+    clicks = [user_id for user_id in users for _ in range(2 if user_id % 4 == 0 else 1)]
+
+    async with running_app() as client:
+        responses = await asyncio.gather(*(
+            client.post(f"/api/likes/post/{post_id}", headers=auth(user_id)) for user_id in clicks
+        ))
+
+    assert len(responses) > len(users)
+    assert {r.status_code for r in responses} == {204}
+    with SessionLocal() as db:
+        rows = db.scalar(select(func.count()).select_from(Like).where(Like.post_id == post_id))
+        likers = db.scalar(select(func.count(func.distinct(Like.user_id))).where(Like.post_id == post_id))
+        stored = db.scalar(select(Post.likes_count).where(Post.id == post_id))
+    assert rows == likers == len(users)
+    assert stored == rows
+
+
+async def test_repeated_like_and_unlike_keep_counter_in_step():
+    users = make_users(50)
+    post_id = make_post(users[0])
+
+    async with running_app() as client:
+        for path in ("", "", "/unlike", "/unlike", ""):
+            responses = await asyncio.gather(*(
+                client.post(f"/api/likes/post/{post_id}{path}", headers=auth(user_id)) for user_id in users
+            ))
+            assert all(r.status_code < 500 for r in responses)
+
+    with SessionLocal() as db:
+        rows = db.scalar(select(func.count()).select_from(Like).where(Like.post_id == post_id))
+        stored = db.scalar(select(Post.likes_count).where(Post.id == post_id))
+    assert rows == stored == len(users)
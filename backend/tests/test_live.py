@@ -0,0 +1,123 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import insert
+
+from app import events
+from app.auth import create_access_token
+from app.db import SessionLocal
+from app.main import app
+from app.models import Follow
+from conftest import auth, make_users, running_app
+
+pytestmark = pytest.mark.anyio
+
+CONNECTIONS = 2000
+
+
+class FakeSocket:
+    """One simulated WebSocket client, driving the ASGI app directly."""
+
+    def __init__(self, cookie: str | None = None, query: str = ""):
+        headers = [(b"cookie", f"access_token={cookie}".encode())] if cookie else []
+        self.scope = {
+            "type": "websocket", "path": "/ws/feed", "raw_path": b"/ws/feed", "root_path": "",
+            "query_string": query.encode(), "headers": headers, "scheme": "ws",
+            "server": ("test", 80), "client": ("127.0.0.1", 1234), "subprotocols": [],
+        }
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.incoming.put_nowait({"type": "websocket.connect"})
+        self.accepted = asyncio.Event()
+        self.closed = asyncio.Event()
+        self.close_code = None
+        self.received: list[dict] = []
+        self.got_events = asyncio.Event()
+        self.task = None
+
+    def start(self) -> "FakeSocket":
+        self.task = asyncio.create_task(app(self.scope, self.incoming.get, self._send))
+        return self
+
+    async def _send(self, message: dict) -> None:
+        if message["type"] == "websocket.accept":
+            self.accepted.set()
+        elif message["type"] == "websocket.close":
+            self.close_code = message.get("code")
+            self.closed.set()
+        elif message["type"] == "websocket.send":
+            self.received.extend(json.loads(message["text"]))
+            self.got_events.set()
+
+    def send_json(self, data) -> None:
+        self.incoming.put_nowait({"type": "websocket.receive", "text": json.dumps(data)})
+
+    async def disconnect(self) -> None:
+        self.incoming.put_nowait({"type": "websocket.disconnect", "code": 1000})
+        await self.task
+
+    def types(self) -> list[str]:
+        return [event["type"] for event in self.received]
+
+
+async def _wait(awaitables, timeout: float = 30):
+    await asyncio.wait_for(asyncio.gather(*awaitables), timeout)
+
+
+async def test_thousands_of_connections_get_a_post_and_its_likes():
+    author, outsider, *followers = make_users(CONNECTIONS + 2)
+    with SessionLocal() as db:
+        db.execute(insert(Follow), [{"follower_id": f, "following_id": author} for f in followers])
+        db.commit()
+
+    async with running_app() as client:
+        sockets = [FakeSocket(cookie=create_access_token(str(f))).start() for f in followers]
+        other = FakeSocket(cookie=create_access_token(str(outsider))).start()
+        await _wait([s.accepted.wait() for s in sockets + [other]])
+        assert events.bus.stats()["connections"] == CONNECTIONS + 1
+
+        response = await client.post("/api/posts", data={"caption": "live"}, headers=auth(author))
+        assert response.status_code == 201, response.text
+        post_id = response.json()["id"]
+        await _wait([s.got_events.wait() for s in sockets])
+        assert all(s.received == [{"type": "post", "post_id": post_id, "author_id": author}] for s in sockets)
+
+        for s in sockets:
+            s.received.clear()
+            s.got_events.clear()
+        likes = await asyncio.gather(*(
+            client.post(f"/api/likes/post/{post_id}", headers=auth(f)) for f in followers[:20]
+        ))
+        assert {r.status_code for r in likes} == {204}
+        await _wait([s.got_events.wait() for s in sockets])
+        await asyncio.sleep(0.1)  # let any trailing batches arrive
+        # a burst of likes coalesces; the last count each client sees is the final one
+        for s in sockets:
+            assert set(s.types()) == {"counts"}
+            assert s.received[-1]["likes_count"] == 20
+
+        assert other.received == []
+        await asyncio.gather(*(s.disconnect() for s in sockets + [other]))
+    assert events.bus.stats()["connections"] == 0
+
+
+async def test_token_in_first_message_authenticates():
+    (user_id,) = make_users(1)
+    async with running_app():
+        socket = FakeSocket().start()
+        await socket.accepted.wait()
+        socket.send_json({"type": "auth", "token": create_access_token(str(user_id))})
+        await asyncio.sleep(0.1)
+        assert not socket.closed.is_set()
+        assert events.bus.stats()["connections"] == 1
+        await socket.disconnect()
+
+
+async def test_token_in_query_string_is_not_accepted():
+    (user_id,) = make_users(1)
+    async with running_app():
+        socket = FakeSocket(query=f"token={create_access_token(str(user_id))}").start()
+        socket.send_json({"type": "hello"})
+        await asyncio.wait_for(socket.task, 5)
+    assert socket.close_code == 1008
+    assert events.bus.stats()["connections"] == 0
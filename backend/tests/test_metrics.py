@@ -0,0 +1,65 @@
+import time
+
+import httpx
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import metrics
+from app.config import settings
+from app.db import engine
+from app.main import app
+
+pytestmark = pytest.mark.anyio
+
+# a statement that takes a measurable few milliseconds
+SLOW_STATEMENT = text(
+    "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 200000) SELECT sum(i) FROM n"
+)
+
+
+async def _get_metrics(client_host: str, headers=None) -> httpx.Response:
+    transport = httpx.ASGITransport(app=app, client=(client_host, 50000))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.get("/metrics", headers=headers)
+
+
+async def test_metrics_are_only_served_locally_by_default():
+    assert (await _get_metrics("127.0.0.1")).status_code == 200
+    assert (await _get_metrics("203.0.113.7")).status_code == 404
+
+
+async def test_metrics_token_is_required_once_set(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", "scrape-secret")
+    assert (await _get_metrics("127.0.0.1")).status_code == 404
+    assert (await _get_metrics("203.0.113.7", {"authorization": "Bearer wrong"})).status_code == 404
+    assert (await _get_metrics("203.0.113.7", {"authorization": "Bearer scrape-secret"})).status_code == 200
+
+
+async def test_proxied_requests_need_the_token(monkeypatch):
+    proxied = {"x-forwarded-for": "203.0.113.7"}
+    assert (await _get_metrics("127.0.0.1", proxied)).status_code == 404
+    monkeypatch.setattr(settings, "metrics_token", "scrape-secret")
+    proxied["authorization"] = "Bearer scrape-secret"
+    assert (await _get_metrics("127.0.0.1", proxied)).status_code == 200
+
+
+def test_statements_after_a_failed_one_are_timed_correctly():
+    stats = metrics.RequestStats()
+    token = metrics._current.set(stats)
+    try:
+        with engine.connect() as conn:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    conn.execute(text("SELECT * FROM no_such_table"))
+            time.sleep(0.2)  # a start time left over from the failures would add this
+            assert stats.sql_count == 0
+            started = time.perf_counter()
+            assert conn.execute(SLOW_STATEMENT).scalar() > 0
+            elapsed = time.perf_counter() - started
+    finally:
+        metrics._current.reset(token)
+
+    assert stats.sql_count == 1
+    assert 0 < stats.sql_seconds <= elapsed
+    assert stats.sql_seconds > elapsed / 2
@@ -0,0 +1,32 @@
+import pytest
+
+from conftest import auth, make_post, make_users, running_app
+
+pytestmark = pytest.mark.anyio
+
+
+def _keys(value) -> set[str]:
+    if isinstance(value, dict):
+        return set(value).union(*(_keys(v) for v in value.values()))
+    if isinstance(value, list):
+        return set().union(*(_keys(v) for v in value))
+    return set()
+
+
+async def test_search_results_never_contain_email():
+    viewer, author = make_users(2)
+    post_id = make_post(author, "testing search privacy")
+    headers = auth(viewer)
+
+    async with running_app() as client:
+        await client.post(f"/api/comments/post/{post_id}", json={"text": "testing comments too"}, headers=headers)
+        responses = [
+            await client.get(path, params={"q": "test"}, headers=headers)
+            for path in ("/api/search", "/api/search/users", "/api/search/posts", "/api/search/comments")
+        ]
+
+    assert [r.status_code for r in responses] == [200] * 4
+    everything = [r.json() for r in responses]
+    assert everything[0]["users"] and everything[0]["posts"] and everything[0]["comments"]
+    assert "username" in _keys(everything)
+    assert "email" not in _keys(everything)
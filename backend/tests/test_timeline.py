@@ -0,0 +1,35 @@
+from app import interactions, timeline
+from app.config import settings
+from app.db import SessionLocal
+from app.models import Post
+from conftest import make_follow, make_users
+
+
+def _publish(author_id: int, caption: str) -> int:
+    with SessionLocal() as db:
+        post_id = interactions.publish(db, Post(author_id=author_id, caption=caption)).id
+        db.commit()
+        return post_id
+
+
+def _feed(user_id: int) -> list[int]:
+    with SessionLocal() as db:
+        posts, _ = timeline.page(db, user_id, None, 50)
+        return [p.id for p in posts]
+
+
+def test_posts_made_above_the_fanout_threshold_stay_once_back_below(monkeypatch):
+    monkeypatch.setattr(settings, "timeline_fanout_max_followers", 2)
+    author, *followers = make_users(4)
+    for follower in followers:
+        make_follow(follower, author)
+    before = _publish(author, "three followers: fanned out on read")
+    assert all(_feed(f) == [before] for f in followers)
+
+    with SessionLocal() as db:
+        interactions.unfollow(db, followers[0], author)
+        db.commit()
+    after = _publish(author, "two followers: fanned out on write")
+
+    assert _feed(followers[0]) == []
+    assert all(_feed(f) == [after, before] for f in followers[1:])
@@ -0,0 +1,139 @@
+import tracemalloc
+from pathlib import Path
+
+import pytest
+from sqlalchemy import func, select
+
+from app import interactions, storage
+from app.config import settings
+from app.db import SessionLocal
+from app.models import Blob
+from conftest import auth, make_users, running_app
+
+pytestmark = pytest.mark.anyio
+
+MB = 1024 * 1024
+BOUNDARY = "testboundary"
+PNG = b"\x89PNG\r\n\x1a\n"
+
+
+class MultipartBody:
+    """A streamed multipart form with a fake PNG of `size` bytes; counts what the app pulled."""
+
+    def __init__(self, size: int, seed: int = 0):
+        self.size = size
+        self.sent = 0
+        self.head = (
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="caption"\r\n\r\nupload test\r\n'
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="image"; filename="a.png"\r\n'
+            "Content-Type: image/png\r\n\r\n"
+        ).encode() + PNG + seed.to_bytes(8, "big")
+        self.tail = f"\r\n--{BOUNDARY}--\r\n".encode()
+        self.chunk = bytes(64 * 1024)
+
+    async def __aiter__(self):
+        yield self.head
+        remaining = self.size - len(PNG) - 8
+        while remaining > 0:
+            piece = self.chunk if remaining >= len(self.chunk) else self.chunk[:remaining]
+            self.sent += len(piece)
+            remaining -= len(piece)
+            yield piece
+        yield self.tail
+
+
+def _post(client, body, user_id, headers=()):
+    return client.post(
+        "/api/posts",
+        content=body,
+        headers={"content-type": f"multipart/form-data; boundary={BOUNDARY}", **auth(user_id), **dict(headers)},
+    )
+
+
+@pytest.fixture
+def upload_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage.storage, "root", str(tmp_path / "uploads"))
+    monkeypatch.setattr(storage.storage, "tmp_root", str(tmp_path / "tmp"))
+    return tmp_path
+
+
+async def test_upload_memory_does_not_grow_with_file_size(upload_root):
+    (user_id,) = make_users(1)
+    peaks = {}
+    async with running_app() as client:
+        for seed, size in enumerate((2 * MB, 8 * MB)):
+            body = MultipartBody(size, seed)
+            tracemalloc.start()
+            try:
+                response = await _post(client, body, user_id)
+                peaks[size] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            assert response.status_code == 201, response.text
+            assert body.sent == size - len(PNG) - 8
+
+    assert sorted(p.stat().st_size for p in upload_root.rglob("*.png")) == [2 * MB, 8 * MB]
+    # the body is spooled to disk and copied in chunks: four times the data, about the same peak
+    assert peaks[8 * MB] < 4 * MB
+    assert peaks[8 * MB] < peaks[2 * MB] + MB
+
+
+async def test_oversized_body_is_cut_off_while_streaming(upload_root, monkeypatch):
+    monkeypatch.setattr(settings, "max_upload_bytes", MB)
+    (user_id,) = make_users(1)
+    body = MultipartBody(50 * MB)
+    async with running_app() as client:
+        response = await _post(client, body, user_id)
+    assert response.status_code == 413
+    assert body.sent < 2 * MB
+    assert not list(upload_root.rglob("*.png"))
+
+
+async def test_declared_oversized_body_is_refused_before_reading(upload_root, monkeypatch):
+    monkeypatch.setattr(settings, "max_upload_bytes", MB)
+    (user_id,) = make_users(1)
+    body = MultipartBody(50 * MB)
+    async with running_app() as client:
+        response = await _post(client, body, user_id, {"content-length": str(50 * MB)})
+    assert response.status_code == 413
+    assert body.sent == 0
+
+
+async def test_failed_post_leaves_no_stored_file(upload_root, monkeypatch):
+    (user_id,) = make_users(1)
+    publish = interactions.publish
+
+    def failing_publish(db, post):
+        publish(db, post)
+        raise RuntimeError("insert failed")
+
+    monkeypatch.setattr(interactions, "publish", failing_publish)
+    with SessionLocal() as db:
+        blobs = db.scalar(select(func.count()).select_from(Blob))
+    async with running_app() as client:
+        response = await _post(client, MultipartBody(64 * 1024, seed=99), user_id)
+
+    assert response.status_code == 500
+    assert not [p for p in upload_root.rglob("*") if p.is_file()]
+    with SessionLocal() as db:
+        assert db.scalar(select(func.count()).select_from(Blob)) == blobs
+
+
+async def test_partial_files_are_written_outside_the_served_directory(upload_root, monkeypatch):
+    (user_id,) = make_users(1)
+    seen = []
+    save = storage.storage.save
+
+    def save_and_look(key, src_path):
+        seen.append(src_path)
+        save(key, src_path)
+
+    monkeypatch.setattr(storage.storage, "save", save_and_look)
+    async with running_app() as client:
+        response = await _post(client, MultipartBody(64 * 1024, seed=7), user_id)
+
+    assert response.status_code == 201, response.text
+    assert seen and all(Path(p).parent == upload_root / "tmp" for p in seen)
+    assert [p.parent.parent.parent for p in upload_root.rglob("*.png")] == [upload_root / "uploads"]
+    assert not list((upload_root / "tmp").iterdir())
+    assert Path(storage.LOCAL_TMP).parent == Path(storage.LOCAL_ROOT).parent.parent  # beside static/
@@ -0,0 +1,30 @@
+import pytest
+
+from conftest import auth, make_users, running_app
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_user_lookup_needs_a_login_and_leaves_out_emails():
+    viewer, other = make_users(2)
+    params = {"ids": [other, viewer]}
+    async with running_app() as client:
+        anonymous = await client.get("/api/users", params=params)
+        signed_in = await client.get("/api/users", params=params, headers=auth(viewer))
+
+    assert anonymous.status_code == 401
+    assert signed_in.status_code == 200
+    assert [u["id"] for u in signed_in.json()] == [other, viewer]
+    assert all("email" not in u for u in signed_in.json())
+
+
+async def test_profiles_are_cached_publicly_without_emails():
+    (user_id,) = make_users(1)
+    async with running_app() as client:
+        lookup = await client.get("/api/users", params={"ids": [user_id]}, headers=auth(user_id))
+        response = await client.get(f"/api/users/{lookup.json()[0]['username']}")
+
+    assert response.status_code == 200
+    assert response.json()["id"] == user_id
+    assert "email" not in response.json()
+    assert response.headers["cache-control"].startswith("public")
@@ -30,8 +30,17 @@ export async function me() {
   return data;
 }
 
-export async function feed() {
-  const { data } = await api.get("/api/posts/feed/me");
+// returns { items, next_cursor }; pass next_cursor back to load the next page
+// mode: "latest" (default) or "ranked"
+export async function feed(cursor, mode) {
+  const params = {};
+  if (cursor) params.cursor = cursor;
+  if (mode) params.mode = mode;
+  const { data } = await api.get("/api/posts/feed/me", { params });
+  return data;
+}
+export async function explore(cursor) {
+  const { data } = await api.get("/api/posts/explore", { params: cursor ? { cursor } : {} });
   return data;
 }
 
@@ -55,5 +64,79 @@ export async function userProfile(username) {
   return data;
 }
 export function avatarUrl(username) {
-  return `https://api.dicebear.com/8.x/thumbs/svg?seed=${encodeURIComponent(username)}`;
+  return `/avatars/${encodeURIComponent(username)}.svg`;
+}
+
+// live feed events (see backend/app/events.py); calls onEvents with each batch, reconnects on drop.
+// Returns a function that closes the socket.
+export function subscribeFeed(onEvents) {
+  let socket;
+  let closed = false;
+  let retry = 1000;
+  const connect = () => {
+    const scheme = window.location.protocol === "https:" ? "wss://" : "ws://";
+    socket = new WebSocket(`${scheme}${window.location.host}/ws/feed`);
+    socket.onopen = () => {
+      retry = 1000;
+      // first message authenticates; tokens stay out of the URL (and access logs)
+      const token = localStorage.getItem("token");
+      if (token) socket.send(JSON.stringify({ type: "auth", token }));
+    };
+    socket.onmessage = (msg) => onEvents(JSON.parse(msg.data));
+    socket.onclose = () => {
+      if (closed) return;
+      setTimeout(connect, retry);
+      retry = Math.min(retry * 2, 30000);
+    };
+  };
+  connect();
+  return () => {
+    closed = true;
+    socket.close();
+  };
+}
+
+// batch calls (at most 100 ids/names each); like/unlike/follow return { changed: [...ids] }
+export async function likeMany(postIds) {
+  const { data } = await api.post("/api/likes/batch", { post_ids: postIds });
+  return data;
+}
+export async function unlikeMany(postIds) {
+  const { data } = await api.post("/api/likes/batch/unlike", { post_ids: postIds });
+  return data;
+}
+export async function followMany(usernames) {
+  const { data } = await api.post("/api/users/follow", { usernames });
+  return data;
+}
+export async function postsByIds(ids) {
+  const { data } = await api.get("/api/posts/batch", { params: { ids }, paramsSerializer: { indexes: null } });
+  return data;
+}
+export async function usersByIds(ids) {
+  const { data } = await api.get("/api/users", { params: { ids }, paramsSerializer: { indexes: null } });
+  return data;
+}
+
+// full-text search; searchAll returns { posts, comments, users } (top 5 of each)
+export async function searchAll(q) {
+  const { data } = await api.get("/api/search", { params: { q } });
+  return data;
+}
+export async function searchPosts(q, cursor) {
+  const { data } = await api.get("/api/search/posts", { params: cursor ? { q, cursor } : { q } });
+  return data;
+}
+export async function suggestUsers(q) {
+  const { data } = await api.get("/api/search/users", { params: { q } });
+  return data;
+}
+
+export async function followSuggestions(username) {
+  const { data } = await api.get(`/api/users/${username}/suggestions`);
+  return data;
+}
+export async function mutuals(username) {
+  const { data } = await api.get(`/api/users/${username}/mutuals`);
+  return data;
 }